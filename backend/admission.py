@@ -0,0 +1,302 @@
+# admission.py
+"""
+Priority admission control in front of the AI log analysis.
+
+During a cascading failure thousands of near-identical ERROR lines arrive at
+once. Instead of analysing them first-come-first-served, every log is:
+- reduced to a message template (numbers, ids, hashes... masked),
+- scored: severity weight x service criticality x template novelty,
+- queued directly if its template is still rare in the current window, or
+  otherwise put in a small per-service reservoir sample (stratified sampling),
+- shed (lowest priority first) when the queue is full or under quota pressure.
+
+`drain()` then hands out the highest priority logs within the model budget for
+the current window (AI_ANALYSIS_BUDGET analyses per AI_ANALYSIS_WINDOW_SECONDS).
+What doesn't fit waits for the next windows and is only given up (stored
+without analysis) once older than AI_ANALYSIS_MAX_AGE_SECONDS.
+
+Every controller exports its queue, budget and outcome counters as
+`smartguard_admission_*` metrics labelled by source: the ingest monitor's on
+its metrics port, the API's (used by /smartguard-analyze) on /internal/metrics.
+"""
+
+import heapq
+import itertools
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+import weakref
+from dotenv import load_dotenv
+from gemini_usage import gemini_limiter
+from instrumentation import Counter, Gauge, registry
+
+# Load environment
+load_dotenv()
+
+AI_ANALYSIS_BUDGET = int(os.getenv("AI_ANALYSIS_BUDGET", "20"))
+AI_ANALYSIS_WINDOW_SECONDS = float(os.getenv("AI_ANALYSIS_WINDOW_SECONDS", "60"))
+AI_ANALYSIS_QUEUE_LIMIT = int(os.getenv("AI_ANALYSIS_QUEUE_LIMIT", "500"))
+AI_ANALYSIS_MAX_AGE_SECONDS = float(os.getenv("AI_ANALYSIS_MAX_AGE_SECONDS", "600"))
+# A template seen more often than this within a window is sampled instead of queued
+SAMPLE_AFTER_REPEATS = int(os.getenv("AI_SAMPLE_AFTER_REPEATS", "3"))
+RESERVOIR_SIZE = int(os.getenv("AI_RESERVOIR_SIZE", "5"))
+TEMPLATE_MEMORY = 10000
+# Queue fill ratio above which only ERROR-and-worse logs are admitted
+PRESSURE_THRESHOLD = 0.8
+
+ADMISSION_LOGS = Counter("smartguard_admission_logs_total",
+                         "Logs by admission outcome: submitted, queued, sampled, shed, admitted", ["source", "outcome"])
+ADMISSION_QUEUE_LENGTH = Gauge("smartguard_admission_queue_length", "Logs waiting for AI analysis", ["source"])
+ADMISSION_REMAINING_BUDGET = Gauge("smartguard_admission_remaining_budget",
+                                   "AI analyses still allowed in the current window", ["source"])
+_CONTROLLERS = weakref.WeakSet()
+
+SEVERITY_WEIGHTS = {
+    "EMERGENCY": 6.0, "ALERT": 5.0, "CRITICAL": 5.0, "ERROR": 3.0,
+    "WARNING": 1.5, "NOTICE": 0.8, "INFO": 0.5, "DEBUG": 0.2, "DEFAULT": 0.5,
+}
+
+# How much each Online Boutique service matters to users (override with SERVICE_CRITICALITY='{"svc": 2.0}')
+SERVICE_CRITICALITY = {
+    "checkoutservice": 3.0, "paymentservice": 3.0, "frontend": 2.5, "cartservice": 2.0,
+    "currencyservice": 1.5, "shippingservice": 1.5, "productcatalogservice": 1.5,
+    "emailservice": 1.0, "recommendationservice": 1.0, "adservice": 0.5, "loadgenerator": 0.2,
+}
+SERVICE_CRITICALITY.update(json.loads(os.getenv("SERVICE_CRITICALITY", "{}")))
+
+_TEMPLATE_PATTERNS = [
+    (re.compile(r"^\[[^\]]*\]\s*"), ""),                                   # leading [timestamp]
+    (re.compile(r"\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b", re.I), "<uuid>"),
+    (re.compile(r"\b\d{4}-\d{2}-\d{2}[T ][\d:.]+Z?\b"), "<ts>"),
+    (re.compile(r"\b(?:\d{1,3}\.){3}\d{1,3}(?::\d+)?\b"), "<ip>"),
+    (re.compile(r"\b0x[0-9a-f]+\b|\b[0-9a-f]{16,}\b", re.I), "<hex>"),
+    (re.compile(r"'[^']*'|\"[^\"]*\""), "<str>"),
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "<num>"),
+]
+
+
+def log_template(text: str) -> str:
+    """Mask the variable parts of a log line so repeats of the same message collapse"""
+    template = (text or "")[:500]
+    for pattern, replacement in _TEMPLATE_PATTERNS:
+        template = pattern.sub(replacement, template)
+    return " ".join(template.split())[:200]
+
+
+def severity_weight(severity) -> float:
+    return SEVERITY_WEIGHTS.get(str(severity).upper(), SEVERITY_WEIGHTS["DEFAULT"])
+
+
+class AdmissionController:
+    """Prioritised, sampled and budgeted queue of logs waiting for AI analysis"""
+
+    def __init__(self, budget: int = AI_ANALYSIS_BUDGET, window_seconds: float = AI_ANALYSIS_WINDOW_SECONDS,
+                 queue_limit: int = AI_ANALYSIS_QUEUE_LIMIT, name: str = "default"):
+        self.name = name  # metrics label: the log source, "default" for the shared controller
+        self.budget = budget
+        self.window_seconds = window_seconds
+        self.queue_limit = queue_limit
+        self.lock = threading.Lock()
+        self.counter = itertools.count()
+        self.queue = []                 # heap of (-priority, seq, enqueued_at, log)
+        self.template_totals = {}       # (service, template) -> seen count since start (novelty)
+        self.window_start = time.monotonic()
+        self.window_counts = {}         # (service, template) -> seen count in this window
+        self.reservoirs = {}            # service -> [(priority, log)] sample of repetitive logs
+        self.reservoir_seen = {}        # service -> repetitive logs offered this window
+        self.used = 0
+        self.dropped = []               # (log, reason) not going to be analysed
+        self.stats = {"submitted": 0, "queued": 0, "sampled": 0, "shed": 0, "admitted": 0}
+        _CONTROLLERS.add(self)
+
+    def _count(self, outcome: str, amount: int = 1):
+        self.stats[outcome] += amount
+        ADMISSION_LOGS.inc(amount, source=self.name, outcome=outcome)
+
+    def score(self, log: dict, template: str) -> float:
+        """Priority = severity x service criticality x novelty of the template"""
+        service = log.get("service", "unknown")
+        seen = self.template_totals.get((service, template), 0)
+        novelty = 2.0 / (1.0 + math.log1p(seen))
+        return severity_weight(log.get("severity")) * SERVICE_CRITICALITY.get(service, 1.0) * novelty
+
+    def _roll_window(self, now: float):
+        if now - self.window_start < self.window_seconds:
+            return
+        self.window_start = now
+        self.window_counts = {}
+        self.used = 0
+        self._merge_reservoirs(now)
+        # Bound the novelty memory: forget one-offs and age the rest
+        if len(self.template_totals) > TEMPLATE_MEMORY:
+            self.template_totals = {k: v // 2 for k, v in self.template_totals.items() if v > 1}
+        # Stale work is not worth a model call any more
+        fresh = [item for item in self.queue if now - item[2] <= AI_ANALYSIS_MAX_AGE_SECONDS]
+        for item in self.queue:
+            if now - item[2] > AI_ANALYSIS_MAX_AGE_SECONDS:
+                self._drop(item[3], "expired")
+        self.queue = fresh
+        heapq.heapify(self.queue)
+
+    def _merge_reservoirs(self, now: float):
+        """Reservoir samples compete with everything else once the queue is drained"""
+        for samples in self.reservoirs.values():
+            for priority, log in samples:
+                self._push(priority, log, now)
+        self.reservoirs = {}
+        self.reservoir_seen = {}
+
+    def _push(self, priority: float, log: dict, now: float):
+        heapq.heappush(self.queue, (-priority, next(self.counter), now, log))
+        if len(self.queue) > self.queue_limit:
+            # Shed the lowest priority tail in one go (keeps the amortised cost low)
+            keep = heapq.nsmallest(int(self.queue_limit * 0.9), self.queue)
+            kept = set(id(item) for item in keep)
+            for item in self.queue:
+                if id(item) not in kept:
+                    self._drop(item[3], "shed")
+            self.queue = keep
+            heapq.heapify(self.queue)
+
+    def _drop(self, log: dict, reason: str):
+        self._count("shed" if reason != "sampled" else "sampled")
+        self.dropped.append((log, reason))
+
+    def under_pressure(self) -> bool:
+        return len(self.queue) >= self.queue_limit * PRESSURE_THRESHOLD or gemini_limiter.scale < 1.0
+
+    def submit(self, log: dict) -> str:
+        """Offer a log for analysis. Returns 'queued', 'sampled' or 'shed'."""
+        now = time.monotonic()
+        service = log.get("service", "unknown")
+        template = log_template(log.get("raw_log", ""))
+        key = (service, template)
+
+        with self.lock:
+            self._roll_window(now)
+            self._count("submitted")
+            priority = self.score(log, template)
+            self.template_totals[key] = self.template_totals.get(key, 0) + 1
+            self.window_counts[key] = self.window_counts.get(key, 0) + 1
+            log["admission"] = {"priority": round(priority, 3), "template": template}
+
+            if self.under_pressure() and severity_weight(log.get("severity")) < SEVERITY_WEIGHTS["ERROR"]:
+                self._drop(log, "shed")
+                return "shed"
+
+            if self.window_counts[key] <= SAMPLE_AFTER_REPEATS:
+                self._push(priority, log, now)
+                self._count("queued")
+                return "queued"
+
+            # Repetitive template: reservoir sampling (algorithm R) per service
+            seen = self.reservoir_seen.get(service, 0) + 1
+            self.reservoir_seen[service] = seen
+            samples = self.reservoirs.setdefault(service, [])
+            if len(samples) < RESERVOIR_SIZE:
+                samples.append((priority, log))
+            else:
+                slot = random.randrange(seen)
+                if slot < RESERVOIR_SIZE:
+                    self._drop(samples[slot][1], "sampled")
+                    samples[slot] = (priority, log)
+                else:
+                    self._drop(log, "sampled")
+            return "sampled"
+
+    def remaining_budget(self) -> int:
+        """Analyses still allowed this window, shrunk while Gemini is throttling us"""
+        budget = int(self.budget * gemini_limiter.scale)
+        return max(0, budget - self.used)
+
+    def drain(self, limit: int = None) -> list:
+        """Pop the highest priority logs that fit in the remaining model budget"""
+        with self.lock:
+            now = time.monotonic()
+            self._roll_window(now)
+            self._merge_reservoirs(now)
+            count = self.remaining_budget()
+            if limit is not None:
+                count = min(count, limit)
+            admitted = []
+            while self.queue and len(admitted) < count:
+                _, _, _, log = heapq.heappop(self.queue)
+                key = (log.get("service", "unknown"), log["admission"]["template"])
+                log["admission"]["similar_in_window"] = self.window_counts.get(key, 1)
+                admitted.append(log)
+            self.used += len(admitted)
+            self._count("admitted", len(admitted))
+            return admitted
+
+    def pop_dropped(self) -> list:
+        """Logs that were shed or sampled out, as (log, reason) pairs"""
+        with self.lock:
+            dropped, self.dropped = self.dropped, []
+            return dropped
+
+    def has_pending(self) -> bool:
+        """Logs still queued, sampled or dropped but not handed back yet"""
+        with self.lock:
+            return bool(self.queue or self.reservoirs or self.dropped)
+
+    def flush_pending(self) -> list:
+        """
+        Empty the queue and reservoirs, returning everything as (log, 'deferred') pairs
+        (shutdown, or the source moving to another replica: queued logs otherwise wait for later windows)
+        """
+        with self.lock:
+            pending = [(item[3], "deferred") for item in self.queue]
+            for samples in self.reservoirs.values():
+                pending.extend((log, "deferred") for _, log in samples)
+            self.queue = []
+            self.reservoirs = {}
+            return pending
+
+    def prioritize(self, logs: list, limit: int = 20) -> list:
+        """
+        One-shot ranking for a batch (used by /smartguard-analyze): collapse repeats of
+        the same template into one representative with a count, then keep the top `limit`.
+        """
+        groups = {}
+        with self.lock:
+            for log in logs:
+                if not isinstance(log, dict):
+                    log = {"raw_log": str(log)}
+                template = log_template(log.get("raw_log", ""))
+                key = (log.get("service", "unknown"), template)
+                if key in groups:
+                    groups[key][1] += 1
+                else:
+                    groups[key] = [self.score(log, template), 1, log]
+        ranked = sorted(groups.values(), key=lambda group: group[0], reverse=True)[:limit]
+        return [dict(log, similar_count=count) for _, count, log in ranked]
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "budget_per_window": self.budget,
+                "window_seconds": self.window_seconds,
+                "remaining_budget": self.remaining_budget(),
+                "queue_length": len(self.queue),
+                "queue_limit": self.queue_limit,
+                "under_pressure": self.under_pressure(),
+                "reservoirs": {service: len(samples) for service, samples in self.reservoirs.items()},
+                **self.stats,
+            }
+
+
+def _collect_admission():
+    for controller in list(_CONTROLLERS):
+        with controller.lock:
+            ADMISSION_QUEUE_LENGTH.set(len(controller.queue), source=controller.name)
+            ADMISSION_REMAINING_BUDGET.set(controller.remaining_budget(), source=controller.name)
+
+
+registry.add_collector(_collect_admission)
+
+# Global instance
+admission_controller = AdmissionController()
@@ -1,14 +1,38 @@
-from fastapi import FastAPI, Query, HTTPException
+from fastapi import FastAPI, Query, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from contextlib import asynccontextmanager
 import os
+import re
 import json
-import google.generativeai as genai
+import hashlib
+import asyncio
+import threading
+import time
 from datetime import datetime, timedelta
 import random
+from typing import List
 from gemini_client import GeminiClient
+from gemini_usage import usage_ledger, gemini_limiter
+from admission import admission_controller, log_template
 from smartguard_integration import smartguard_integration
+from log_store import log_store, SHARED_CACHE_PURGE_SECONDS
+from async_store import async_store
+from read_replica import read_router
+from log_fields import parse_filters
+from synthetic_logs import parse_incident, sample_logs
+from log_archive import log_archive, ARCHIVE_ENABLED, ARCHIVE_DIR
+from retention import retention_policy, RETENTION_ENABLED
+from correlation import incident_correlator, INCIDENT_CACHE_TTL_SECONDS
+from service_graph import service_graph
+from live_updates import live_feed, LIVE_BATCH_ROWS
+from ingest_leases import assignments as ingest_assignments
+from instrumentation import HTTP_IN_FLIGHT, HTTP_REQUEST_SECONDS, CONTENT_TYPE, render_metrics
+from health import (
+    dependency_monitor, check_log_store, check_database,
+    check_gemini, check_gcp_logging, check_slack
+)
 from dotenv import load_dotenv
-from functools import lru_cache
 
 
 # Load environment
@@ -22,20 +46,34 @@ DB_USER = os.getenv("DB_USER", "postgres")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "password")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
-# Initialize Gemini Client
-try:
-    if GEMINI_API_KEY and GEMINI_API_KEY != "your_gemini_api_key_here":
-        gemini = GeminiClient()
-        AI_AVAILABLE = True
-        print("✅ Gemini AI configured")
-    else:
-        gemini = None
-        AI_AVAILABLE = False
-        print("⚠️ Gemini API key not configured. AI features will be limited.")
-except Exception as e:
-    gemini = None
-    AI_AVAILABLE = False
-    print(f"⚠️ Gemini AI not available: {e}")
+# Server configuration
+API_HOST = os.getenv("API_HOST", "0.0.0.0")
+API_PORT = int(os.getenv("API_PORT", "8000"))
+API_WORKERS = int(os.getenv("API_WORKERS", "1"))
+AI_SEARCH_CACHE_TTL_SECONDS = float(os.getenv("AI_SEARCH_CACHE_TTL_SECONDS", "300"))
+
+# Gemini Client (created lazily: importing google.generativeai alone takes seconds)
+AI_AVAILABLE = bool(GEMINI_API_KEY and GEMINI_API_KEY != "your_gemini_api_key_here")
+if not AI_AVAILABLE:
+    print("⚠️ Gemini API key not configured. AI features will be limited.")
+_gemini = None
+_gemini_lock = threading.Lock()
+
+def get_gemini():
+    """Return the shared GeminiClient, creating it on first use (None if AI is unavailable)"""
+    global _gemini, AI_AVAILABLE
+    if not AI_AVAILABLE:
+        return None
+    if _gemini is None:
+        with _gemini_lock:
+            if _gemini is None:
+                try:
+                    _gemini = GeminiClient()
+                    print("✅ Gemini AI configured")
+                except Exception as e:
+                    AI_AVAILABLE = False
+                    print(f"⚠️ Gemini AI not available: {e}")
+    return _gemini
 
 # Sample data for demo (when database is not available)
 SERVICES = [
@@ -45,54 +83,110 @@ SERVICES = [
 ]
 
 def generate_sample_logs(count=100):
-    """Generate sample log data"""
-    logs = []
-    severities = ["ERROR", "WARNING", "INFO"]
-    severity_weights = [0.1, 0.2, 0.7]
-    
-    for i in range(count):
-        service = random.choice(SERVICES)
-        severity = random.choices(severities, weights=severity_weights)[0]
-        timestamp = datetime.now() - timedelta(hours=random.randint(0, 24))
-        
-        if severity == "ERROR":
-            message = f"Error in {service}: Database connection failed"
-            ai_summary = f"Critical issue in {service} affecting user experience"
-        elif severity == "WARNING":
-            message = f"Warning in {service}: High memory usage detected"
-            ai_summary = f"Performance degradation in {service} requires monitoring"
-        else:
-            message = f"Info from {service}: User request processed successfully"
-            ai_summary = f"Normal operation in {service}"
-        
-        logs.append({
-            "id": i + 1,
-            "service": service,
-            "severity": severity,
-            "raw_log": f"[{timestamp.isoformat()}] {service}: {message}",
-            "ai_summary": ai_summary,
-            "timestamp": timestamp.isoformat()
-        })
-    
-    return logs
+    """Generate sample log data (realistic mix with one recent incident for the anomaly views)"""
+    incident = parse_incident(f"{random.choice(SERVICES)}:90:30:150", datetime.now())
+    return sample_logs(count, hours=24, incidents=[incident])
 
-# Generate simple sample data for faster performance
-print("📊 Generating sample data...")
-SAMPLE_LOGS = generate_sample_logs(100)
-print(f"✅ Generated {len(SAMPLE_LOGS)} sample logs")
+# 🚀 Startup state (reported by /readyz)
+STARTUP_STATE = {"log_store": False, "smartguard_db": False, "ai_client": False}
 
-def get_sample_logs(service=None, severity=None, limit=20):
-    """Get sample logs with optional filtering"""
-    logs = SAMPLE_LOGS.copy()
-    
-    if service:
-        logs = [log for log in logs if log["service"] == service]
-    if severity:
-        logs = [log for log in logs if log["severity"] == severity]
-    
-    return logs[:limit]
+def prepare_shared_state():
+    """
+    Startup work that must happen once per deployment, not once per worker:
+    create the shared tables and (re)seed demo logs. Single attempt, no retries,
+    so it never delays binding the port; workers retry in the background.
+    Called by `python api.py` and by gunicorn's `on_starting` hook before workers start.
+    """
+    print("📊 Preparing shared log store...")
+    try:
+        log_store.bootstrap(generate_sample_logs, reset=True)
+        os.environ["SMARTGUARD_STATE_PREPARED"] = "1"
+    except Exception as e:
+        print(f"⚠️ Log store not ready yet, workers will retry in the background: {e}")
 
-app = FastAPI(title="SmartGuard API", version="1.0")
+async def initialize_in_background():
+    """Retry the log store bootstrap off the request path, then warm the Gemini client"""
+    attempt = 0
+    while not STARTUP_STATE["log_store"]:
+        attempt += 1
+        try:
+            await asyncio.to_thread(log_store.bootstrap, generate_sample_logs)
+            STARTUP_STATE["log_store"] = True
+        except Exception as e:
+            print(f"⏳ Log store not ready (attempt {attempt}): {e}")
+            await asyncio.sleep(min(2 * attempt, 30))
+
+    # Warm the Gemini client now that we are serving, so the first AI request doesn't pay for it
+    STARTUP_STATE["ai_client"] = await asyncio.to_thread(get_gemini) is not None
+    print("✅ SmartGuard API startup complete")
+
+async def connect_smartguard_db():
+    """The optional SmartGuard DB (ingest path): retried in the background, logged on the first failure only"""
+    attempt = 0
+    while not STARTUP_STATE["smartguard_db"]:
+        attempt += 1
+        STARTUP_STATE["smartguard_db"] = await asyncio.to_thread(
+            smartguard_integration.init_database, 1, attempt > 1)
+        if not STARTUP_STATE["smartguard_db"]:
+            await asyncio.sleep(min(2 * attempt, 30))
+
+async def housekeeping():
+    """Periodic cleanup of shared tables that only ever grow"""
+    while True:
+        try:
+            await asyncio.to_thread(log_store.purge_cache)
+            await asyncio.to_thread(usage_ledger.prune_table)
+        except Exception as e:
+            print(f"⚠️ Housekeeping failed: {e}")
+        await asyncio.sleep(SHARED_CACHE_PURGE_SECONDS)
+
+async def after_log_store(loop):
+    """Run a background loop that queries the log store once initialize_in_background has bootstrapped it"""
+    while not STARTUP_STATE["log_store"]:
+        await asyncio.sleep(0.5)
+    await loop()
+
+@asynccontextmanager
+async def lifespan(app):
+    # Dependency checks run in the background; /readyz only reads their cached results
+    dependency_monitor.register("log_store", check_log_store)
+    if smartguard_integration.available:
+        dependency_monitor.register("database", check_database)
+    dependency_monitor.register("gemini", lambda: check_gemini(get_gemini()))
+    dependency_monitor.register("gcp_logging", check_gcp_logging)
+    dependency_monitor.register("slack", check_slack)
+
+    tasks = [
+        asyncio.create_task(initialize_in_background()),
+        asyncio.create_task(dependency_monitor.run()),
+    ]
+    if smartguard_integration.available:
+        tasks.append(asyncio.create_task(connect_smartguard_db()))
+    if ARCHIVE_ENABLED and not ARCHIVE_DIR:
+        print("⚠️ ARCHIVE_ENABLED needs ARCHIVE_DIR on persistent storage, old logs will not be archived")
+    elif ARCHIVE_ENABLED and log_archive.available:
+        tasks.append(asyncio.create_task(after_log_store(log_archive.run)))
+    elif ARCHIVE_ENABLED:
+        print("⚠️ pyarrow not installed, old logs will not be archived")
+    if RETENTION_ENABLED:
+        tasks.append(asyncio.create_task(after_log_store(retention_policy.run)))
+    tasks.append(asyncio.create_task(after_log_store(service_graph.run)))
+    tasks.append(asyncio.create_task(after_log_store(live_feed.run)))
+    tasks.append(asyncio.create_task(after_log_store(housekeeping)))
+    if async_store.wanted:
+        tasks.append(asyncio.create_task(after_log_store(async_store.connect)))
+    if read_router.replica is not None:
+        tasks.append(asyncio.create_task(read_router.run()))
+        if read_router.async_replica.wanted:
+            tasks.append(asyncio.create_task(after_log_store(read_router.async_replica.connect)))
+    yield
+    for task in tasks:
+        task.cancel()
+    await async_store.close()
+    if read_router.async_replica is not None:
+        await read_router.async_replica.close()
+
+app = FastAPI(title="SmartGuard API", version="1.0", lifespan=lifespan)
 
 # CORS (so frontend can talk to backend)
 app.add_middleware(
@@ -103,51 +197,103 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# ⏱️ Request latency per endpoint (labelled by route template to keep cardinality bounded)
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    started = time.perf_counter()
+    HTTP_IN_FLIGHT.inc()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        HTTP_IN_FLIGHT.dec()
+        route = request.scope.get("route")
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - started,
+            method=request.method,
+            route=route.path if route else "unmatched",
+            status=status,
+        )
+
+# 🏷️ ETags: a client revalidating an unchanged JSON response gets an empty 304
+@app.middleware("http")
+async def add_etag(request: Request, call_next):
+    response = await call_next(request)
+    if (request.method != "GET" or response.status_code != 200
+            or not response.headers.get("content-type", "").startswith("application/json")):
+        return response  # streams (text/event-stream) pass through untouched
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    etag = f'"{hashlib.sha1(body).hexdigest()[:20]}"'
+    headers = {key: value for key, value in response.headers.items() if key.lower() != "content-length"}
+    headers.update({"ETag": etag, "Cache-Control": "no-cache"})  # may be stored, but revalidated before reuse
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    return Response(content=body, status_code=200, headers=headers)
+
 # 🟢 Fetch logs (with filters)
 @app.get("/logs")
-def get_logs(
-    service: str = Query(None),
-    severity: str = Query(None),
-    limit: int = Query(20),
-    use_real_logs: bool = Query(False)
+async def get_logs(
+    service: List[str] = Query(None, description="repeatable"),
+    severity: List[str] = Query(None, description="repeatable"),
+    limit: int = Query(20, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    since: datetime = Query(None),
+    q: str = Query(None, description="text in the summary or raw log"),
+    use_real_logs: bool = Query(False),
+    trace_id: str = Query(None),
+    status_min: int = Query(None, description="e.g. 500 for 5xx"),
+    status_max: int = Query(None),
+    min_latency_ms: float = Query(None),
+    label: List[str] = Query(None, description="key=value, repeatable"),
+    field: List[str] = Query(None, description="jsonPayload key=value (JSON values), repeatable")
 ):
     if use_real_logs and smartguard_integration.available:
         # Try to get real logs from SmartGuard
-        real_logs = smartguard_integration.get_real_logs()
+        real_logs = await asyncio.to_thread(smartguard_integration.get_real_logs)
         if real_logs:
             # Filter real logs
             filtered_logs = real_logs
             if service:
-                filtered_logs = [log for log in filtered_logs if log.get("service") == service]
+                filtered_logs = [log for log in filtered_logs if log.get("service") in service]
             if severity:
-                filtered_logs = [log for log in filtered_logs if log.get("severity") == severity]
-            return {"logs": filtered_logs[:limit], "source": "real"}
+                filtered_logs = [log for log in filtered_logs if log.get("severity") in severity]
+            return {"logs": filtered_logs[offset:offset + limit], "total": len(filtered_logs), "source": "real"}
     
-    # Fallback to sample logs
-    logs = get_sample_logs(service, severity, limit)
-    return {"logs": logs, "source": "sample"}
+    # Fallback to the shared log store (sample data in demo mode)
+    try:
+        labels, payload = parse_filters(label), parse_filters(field, typed=True)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    logs, total = await read_router.call(
+        "filter_logs", services=service, severities=severity, since=since, text=q, limit=limit, offset=offset,
+        trace_id=trace_id, status_min=status_min, status_max=status_max,
+        min_latency_ms=min_latency_ms, labels=labels, payload=payload,
+    )
+    return {"logs": logs, "total": total, "source": "sample" if log_store.backend == "sqlite" else "database"}
 
 # 🟢 Fetch alerts (critical logs) - Optimized for speed
+def _alerts(error_logs):
+    # Simple list comprehension for maximum speed
+    return [
+        {
+            "id": log["id"],
+            "timestamp": log["timestamp"],
+            "service": log["service"],
+            "severity": log["severity"],
+            "raw_log": log["raw_log"],
+            "ai_summary": log["ai_summary"]
+        }
+        for log in error_logs
+    ]
+
 @app.get("/alerts")
-def get_alerts(limit: int = 5):
+async def get_alerts(limit: int = 5):
     try:
-        # Pre-filter error logs for faster access
-        error_logs = [log for log in SAMPLE_LOGS if log["severity"] == "ERROR"][:limit]
-        
-        # Simple list comprehension for maximum speed
-        alerts = [
-            {
-                "id": log["id"],
-                "timestamp": log["timestamp"],
-                "service": log["service"],
-                "severity": log["severity"],
-                "raw_log": log["raw_log"],
-                "ai_summary": log["ai_summary"]
-            }
-            for log in error_logs
-        ]
-
-        return {"alerts": alerts}
+        # Filtered and limited in the store, newest first
+        error_logs = await read_router.call("get_logs", severity="ERROR", limit=limit)
+        return {"alerts": _alerts(error_logs)}
 
     except Exception as e:
         return {"error": str(e)}
@@ -158,20 +304,15 @@ def get_alerts(limit: int = 5):
 
 
 # 🟢 Metrics (count by severity)
-@lru_cache(maxsize=1)
-def _get_cached_metrics():
-    """Cached metrics calculation"""
-    severity_counts = {}
-    for log in SAMPLE_LOGS:
-        severity = log["severity"]
-        severity_counts[severity] = severity_counts.get(severity, 0) + 1
-    
+def _compute_metrics():
+    """Metrics calculation (cached in the shared store across workers)"""
+    severity_counts = read_router.store.severity_counts()
     metrics = [{"severity": k, "count": v} for k, v in severity_counts.items()]
     return {"metrics": metrics}
 
 @app.get("/metrics")
 def get_metrics():
-    return _get_cached_metrics()
+    return log_store.cached("metrics", _compute_metrics)
 
 # 🟢 Search in AI summaries
 @app.post("/ask-ai")
@@ -181,6 +322,9 @@ def ask_ai(query: dict):
         return {"error": "No question provided"}
 
     try:
+        gemini = get_gemini()
+        if not gemini:
+            return {"error": "AI features require a Gemini API key"}
         answer = gemini.summarize_log(user_input)
         return {"answer": answer}
     except Exception as e:
@@ -197,36 +341,42 @@ def ask_ai(query: dict):
 #     return {"results": results[:limit]}
 
 # 🤖 AI-Powered Natural Language Log Search
+def normalize_query(text):
+    """'  Show me ERRORS in paymentservice?? ' -> 'show me errors in paymentservice'"""
+    return re.sub(r"[\s?!.]+$", "", " ".join(str(text).lower().split()))
+
 @app.post("/ai-search")
 def ai_search_logs(query: dict):
     """Process natural language queries and return relevant logs with AI insights"""
+    natural_query = normalize_query(query.get("query", ""))
+    if not natural_query:
+        raise HTTPException(status_code=400, detail="Query is required")
+    # Idempotent: the same question (after normalization) shares one Gemini call across users
+    digest = hashlib.sha1(natural_query.encode()).hexdigest()
+    return log_store.cached(f"ai-search:{digest}", lambda: _ai_search(natural_query),
+                            ttl=AI_SEARCH_CACHE_TTL_SECONDS)
+
+def _ai_search(natural_query):
     try:
-        natural_query = query.get("query", "")
-        if not natural_query:
-            raise HTTPException(status_code=400, detail="Query is required")
-        
-        if not AI_AVAILABLE or not gemini:
+        gemini = get_gemini()
+        if not gemini:
             # Fallback to simple search
-            results = []
-            for log in SAMPLE_LOGS:
-                if (natural_query.lower() in log["ai_summary"].lower() or 
-                    natural_query.lower() in log["raw_log"].lower()):
-                    results.append(log)
+            results, total = read_router.store.filter_logs(text=natural_query, limit=20)
             
             return {
                 "ai_analysis": {
                     "interpreted_query": f"Searching for: {natural_query}",
                     "filters": {"services": [], "severity": [], "time_range": "last 24 hours"},
-                    "summary": f"Found {len(results)} matching logs"
+                    "summary": f"Found {total} matching logs"
                 },
-                "logs": results[:20],
-                "total_found": len(results)
+                "logs": results,
+                "total_found": total,
+                "log_query": {"q": natural_query}  # /logs parameters for paging through every match
             }
         
         # For faster response, use a simpler AI analysis
         try:
             # Quick AI analysis with shorter prompt
-            model = genai.GenerativeModel("gemini-2.5-flash")
             prompt = f"""
             Analyze this query: "{natural_query}"
             
@@ -244,8 +394,9 @@ def ai_search_logs(query: dict):
             }}
             """
             
-            response = model.generate_content(prompt)
-            raw_output = response.text.strip()
+            raw_output = gemini.generate(prompt, "ai_search")
+            if raw_output is None:
+                raise RuntimeError("Gemini quota reached")
             
             # Clean up JSON response
             if raw_output.startswith('json'):
@@ -266,95 +417,190 @@ def ai_search_logs(query: dict):
                 "summary": f"Searching logs for: {natural_query}"
             }
         
-        # Apply filters based on AI analysis
-        filtered_logs = SAMPLE_LOGS.copy()
-
-        if ai_analysis.get("filters", {}).get("services"):
-            services = ai_analysis["filters"]["services"]
-            filtered_logs = [log for log in filtered_logs if log["service"] in services]
-
-        if ai_analysis.get("filters", {}).get("severity"):
-            severities = ai_analysis["filters"]["severity"]
-            filtered_logs = [log for log in filtered_logs if log["severity"] in severities]
+        # Apply filters based on AI analysis (pushed down into the store)
+        filters = ai_analysis.get("filters", {})
 
         # Time range filtering (simplified)
-        time_range = ai_analysis.get("filters", {}).get("time_range", "")
+        time_range = filters.get("time_range", "") or ""
+        cutoff = None
         if "1 hour" in time_range.lower():
             cutoff = datetime.now() - timedelta(hours=1)
-            filtered_logs = [log for log in filtered_logs 
-                           if datetime.fromisoformat(log["timestamp"]) >= cutoff]
         elif "24 hours" in time_range.lower() or "1 day" in time_range.lower():
             cutoff = datetime.now() - timedelta(hours=24)
-            filtered_logs = [log for log in filtered_logs 
-                           if datetime.fromisoformat(log["timestamp"]) >= cutoff]
+
+        filtered_logs, total = read_router.store.filter_logs(
+            services=filters.get("services") or None,
+            severities=filters.get("severity") or None,
+            since=cutoff,
+            limit=20,
+        )
 
         return {
             "ai_analysis": ai_analysis,
-            "logs": filtered_logs[:20],
-            "total_found": len(filtered_logs)
+            "logs": filtered_logs,
+            "total_found": total,
+            "log_query": {
+                "service": filters.get("services") or None,
+                "severity": filters.get("severity") or None,
+                "since": cutoff.isoformat() if cutoff else None,
+            }
         }
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"AI search failed: {str(e)}")
 
 # 🕐 Incident Timeline
-@app.get("/timeline")
-def get_incident_timeline(hours: int = 24):
-    """Get timeline of incidents and events for visualization"""
+_COUNT_KEYS = {'ERROR': 'error_count', 'WARNING': 'warning_count'}
+TIMELINE_BUCKETS = {'1m': 60, '5m': 300, '1h': 3600, '1d': 86400}
+TIMELINE_MAX_BUCKETS = 5000
+TIMELINE_ARCHIVE_EVENTS = 20000  # newest archived errors/warnings considered for representative events
+TIMELINE_STORE_EVENTS = 50000    # hot-store errors/warnings considered, spread over the buckets (at least 20 each)
+_EPOCH = datetime(1970, 1, 1)
+_SEVERITY_RANK = {'ERROR': 0, 'WARNING': 1}
+
+def _bucket_start(timestamp, bucket_seconds):
+    """Start of the epoch-aligned bucket holding `timestamp`"""
+    moment = timestamp if isinstance(timestamp, datetime) else datetime.fromisoformat(str(timestamp))
+    seconds = int((moment - _EPOCH).total_seconds()) // bucket_seconds * bucket_seconds
+    return _EPOCH + timedelta(seconds=seconds)
+
+def _bucket_key(timestamp, bucket_seconds):
+    """Start ('YYYY-MM-DD HH:MM') of the epoch-aligned bucket holding `timestamp`"""
+    return _bucket_start(timestamp, bucket_seconds).strftime('%Y-%m-%d %H:%M')
+
+def _timeline_bucket(timeline, bucket_key):
+    if bucket_key not in timeline:
+        timeline[bucket_key] = {
+            'timestamp': bucket_key,
+            'events': [],
+            'event_groups': 0,
+            'error_count': 0,
+            'warning_count': 0,
+            'normal_count': 0
+        }
+    return timeline[bucket_key]
+
+def _timeline_event(log):
+    event_type = 'error' if log['severity'] == 'ERROR' else 'warning' if log['severity'] == 'WARNING' else 'normal'
+    return {
+        'timestamp': log['timestamp'],
+        'service': log['service'],
+        'severity': log['severity'],
+        'ai_summary': log['ai_summary'],
+        'event_type': event_type
+    }
+
+def _compute_timeline(hours, bucket, top):
+    bucket_seconds = TIMELINE_BUCKETS[bucket]
     timeline = {}
     cutoff_time = datetime.now() - timedelta(hours=hours)
-    
-    for log in SAMPLE_LOGS:
-        log_time = datetime.fromisoformat(log["timestamp"])
-        if log_time >= cutoff_time:
-            hour_key = log_time.strftime('%Y-%m-%d %H:00')
-            if hour_key not in timeline:
-                timeline[hour_key] = {
-                    'timestamp': hour_key,
-                    'events': [],
-                    'error_count': 0,
-                    'warning_count': 0,
-                    'normal_count': 0
-                }
-            
-            event_type = 'error' if log['severity'] == 'ERROR' else 'warning' if log['severity'] == 'WARNING' else 'normal'
-            event = {
-                'timestamp': log['timestamp'],
-                'service': log['service'],
-                'severity': log['severity'],
-                'ai_summary': log['ai_summary'],
-                'event_type': event_type
-            }
-            
-            timeline[hour_key]['events'].append(event)
-            if event_type == 'error':
-                timeline[hour_key]['error_count'] += 1
-            elif event_type == 'warning':
-                timeline[hour_key]['warning_count'] += 1
-            else:
-                timeline[hour_key]['normal_count'] += 1
-    
-    return {"timeline": list(timeline.values())}
+    # The archive caches per request range: from the start of the first bucket, so repeats hit its cache
+    archive_since = _bucket_start(cutoff_time, bucket_seconds)
+    store = read_router.store
+
+    # Counts per bucket: hot store (GROUP BY in SQL), Parquet archive, and logs removed by retention
+    # (rolled up per hour: with sub-hour buckets they land in the first bucket of their hour)
+    counts = store.bucket_severity_counts(cutoff_time, bucket_seconds)
+    counts += log_archive.bucket_severity_counts(bucket_seconds, archive_since)
+    counts += [(_bucket_key(hour_key, bucket_seconds), severity, count)
+               for hour_key, severity, count in store.rollup_hourly_severity_counts(cutoff_time)]
+    for bucket_key, severity, count in counts:
+        _timeline_bucket(timeline, bucket_key)[_COUNT_KEYS.get(severity, 'normal_count')] += count
+
+    # Representative events: errors/warnings collapsed by template, the top N groups of each bucket;
+    # a bucket with more events than its share is grouped from its errors first, then its newest
+    per_bucket = max(20, TIMELINE_STORE_EVENTS * bucket_seconds // (hours * 3600))
+    groups = {}
+    for log in (log_archive.events(archive_since, limit=TIMELINE_ARCHIVE_EVENTS)
+                + store.bucket_events(cutoff_time, bucket_seconds, per_bucket)):
+        bucket_key = _bucket_key(log['timestamp'], bucket_seconds)
+        template = log_template(log['raw_log'])
+        group = groups.setdefault((bucket_key, log['severity'], log['service'], template),
+                                  dict(_timeline_event(log), template=template, count=0))
+        group['count'] += 1
+        group['timestamp'] = max(group['timestamp'], log['timestamp'])  # latest occurrence
+    by_bucket = {}
+    for (bucket_key, _, _, _), group in groups.items():
+        by_bucket.setdefault(bucket_key, []).append(group)
+    for bucket_key, events in by_bucket.items():
+        events.sort(key=lambda event: (_SEVERITY_RANK.get(event['severity'], 2), -event['count'], event['service']))
+        entry = _timeline_bucket(timeline, bucket_key)
+        entry['events'] = events[:top]
+        entry['event_groups'] = len(events)
+
+    return {
+        "bucket": bucket,
+        "bucket_seconds": bucket_seconds,
+        "timeline": [timeline[key] for key in sorted(timeline)],
+    }
+
+def _timeline_cache(hours, bucket, top):
+    """Shared cache key and compute function of one /timeline response"""
+    return f"timeline:{hours}:{bucket}:{top}", lambda: _compute_timeline(hours, bucket, top)
+
+@app.get("/timeline")
+async def get_incident_timeline(hours: int = Query(24, ge=1, le=90 * 24), bucket: str = "1h",
+                          top: int = Query(5, ge=0, le=50)):
+    """
+    Event counts per bucket (1m/5m/1h/1d) with the `top` most significant event groups
+    (by severity, then occurrences of the same message template); /timeline/events drills into a bucket
+    """
+    if bucket not in TIMELINE_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"bucket must be one of {', '.join(TIMELINE_BUCKETS)}")
+    if hours * 3600 / TIMELINE_BUCKETS[bucket] > TIMELINE_MAX_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"More than {TIMELINE_MAX_BUCKETS} buckets, use a larger bucket")
+    return await async_store.call("cached", *_timeline_cache(hours, bucket, top))
+
+@app.get("/timeline/events")
+def get_timeline_events(start: str, bucket: str = "1h", severity: List[str] = Query(None),
+                        service: List[str] = Query(None), limit: int = Query(50, ge=1, le=500),
+                        offset: int = Query(0, ge=0)):
+    """All events of one timeline bucket (`start` as returned by /timeline), newest first, paginated"""
+    if bucket not in TIMELINE_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"bucket must be one of {', '.join(TIMELINE_BUCKETS)}")
+    try:
+        begin = datetime.fromisoformat(start)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid bucket start '{start}'")
+    end = begin + timedelta(seconds=TIMELINE_BUCKETS[bucket])
+
+    # The hot store holds the newest rows, so its matches come first and the archive continues the page
+    logs, hot_total = read_router.store.filter_logs(services=service, severities=severity, since=begin, until=end,
+                                            limit=limit, offset=offset)
+    archived, archived_total = log_archive.events(begin, end, severities=severity, services=service,
+                                                  limit=limit - len(logs), offset=max(0, offset - hot_total),
+                                                  with_total=True)
+    events = [dict(_timeline_event(log), id=log['id'], raw_log=log['raw_log'], trace_id=log.get('trace_id'))
+              for log in logs + archived]
+    return {
+        "start": begin.isoformat(),
+        "end": end.isoformat(),
+        "events": events,
+        "total": hot_total + archived_total,
+        "limit": limit,
+        "offset": offset,
+    }
 
 # 🏥 Service Health Status
-@lru_cache(maxsize=1)
-def _get_cached_service_health():
-    """Cached service health calculation"""
+def _service_status(error_rate):
+    if error_rate > 0.1:  # >10% error rate
+        return "error"
+    elif error_rate > 0.05:  # >5% error rate
+        return "warning"
+    return "healthy"
+
+def _compute_service_health():
+    """Service health calculation (cached in the shared store across workers)"""
     health_status = {}
+    stats = read_router.store.service_stats()
     
     for service in SERVICES:
-        service_logs = [log for log in SAMPLE_LOGS if log["service"] == service]
-        if service_logs:
-            error_count = len([log for log in service_logs if log["severity"] == "ERROR"])
-            total_logs = len(service_logs)
+        service_stats = stats.get(service)
+        if service_stats:
+            error_count = service_stats["errors"]
+            total_logs = service_stats["total"]
             error_rate = error_count / total_logs if total_logs > 0 else 0
-            
-            if error_rate > 0.1:  # >10% error rate
-                status = "error"
-            elif error_rate > 0.05:  # >5% error rate
-                status = "warning"
-            else:
-                status = "healthy"
+            status = _service_status(error_rate)
         else:
             status = "unknown"
             error_rate = 0
@@ -363,16 +609,28 @@ def _get_cached_service_health():
         health_status[service] = {
             "status": status,
             "error_rate": error_rate,
-            "last_seen": service_logs[0]["timestamp"] if service_logs else None,
+            "last_seen": service_stats["last_seen"] if service_stats else None,
             "total_logs": total_logs
         }
     
     return {"services": health_status}
 
 @app.get("/service-health")
-def get_service_health():
+async def get_service_health():
     """Get health status of all microservices"""
-    return _get_cached_service_health()
+    return await async_store.call("cached", "service-health", _compute_service_health)
+
+# 🕸️ Service dependency graph (edges from traces, positions precomputed)
+def _compute_service_graph():
+    graph = service_graph.graph()
+    for node in graph["nodes"]:
+        node["status"] = _service_status(node["error_rate"]) if node["total_logs"] else "unknown"
+    return graph
+
+@app.get("/service-graph")
+def get_service_graph():
+    """Observed caller -> callee edges and stable node positions (x, y in [0, 1]) for drawing"""
+    return log_store.cached("service-graph", _compute_service_graph)
 
 # 🤖 AI Assistant Chat
 @app.post("/ai-chat")
@@ -383,24 +641,24 @@ def ai_chat(message: dict):
         if not user_message:
             raise HTTPException(status_code=400, detail="Message is required")
         
-        if not AI_AVAILABLE or not gemini:
+        gemini = get_gemini()
+        if not gemini:
             return {
                 "response": "This is a demo version. AI features require a Gemini API key. Please configure GEMINI_API_KEY in your environment variables.",
                 "timestamp": datetime.now().isoformat()
             }
         
         # Get recent system data for context
-        recent_logs = SAMPLE_LOGS[:20]
+        recent_logs = read_router.store.get_logs(limit=20)
         
         # Get service health stats
+        stats = read_router.store.service_stats()
         service_stats = []
         for service in SERVICES:
-            service_logs = [log for log in SAMPLE_LOGS if log["service"] == service]
-            error_count = len([log for log in service_logs if log["severity"] == "ERROR"])
             service_stats.append({
                 "service": service,
-                "log_count": len(service_logs),
-                "error_count": error_count
+                "log_count": stats.get(service, {}).get("total", 0),
+                "error_count": stats.get(service, {}).get("errors", 0)
             })
         
         # Prepare context data
@@ -423,32 +681,30 @@ def ai_chat(message: dict):
 
 # 📊 Enhanced Metrics with Anomaly Detection
 @app.get("/metrics-enhanced")
-def get_enhanced_metrics():
+def get_enhanced_metrics(hours: int = Query(24, ge=1, le=24 * 366)):
     """Get enhanced metrics with anomaly detection"""
-    # Generate hourly metrics for the last 24 hours
-    hourly_data = []
-    for i in range(24):
-        hour = datetime.now() - timedelta(hours=i)
-        hour_key = hour.strftime('%Y-%m-%d %H:00')
-        
-        hour_logs = [log for log in SAMPLE_LOGS 
-                    if log["timestamp"].startswith(hour_key.split(' ')[0])]
-        
-        for severity in ["ERROR", "WARNING", "INFO"]:
-            count = len([log for log in hour_logs if log["severity"] == severity])
-            if count > 0:
-                hourly_data.append({
-                    "hour": hour_key,
-                    "severity": severity,
-                    "count": count
-                })
+    # Hourly metrics for the last `hours` hours (aggregated in the store, older hours in the archive)
+    cutoff = (datetime.now() - timedelta(hours=hours - 1)).replace(minute=0, second=0, microsecond=0)
+    store = read_router.store
+    hourly_counts = {}
+    for hour, severity, count in (store.hourly_severity_counts(cutoff) + log_archive.hourly_severity_counts(cutoff)
+                                  + store.rollup_hourly_severity_counts(cutoff)):
+        hourly_counts[(hour, severity)] = hourly_counts.get((hour, severity), 0) + count
+    hourly_data = [
+        {"hour": hour, "severity": severity, "count": count}
+        for (hour, severity), count in sorted(hourly_counts.items(), reverse=True)
+        if severity in ("ERROR", "WARNING", "INFO")
+    ]
     
     # Get service-specific metrics
+    counts = {}
+    for service, severity, count, *_ in (store.service_severity_counts() + log_archive.service_severity_counts()
+                                         + store.rollup_service_severity_counts()):
+        counts[(service, severity)] = counts.get((service, severity), 0) + count
     service_data = []
     for service in SERVICES:
-        service_logs = [log for log in SAMPLE_LOGS if log["service"] == service]
         for severity in ["ERROR", "WARNING", "INFO"]:
-            count = len([log for log in service_logs if log["severity"] == severity])
+            count = counts.get((service, severity), 0)
             if count > 0:
                 service_data.append({
                     "service": service,
@@ -476,6 +732,152 @@ def get_enhanced_metrics():
         "anomalies": anomalies
     }
 
+# 💓 Liveness (no I/O at all)
+@app.get("/healthz")
+def healthz():
+    """Liveness probe: the process is up and serving requests"""
+    return {"status": "ok"}
+
+# 🚦 Readiness (startup finished + cached dependency status)
+@app.get("/readyz")
+def readyz():
+    """
+    Ready once startup finished and the required dependencies (READINESS_REQUIRED)
+    passed their last background check. Never does I/O itself.
+    """
+    ready = STARTUP_STATE["log_store"] and dependency_monitor.required_ok()
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "ready": ready,
+            "startup": dict(STARTUP_STATE),
+            "dependencies": dependency_monitor.snapshot()
+        }
+    )
+
+# 💰 Gemini token usage and rate limiter state
+@app.get("/ai-usage")
+def get_ai_usage(minutes: int = Query(60, ge=1, le=7 * 24 * 60)):
+    """Token/cost usage per endpoint, service and minute, plus current limiter state"""
+    usage = usage_ledger.summary(minutes)
+    usage["limiter"] = gemini_limiter.snapshot()
+    return usage
+
+# 🚦 AI analysis admission control state
+@app.get("/ai-admission")
+def get_ai_admission():
+    """
+    Queue length, remaining model budget and sampling/shedding counters of this API's controller
+    (/smartguard-analyze); the ingest monitor exports its per-source queues as smartguard_admission_* metrics
+    """
+    return admission_controller.snapshot()
+
+# 🏠 Dashboard bootstrap: the overview and alert pages in one round trip
+def _compute_dashboard_summary(alerts, logs):
+    """Built from the shared cached aggregates (metrics, service health, hourly timeline)"""
+    metrics = get_metrics()["metrics"]
+    services = log_store.cached("service-health", _compute_service_health)["services"]
+    counts = {m["severity"]: m["count"] for m in metrics}
+    trend = log_store.cached(*_timeline_cache(24, "1h", 0))["timeline"]
+    return {
+        "metrics": metrics,
+        "totals": {
+            "errors": counts.get("ERROR", 0),
+            "warnings": counts.get("WARNING", 0),
+            "healthy_services": sum(1 for s in services.values() if s["status"] == "healthy"),
+            "total_services": len(services),
+        },
+        "services": services,
+        "alerts": _alerts(read_router.store.get_logs(severity="ERROR", limit=alerts)) if alerts else [],
+        "recent_logs": [
+            {key: log[key] for key in ("id", "timestamp", "service", "severity", "ai_summary")}
+            for log in read_router.store.get_logs(limit=logs)
+        ] if logs else [],
+        "alert_trend": [
+            {key: bucket[key] for key in ("timestamp", "error_count", "warning_count")} for bucket in trend
+        ],
+        "generated_at": datetime.now().isoformat(),
+    }
+
+@app.get("/dashboard/summary")
+def get_dashboard_summary(alerts: int = Query(20, ge=0, le=100), logs: int = Query(10, ge=0, le=100)):
+    """Counters, service health, latest alerts and logs, 24h alert trend and readiness"""
+    summary = log_store.cached(f"dashboard-summary:{alerts}:{logs}",
+                               lambda: _compute_dashboard_summary(alerts, logs))
+    summary["readiness"] = {
+        "ready": STARTUP_STATE["log_store"] and dependency_monitor.required_ok(),
+        "dependencies": dependency_monitor.snapshot(),
+    }
+    return summary
+
+# 📡 Live updates: new logs, alerts and count deltas after a cursor
+@app.get("/events/delta")
+def get_events_delta(after_id: int = Query(None, ge=0), limit: int = Query(LIVE_BATCH_ROWS, ge=1, le=5000)):
+    """Logs after the `after_id` cursor (omit it to get the current cursor); `more` means call again"""
+    return live_feed.delta(after_id, limit)
+
+@app.get("/events/stream")
+async def stream_events(request: Request, after_id: int = Query(None, ge=0)):
+    """Server-Sent Events: one `delta` message per batch of new logs, resumable with Last-Event-ID"""
+    last_event_id = request.headers.get("last-event-id", "")
+    if after_id is None and last_event_id.isdigit():
+        after_id = int(last_event_id)
+    return StreamingResponse(live_feed.stream(request, after_id), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# 🧩 Correlated incidents (trace-aware, across services)
+def _incidents(hours: int):
+    return log_store.cached(f"incidents:{hours}", lambda: incident_correlator.incidents(hours),
+                            ttl=INCIDENT_CACHE_TTL_SECONDS)
+
+@app.get("/incidents")
+def get_incidents(hours: int = Query(6, ge=1, le=7 * 24)):
+    """Failures grouped into incidents by trace and time proximity, with root-cause candidates"""
+    return _incidents(hours)
+
+@app.post("/incidents/{incident_id}/analyze")
+def analyze_incident(incident_id: str, hours: int = Query(6, ge=1, le=7 * 24)):
+    """One AI analysis for a whole incident (cached until the incident grows)"""
+    incident = next((i for i in _incidents(hours)["incidents"] if i["id"] == incident_id), None)
+    if incident is None:
+        raise HTTPException(status_code=404, detail=f"Incident {incident_id} not found in the last {hours}h")
+    gemini = get_gemini()
+    if not gemini:
+        raise HTTPException(status_code=503, detail="AI analysis not available")
+
+    candidates = incident["root_cause_candidates"]
+    analysis = log_store.cached(
+        f"incident-analysis:{incident_id}:{incident['error_count']}",
+        lambda: gemini.analyze_incident(incident_correlator.prompt(incident),
+                                        service=candidates[0]["service"] if candidates else "all"),
+        ttl=24 * 3600,
+        store_if=lambda text: not text.startswith("AI incident analysis"),  # retry deferred/failed analyses
+    )
+    return {"incident_id": incident_id, "analysis": analysis, "incident": incident}
+
+# 🧹 Retention policy dry run
+@app.get("/retention/report")
+def get_retention_report():
+    """Rows, archive partitions and payloads the retention policy would remove, with estimated bytes reclaimed"""
+    return retention_policy.plan()
+
+# 🛰️ Ingest monitor replicas and which log sources each one polls
+@app.get("/ingest/leases")
+def get_ingest_leases():
+    """Live ingest members and the owner, expiry and cursor of every log source lease"""
+    return ingest_assignments()
+
+# 🗄️ Where dashboard reads go (read replica or primary) and the replica's lag
+@app.get("/db/replication")
+def get_db_replication():
+    """Read replica, current read target, last measured replication lag and the read statement timeout"""
+    return read_router.status()
+
+# 📈 SmartGuard's own metrics (Prometheus text format, per worker process)
+@app.get("/internal/metrics", include_in_schema=False)
+def get_internal_metrics():
+    return PlainTextResponse(render_metrics(), media_type=CONTENT_TYPE)
+
 # 🛡️ SmartGuard Analysis Endpoint
 @app.post("/smartguard-analyze")
 def smartguard_analyze(logs_data: dict):
@@ -506,7 +908,13 @@ def smartguard_analyze(logs_data: dict):
 if __name__ == "__main__":
     import uvicorn
     print("🚀 Starting SmartGuard API...")
-    print("📊 Using enhanced sample data with SmartGuard integration")
+    prepare_shared_state()
+    print(f"📊 Serving logs from the {log_store.backend} log store")
     print("🤖 AI features available:", AI_AVAILABLE)
     print("🛡️ SmartGuard integration available:", smartguard_integration.available)
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    if API_WORKERS > 1:
+        # Workers re-import this module, so the app must be passed as an import string
+        print(f"👷 Starting {API_WORKERS} workers")
+        uvicorn.run("api:app", host=API_HOST, port=API_PORT, workers=API_WORKERS)
+    else:
+        uvicorn.run(app, host=API_HOST, port=API_PORT)
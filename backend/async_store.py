@@ -0,0 +1,191 @@
+# async_store.py
+"""
+Async Postgres access for the hot dashboard endpoints.
+
+A sync psycopg2 call inside a FastAPI handler holds one of the threadpool's
+workers (40 by default) for the whole query, so a burst of dashboard requests
+queues behind a few slow ones. With LOG_STORE=postgres and asyncpg installed,
+/logs, /alerts, /timeline and /service-health await their queries on an asyncpg
+pool opened in the API lifespan instead: one worker keeps hundreds of requests
+in flight while they wait on the database, bounded by ASYNC_DB_POOL_MAX
+connections per worker.
+
+Queries come from the same builders as log_store (rewritten from `%s` to `$n`
+placeholders). Their text only depends on which filters are set, so asyncpg
+prepares each one once per connection and reuses the prepared statement from
+its statement cache afterwards; the /alerts page and the shared cache lookup
+(the hit path of /timeline and /service-health) are prepared when a connection
+opens. Cache misses still compute in a worker thread.
+
+With the SQLite stand-in, ASYNC_DB_ENABLED=false or without asyncpg, `call()`
+runs the sync log_store method in a worker thread as before.
+
+Each AsyncLogStore mirrors a sync LogStore (host, statement_timeout, read-only
+session): `async_store` is the primary, read_replica.py adds one for the replica.
+"""
+
+import asyncio
+import json
+import os
+import re
+import time
+from datetime import datetime
+from dotenv import load_dotenv
+from log_store import (LogStore, log_store, SELECT_COLUMNS, SHARED_CACHE_TTL_SECONDS, READ_STATEMENT_TIMEOUT_MS,
+                       DB_NAME, DB_USER, DB_PASSWORD, DB_CONNECT_TIMEOUT, _operation)
+from payload_store import payload_store
+from instrumentation import CACHE_REQUESTS, DB_QUERY_SECONDS
+
+# Load environment
+load_dotenv()
+
+ASYNC_DB_ENABLED = os.getenv("ASYNC_DB_ENABLED", "true").lower() == "true"
+ASYNC_DB_POOL_MIN = int(os.getenv("ASYNC_DB_POOL_MIN", "2"))
+ASYNC_DB_POOL_MAX = int(os.getenv("ASYNC_DB_POOL_MAX", "20"))
+ASYNC_DB_STATEMENT_CACHE = int(os.getenv("ASYNC_DB_STATEMENT_CACHE", "256"))
+
+_PLACEHOLDER = re.compile(r"%s")
+_CACHE_LOOKUP = "SELECT value, expires_at FROM shared_cache WHERE key = %s"
+_LOGS_PAGE = f"SELECT {SELECT_COLUMNS} FROM logs{{where}} ORDER BY timestamp DESC, id DESC LIMIT %s OFFSET %s"
+
+try:
+    import asyncpg
+except ImportError:
+    asyncpg = None
+
+
+def numbered(query: str) -> str:
+    """'... %s ... %s' -> '... $1 ... $2'"""
+    counter = iter(range(1, query.count("%s") + 1))
+    return _PLACEHOLDER.sub(lambda _: f"${next(counter)}", query)
+
+
+def _bind(value):
+    # Like psycopg2 against a TIMESTAMP column: an aware datetime's offset is ignored
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.replace(tzinfo=None)
+    return value
+
+
+class AsyncLogStore:
+    """asyncpg pool and the async versions of the log_store reads the hot endpoints use"""
+
+    def __init__(self, store=log_store):
+        self.store = store  # sync LogStore with the same target and session settings, also the fallback
+        self.pool = None
+
+    @property
+    def wanted(self) -> bool:
+        return ASYNC_DB_ENABLED and self.store.backend == "postgres" and asyncpg is not None
+
+    @property
+    def available(self) -> bool:
+        return self.pool is not None
+
+    # 🔹 Pool lifecycle (API lifespan)
+    async def _prepare(self, conn):
+        """Put the hottest statements into the new connection's statement cache"""
+        await conn.fetch(numbered(_CACHE_LOOKUP), "")
+        where, params = self.store._where(severities=["ERROR"])
+        await conn.fetch(numbered(_LOGS_PAGE.format(where=where)), *params, 0, 0)
+
+    async def start(self) -> bool:
+        """Open the pool; False (and the sync store keeps serving) when Postgres isn't reachable yet"""
+        if not self.wanted or self.available:
+            return self.available
+        try:
+            self.pool = await asyncpg.create_pool(
+                host=self.store.host, port=int(self.store.port), database=DB_NAME, user=DB_USER,
+                password=DB_PASSWORD, min_size=ASYNC_DB_POOL_MIN, max_size=ASYNC_DB_POOL_MAX,
+                timeout=DB_CONNECT_TIMEOUT, statement_cache_size=ASYNC_DB_STATEMENT_CACHE,
+                server_settings=self.store.server_settings(), init=self._prepare,
+            )
+        except Exception as e:
+            print(f"⏳ Async DB pool to {self.store.host} not ready, serving reads from the sync store: {e}")
+            return False
+        print(f"✅ Async DB pool to {self.store.host} open ({ASYNC_DB_POOL_MIN}-{ASYNC_DB_POOL_MAX} connections)")
+        return True
+
+    async def connect(self):
+        """Background task started from the API lifespan: open the pool, retrying until Postgres answers"""
+        attempt = 0
+        while not await self.start():
+            attempt += 1
+            await asyncio.sleep(min(2 * attempt, 30))
+
+    async def close(self):
+        if self.pool is not None:
+            pool, self.pool = self.pool, None
+            await pool.close()
+
+    # 🔹 Queries
+    async def _fetch(self, query: str, *args):
+        """asyncpg-style fetch ($n placeholders) on a pooled connection"""
+        async with self.pool.acquire() as conn:
+            return await conn.fetch(query, *args)
+
+    async def fetchall(self, query: str, params=()):
+        with DB_QUERY_SECONDS.time(backend="asyncpg", operation=_operation(query)):
+            rows = await self._fetch(numbered(query), *[_bind(value) for value in params])
+        return [tuple(row) for row in rows]
+
+    async def execute(self, query: str, params=()):
+        with DB_QUERY_SECONDS.time(backend="asyncpg", operation=_operation(query)):
+            async with self.pool.acquire() as conn:
+                await conn.execute(numbered(query), *[_bind(value) for value in params])
+
+    async def call(self, name: str, *args, **kwargs):
+        """`name` on this store when the pool is open, else the sync store's version in a worker thread"""
+        if self.available:
+            return await getattr(self, name)(*args, **kwargs)
+        return await asyncio.to_thread(getattr(self.store, name), *args, **kwargs)
+
+    # 🔹 log_store equivalents
+    async def filter_logs(self, services=None, severities=None, since=None, text=None,
+                          limit=20, offset=0, with_total=True, **fields):
+        """log_store.filter_logs; the page and the total count run concurrently on two connections"""
+        where, params = self.store._where(services, severities, since, text, **fields)
+        page = self.fetchall(_LOGS_PAGE.format(where=where), tuple(params) + (limit, offset))
+        if with_total:
+            rows, count = await asyncio.gather(page, self.fetchall(f"SELECT COUNT(*) FROM logs{where}", tuple(params)))
+        else:
+            rows = await page
+        logs = self.store.log_dicts(rows)
+        await payload_store.resolve_async(logs, self._fetch)
+        logs = self.store.finish_logs(logs)
+        return (logs, count[0][0]) if with_total else logs
+
+    async def get_logs(self, service=None, severity=None, limit=20, offset=0):
+        return await self.filter_logs(
+            services=[service] if service else None,
+            severities=[severity] if severity else None,
+            limit=limit, offset=offset, with_total=False,
+        )
+
+    async def cached(self, key: str, compute, ttl: float = SHARED_CACHE_TTL_SECONDS, store_if=None):
+        """log_store.cached: awaited lookup, `compute` (sync) runs in a worker thread on a miss"""
+        now = time.time()
+        name = key.split(":", 1)[0]
+        rows = await self.fetchall(_CACHE_LOOKUP, (key,))
+        if rows and rows[0][1] > now:
+            CACHE_REQUESTS.inc(cache=name, result="hit")
+            return json.loads(rows[0][0])
+
+        CACHE_REQUESTS.inc(cache=name, result="miss")
+        value = await asyncio.to_thread(compute)
+        if store_if is not None and not store_if(value):
+            return value
+        await self.execute(
+            """INSERT INTO shared_cache (key, value, expires_at) VALUES (%s, %s, %s)
+               ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value, expires_at = EXCLUDED.expires_at""",
+            (key, json.dumps(value, default=str), now + ttl),
+        )
+        return value
+
+
+# Global instance: the primary, with dashboard reads capped at READ_STATEMENT_TIMEOUT_MS (own sync pool as fallback)
+primary_reads = log_store
+if log_store.backend == "postgres":
+    primary_reads = LogStore(statement_timeout_ms=READ_STATEMENT_TIMEOUT_MS)
+    os.register_at_fork(after_in_child=primary_reads._reset_after_fork)
+async_store = AsyncLogStore(primary_reads)
@@ -0,0 +1,283 @@
+# correlation.py
+"""
+Trace-aware incident correlation across services.
+
+Error and warning logs of the last hours are grouped into incidents:
+1. bursts: per service, INCIDENT_BUCKET_MINUTES buckets holding at least
+   INCIDENT_SPIKE_FACTOR x the service's mean error count (and INCIDENT_MIN_ERRORS);
+2. bursts of one service less than INCIDENT_GAP_MINUTES apart are merged, and
+   bursts of different services are merged when they are that close in time and
+   linked by a shared trace or by an edge of the call graph;
+3. the call graph is built from observed spans: a log whose parent_span_id is
+   the span of another service's log is a call caller -> callee.
+
+Each incident lists root-cause candidates ranked by trace evidence (in every
+failing trace the deepest failing span is that trace's culprit), the call graph
+(a failing service none of whose dependencies fail) and onset (who failed first),
+so one AI analysis can run per incident instead of per log line.
+"""
+
+import hashlib
+import os
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from admission import log_template
+from read_replica import read_router
+
+# Load environment
+load_dotenv()
+
+INCIDENT_BUCKET_MINUTES = int(os.getenv("INCIDENT_BUCKET_MINUTES", "5"))
+INCIDENT_GAP_MINUTES = int(os.getenv("INCIDENT_GAP_MINUTES", "10"))
+INCIDENT_SPIKE_FACTOR = float(os.getenv("INCIDENT_SPIKE_FACTOR", "3"))
+INCIDENT_MIN_ERRORS = int(os.getenv("INCIDENT_MIN_ERRORS", "3"))
+INCIDENT_CACHE_TTL_SECONDS = float(os.getenv("INCIDENT_CACHE_TTL_SECONDS", "60"))
+
+# Root-cause score weights: trace culprit votes, no failing dependency, early onset
+ROOT_CAUSE_WEIGHTS = {"traces": 0.6, "graph": 0.25, "onset": 0.15}
+
+
+def _parse_time(value) -> datetime:
+    return value if isinstance(value, datetime) else datetime.fromisoformat(str(value))
+
+
+class _UnionFind:
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, item):
+        self.parent.setdefault(item, item)
+        while self.parent[item] != item:
+            self.parent[item] = self.parent[self.parent[item]]
+            item = self.parent[item]
+        return item
+
+    def union(self, a, b):
+        self.parent[self.find(a)] = self.find(b)
+
+
+def call_edges(spans) -> dict:
+    """{(caller, callee): calls} from (trace_id, span_id, parent_span_id, service, ...) rows"""
+    span_service = {(span[0], span[1]): span[3] for span in spans if span[1]}
+    edges = {}
+    for span in spans:
+        caller = span_service.get((span[0], span[2])) if span[2] else None
+        if caller and caller != span[3]:
+            edges[(caller, span[3])] = edges.get((caller, span[3]), 0) + 1
+    return edges
+
+
+def culprits(spans) -> dict:
+    """{trace_id: service} of the deepest failing span of every trace with errors"""
+    by_trace = {}
+    for span in spans:
+        by_trace.setdefault(span[0], []).append(span)
+    result = {}
+    for trace_id, trace in by_trace.items():
+        failing = {span[1]: span for span in trace if span[4] == "ERROR" and span[1]}
+        if not failing:
+            continue
+        failing_parents = {span[2] for span in failing.values() if span[2]}
+        # Failing spans without a failing child; prefer the deepest (most ancestors)
+        parents = {span[1]: span[2] for span in trace if span[1]}
+
+        def depth(span_id):
+            level = 0
+            while parents.get(span_id) and level < 64:
+                span_id, level = parents[span_id], level + 1
+            return level
+
+        leaves = [span_id for span_id in failing if span_id not in failing_parents]
+        result[trace_id] = failing[max(leaves, key=depth)][3]
+    return result
+
+
+class IncidentCorrelator:
+    """Groups recent failures into incidents with root-cause candidates"""
+
+    def __init__(self, bucket_minutes: int = INCIDENT_BUCKET_MINUTES, gap_minutes: int = INCIDENT_GAP_MINUTES,
+                 spike_factor: float = INCIDENT_SPIKE_FACTOR, min_errors: int = INCIDENT_MIN_ERRORS):
+        self.bucket = timedelta(minutes=bucket_minutes)
+        self.gap_buckets = max(1, gap_minutes // bucket_minutes)
+        self.spike_factor = spike_factor
+        self.min_errors = min_errors
+
+    def _bucket(self, time: datetime) -> int:
+        """Absolute bucket number, so bucket boundaries (and incident ids) do not move between requests"""
+        return int(time.timestamp() // self.bucket.total_seconds())
+
+    def _hot_cells(self, errors, buckets: int) -> dict:
+        """{(service, bucket): [logs]} for buckets where a service's errors spike"""
+        cells = {}
+        for log in errors:
+            index = self._bucket(log["time"])
+            cells.setdefault((log["service"], index), []).append(log)
+        totals = {}
+        for (service, _), logs in cells.items():
+            totals[service] = totals.get(service, 0) + len(logs)
+        return {
+            cell: logs for cell, logs in cells.items()
+            if len(logs) >= max(self.min_errors, self.spike_factor * totals[cell[0]] / buckets)
+        }
+
+    def _group(self, hot: dict, edges: dict) -> list:
+        """Connected groups of hot cells (same service, shared trace or call-graph neighbours, close in time)"""
+        groups = _UnionFind()
+        cells = sorted(hot, key=lambda cell: cell[1])
+        traces = {}
+        for cell in cells:
+            groups.find(cell)
+            for log in hot[cell]:
+                if log["trace_id"]:
+                    traces.setdefault(log["trace_id"], []).append(cell)
+        for i, a in enumerate(cells):
+            for b in cells[i + 1:]:
+                if b[1] - a[1] > self.gap_buckets:
+                    break
+                if a[0] == b[0] or (a[0], b[0]) in edges or (b[0], a[0]) in edges:
+                    groups.union(a, b)
+        for linked in traces.values():
+            for cell in linked[1:]:
+                if abs(cell[1] - linked[0][1]) <= self.gap_buckets:
+                    groups.union(linked[0], cell)
+
+        components = {}
+        for cell in cells:
+            components.setdefault(groups.find(cell), []).append(cell)
+        return list(components.values())
+
+    def _root_causes(self, services: dict, spans, edges: dict) -> list:
+        votes = {}
+        for service in culprits(spans).values():
+            if service in services:
+                votes[service] = votes.get(service, 0) + 1
+        total_votes = sum(votes.values())
+        onset_order = sorted(services, key=lambda service: services[service]["first_seen"])
+
+        candidates = []
+        for service, stats in services.items():
+            failing_dependencies = sorted(callee for (caller, callee) in edges
+                                          if caller == service and callee in services)
+            vote_share = votes.get(service, 0) / total_votes if total_votes else 0.0
+            onset = 1 - onset_order.index(service) / max(len(onset_order) - 1, 1)
+            score = (ROOT_CAUSE_WEIGHTS["traces"] * vote_share
+                     + ROOT_CAUSE_WEIGHTS["graph"] * (0 if failing_dependencies else 1)
+                     + ROOT_CAUSE_WEIGHTS["onset"] * onset)
+            evidence = []
+            if votes.get(service):
+                evidence.append(f"deepest failing span in {votes[service]} of {total_votes} failing traces")
+            if failing_dependencies:
+                evidence.append(f"its dependencies {', '.join(failing_dependencies)} are failing too")
+            else:
+                evidence.append("no failing downstream dependency")
+            if onset_order[0] == service:
+                evidence.append("first service to fail")
+            candidates.append({"service": service, "score": round(score, 3), "evidence": evidence,
+                               "errors": stats["errors"]})
+        candidates.sort(key=lambda candidate: (-candidate["score"], -candidate["errors"]))
+        return candidates[:3]
+
+    def _incident(self, cells, hot, logs_by_trace, spans_by_trace, edges, now) -> dict:
+        core = [log for cell in cells for log in hot[cell]]
+        trace_ids = {log["trace_id"] for log in core if log["trace_id"]}
+        # Failures in other services that share a trace with the burst belong to it as well
+        members = {log["id"]: log for log in core}
+        for trace_id in trace_ids:
+            for log in logs_by_trace.get(trace_id, []):
+                members.setdefault(log["id"], log)
+        logs = sorted(members.values(), key=lambda log: log["time"])
+
+        services = {}
+        templates = {}
+        for log in logs:
+            stats = services.setdefault(log["service"], {"service": log["service"], "errors": 0, "warnings": 0,
+                                                         "first_seen": log["timestamp"]})
+            stats["errors" if log["severity"] == "ERROR" else "warnings"] += 1
+            if log["severity"] == "ERROR":
+                template = log_template(log["raw_log"])
+                entry = templates.setdefault((log["service"], template), {
+                    "service": log["service"], "template": template, "example": log["raw_log"], "count": 0})
+                entry["count"] += 1
+
+        start, end = logs[0]["time"], logs[-1]["time"]
+        spans = [span for trace_id in trace_ids for span in spans_by_trace.get(trace_id, [])]
+        first = min(cells, key=lambda cell: (cell[1], cell[0]))
+        errors = sum(stats["errors"] for stats in services.values())
+        latencies = sorted(log["latency_ms"] for log in logs if log["latency_ms"] is not None)
+        return {
+            # Stable while the incident grows: first bursting service and its bucket
+            "id": hashlib.sha1(f"{first[0]}|{first[1]}".encode()).hexdigest()[:12],
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "duration_minutes": round((end - start).total_seconds() / 60, 1),
+            "status": "ongoing" if now - end < self.bucket * 2 else "resolved",
+            "severity": "critical" if errors >= 50 or len(services) >= 3 else "major" if errors >= 10 else "minor",
+            "services": sorted(services.values(), key=lambda stats: stats["first_seen"]),
+            "error_count": errors,
+            "warning_count": sum(stats["warnings"] for stats in services.values()),
+            "trace_count": len(trace_ids),
+            "sample_traces": sorted(trace_ids)[:5],
+            "http_5xx": sum(1 for log in logs if (log["http_status"] or 0) >= 500),
+            "p95_latency_ms": latencies[int(0.95 * (len(latencies) - 1))] if latencies else None,
+            "top_messages": sorted(templates.values(), key=lambda entry: -entry["count"])[:5],
+            # Services that only warned (e.g. callers retrying) are symptoms, not candidates
+            "root_cause_candidates": self._root_causes(
+                {service: stats for service, stats in services.items() if stats["errors"]}, spans, edges),
+        }
+
+    def incidents(self, hours: float = 6) -> dict:
+        """Incidents of the last `hours` hours (newest first) plus the call graph observed in failing traces"""
+        now = datetime.now()
+        since = now - timedelta(hours=hours)
+        store = read_router.store
+        logs = store.span_logs(since)
+        for log in logs:
+            log["time"] = _parse_time(log["timestamp"])
+        errors = [log for log in logs if log["severity"] == "ERROR"]
+        buckets = max(1, int(timedelta(hours=hours) / self.bucket))
+        hot = self._hot_cells(errors, buckets)
+
+        logs_by_trace = {}
+        for log in logs:
+            if log["trace_id"]:
+                logs_by_trace.setdefault(log["trace_id"], []).append(log)
+        hot_traces = {log["trace_id"] for cell_logs in hot.values() for log in cell_logs if log["trace_id"]}
+        spans = store.trace_spans(hot_traces) if hot_traces else []
+        spans_by_trace = {}
+        for span in spans:
+            spans_by_trace.setdefault(span[0], []).append(span)
+        edges = call_edges(spans)
+
+        incidents = [self._incident(cells, hot, logs_by_trace, spans_by_trace, edges, now)
+                     for cells in self._group(hot, edges)]
+        incidents.sort(key=lambda incident: incident["start"], reverse=True)
+        return {
+            "window_hours": hours,
+            "generated_at": now.isoformat(),
+            "incidents": incidents,
+            "call_graph": [{"source": caller, "target": callee, "calls": calls}
+                           for (caller, callee), calls in sorted(edges.items())],
+        }
+
+    def prompt(self, incident: dict) -> str:
+        """Compact incident description for a single AI analysis"""
+        lines = [
+            f"Incident {incident['id']} ({incident['severity']}, {incident['status']}), "
+            f"{incident['start']} to {incident['end']}: {incident['error_count']} errors, "
+            f"{incident['warning_count']} warnings across {len(incident['services'])} services, "
+            f"{incident['trace_count']} traces, {incident['http_5xx']} HTTP 5xx, "
+            f"p95 latency {incident['p95_latency_ms']} ms.",
+            "Services (in order of first failure):",
+        ]
+        lines += [f"- {s['service']}: {s['errors']} errors, {s['warnings']} warnings, first at {s['first_seen']}"
+                  for s in incident["services"]]
+        lines.append("Root-cause candidates from traces and the call graph:")
+        lines += [f"- {c['service']} (score {c['score']}): {'; '.join(c['evidence'])}"
+                  for c in incident["root_cause_candidates"]]
+        lines.append("Most frequent error messages:")
+        lines += [f"- [{m['service']}] x{m['count']}: {m['example'][:300]}" for m in incident["top_messages"]]
+        return "\n".join(lines)
+
+
+# Global instance
+incident_correlator = IncidentCorrelator()
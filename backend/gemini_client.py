@@ -1,7 +1,8 @@
 # gemini_client.py
 import os
 import time
-import google.generativeai as genai
+from instrumentation import GEMINI_RETRIES
+from gemini_usage import metered_generate, PRIORITY_HIGH, PRIORITY_LOW
 
 GEMINI_MODEL = "gemini-2.5-flash"  # Updated to match api.py
 MAX_RETRIES = 3
@@ -11,10 +12,24 @@ class GeminiClient:
         api_key = os.getenv("GEMINI_API_KEY")
         if not api_key:
             raise ValueError("Missing GEMINI_API_KEY environment variable")
+        # Imported here so that importing this module stays cheap
+        import google.generativeai as genai
         genai.configure(api_key=api_key)
         self.model = genai.GenerativeModel(GEMINI_MODEL)
 
-    def summarize_log(self, log_text: str) -> str:
+    def generate(self, prompt: str, endpoint: str, service: str = "all",
+                 priority: str = PRIORITY_HIGH):
+        """
+        Run a prompt through the rate limiter and usage ledger.
+        Returns the response text, or None if the call was degraded by the quota.
+        """
+        response = metered_generate(self.model, prompt, endpoint, service, priority)
+        if response is None:
+            return None
+        return response.text.strip()
+
+    def summarize_log(self, log_text: str, service: str = "all",
+                      priority: str = PRIORITY_HIGH) -> str:
         """
         Summarize logs into plain English with retries & token safety.
         """
@@ -32,14 +47,19 @@ class GeminiClient:
 
         for attempt in range(1, MAX_RETRIES + 1):
             try:
-                response = self.model.generate_content(prompt)
-                return response.text.strip()
+                text = self.generate(prompt, "summarize_log", service, priority)
+                if text is None:
+                    return "AI summarization deferred: Gemini quota reached."
+                return text
             except Exception as e:
                 print(f"[Gemini] Attempt {attempt} failed: {e}")
-                time.sleep(2 * attempt)  # backoff
+                if attempt < MAX_RETRIES:
+                    GEMINI_RETRIES.inc(endpoint="summarize_log")
+                    time.sleep(2 * attempt)  # backoff
         return "AI summarization failed after retries."
     
-    def analyze_logs(self, logs_data: str) -> str:
+    def analyze_logs(self, logs_data: str, service: str = "all",
+                     priority: str = PRIORITY_LOW) -> str:
         """
         Analyze multiple logs and provide insights.
         """
@@ -55,12 +75,40 @@ class GeminiClient:
         """
         
         try:
-            response = self.model.generate_content(prompt)
-            return response.text.strip()
+            text = self.generate(prompt, "analyze_logs", service, priority)
+            if text is None:
+                return "AI analysis deferred: Gemini quota reached."
+            return text
         except Exception as e:
             print(f"[Gemini] Analysis failed: {e}")
             return "AI analysis failed."
     
+    def analyze_incident(self, incident_summary: str, service: str = "all",
+                         priority: str = PRIORITY_HIGH) -> str:
+        """
+        One analysis for a whole correlated incident (see correlation.py).
+        """
+        prompt = f"""
+        You are SmartGuard AI. These failures across services were correlated
+        into one incident using traces and the service call graph:
+        {incident_summary[:4000]}
+
+        Provide:
+        - Most likely root cause (confirm or challenge the candidates)
+        - How the failure propagated between services
+        - Impact and severity
+        - Recommended actions
+        """
+
+        try:
+            text = self.generate(prompt, "analyze_incident", service, priority)
+            if text is None:
+                return "AI incident analysis deferred: Gemini quota reached."
+            return text
+        except Exception as e:
+            print(f"[Gemini] Incident analysis failed: {e}")
+            return "AI incident analysis failed."
+
     def chat_response(self, user_message: str, context_data: str = "") -> str:
         """
         Generate conversational response with system context.
@@ -76,8 +124,10 @@ class GeminiClient:
         """
         
         try:
-            response = self.model.generate_content(prompt)
-            return response.text.strip()
+            text = self.generate(prompt, "chat_response")
+            if text is None:
+                return "SmartGuard AI is busy right now (Gemini quota reached). Please try again shortly."
+            return text
         except Exception as e:
             print(f"[Gemini] Chat failed: {e}")
             return "Sorry, I couldn't process your request. Please try again."
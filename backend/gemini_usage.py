@@ -0,0 +1,452 @@
+# gemini_usage.py
+"""
+Token/cost accounting and adaptive rate limiting for Gemini calls.
+
+Every Gemini request goes through `metered_generate`, which:
+- waits for (or is refused) capacity from `gemini_limiter`, a pair of token
+  buckets sized to the Gemini RPM/TPM quota,
+- records prompt/output tokens from the response usage metadata in
+  `usage_ledger`, bucketed per minute, endpoint and service and shared by all
+  API workers through the `gemini_usage` table of the log store,
+- backs the limiter off when Gemini answers with a quota (429) error.
+
+The quota is per project, so every process calling Gemini (API workers of all
+pods, ingest monitor replicas) takes an equal share of it: each one
+heartbeats into the `gemini_clients` table every GEMINI_SHARE_SYNC_SECONDS and
+divides the quota by the number of live entries (API_WORKERS until the first
+sync, or while the store is unreachable).
+
+High priority calls (interactive dashboard requests) are queued for up to
+GEMINI_MAX_QUEUE_SECONDS; low priority calls (bulk/background analysis) are
+degraded immediately instead, so they never eat into the interactive headroom.
+"""
+
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from instrumentation import DB_QUERY_SECONDS, GEMINI_REQUEST_SECONDS, GEMINI_REQUESTS, GEMINI_TOKENS
+from log_store import log_store
+
+# Load environment
+load_dotenv()
+
+GEMINI_RPM_LIMIT = int(os.getenv("GEMINI_RPM_LIMIT", "60"))
+GEMINI_TPM_LIMIT = int(os.getenv("GEMINI_TPM_LIMIT", "1000000"))
+GEMINI_MAX_QUEUE_SECONDS = float(os.getenv("GEMINI_MAX_QUEUE_SECONDS", "10"))
+# Share of each bucket that low priority calls are not allowed to use
+GEMINI_HIGH_PRIORITY_RESERVE = float(os.getenv("GEMINI_HIGH_PRIORITY_RESERVE", "0.2"))
+# USD per 1M tokens (gemini-2.5-flash list price)
+GEMINI_INPUT_COST_PER_1M = float(os.getenv("GEMINI_INPUT_COST_PER_1M", "0.30"))
+GEMINI_OUTPUT_COST_PER_1M = float(os.getenv("GEMINI_OUTPUT_COST_PER_1M", "2.50"))
+USAGE_FLUSH_SECONDS = float(os.getenv("GEMINI_USAGE_FLUSH_SECONDS", "30"))
+USAGE_MEMORY_MINUTES = 24 * 60
+# Minutes older than this are deleted from gemini_usage (/ai-usage looks back at most 7 days)
+USAGE_RETENTION_DAYS = max(7.0, float(os.getenv("GEMINI_USAGE_RETENTION_DAYS", "30")))
+# Share of the project quota before the first sync with the other processes: one per API worker
+API_WORKERS = max(1, int(os.getenv("API_WORKERS", "1")))
+GEMINI_SHARE_SYNC_SECONDS = float(os.getenv("GEMINI_SHARE_SYNC_SECONDS", "30"))
+
+PRIORITY_HIGH = "high"
+PRIORITY_LOW = "low"
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (~4 chars per token) used before the real count is known"""
+    return max(1, len(text or "") // 4)
+
+
+def is_rate_limit_error(exc: Exception) -> bool:
+    """True if Gemini rejected the call because of quota (HTTP 429 / ResourceExhausted)"""
+    return type(exc).__name__ in ("ResourceExhausted", "TooManyRequests") or "429" in str(exc)
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at `capacity` per minute"""
+
+    def __init__(self, capacity_per_minute: float):
+        self.capacity = float(capacity_per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        elapsed = now - self.updated
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.capacity / 60.0)
+        self.updated = now
+
+    def wait_time(self, amount: float, floor: float = 0.0) -> float:
+        """Seconds until `amount` can be taken while leaving `floor` tokens in the bucket"""
+        amount = min(amount, self.capacity - floor)
+        missing = amount + floor - self.tokens
+        if missing <= 0:
+            return 0.0
+        return missing * 60.0 / self.capacity
+
+    def take(self, amount: float):
+        # Allow going into debt (down to -capacity) when the real count exceeds the estimate
+        self.tokens = max(-self.capacity, self.tokens - amount)
+
+    def drain(self):
+        self.tokens = min(self.tokens, 0.0)
+
+
+class AdaptiveRateLimiter:
+    """RPM + TPM limiter with additive-increase / multiplicative-decrease on 429s"""
+
+    def __init__(self, rpm: int = GEMINI_RPM_LIMIT, tpm: int = GEMINI_TPM_LIMIT, shares: int = API_WORKERS):
+        self.quota_rpm = rpm    # whole project quota, split between `shares` processes
+        self.quota_tpm = tpm
+        self.shares = shares
+        self.base_rpm = max(1, rpm // shares)
+        self.base_tpm = max(1, tpm // shares)
+        self.scale = 1.0
+        self.requests = TokenBucket(self.base_rpm)
+        self.tokens = TokenBucket(self.base_tpm)
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.stats = {"admitted": 0, "queued": 0, "degraded": 0, "throttled": 0}
+        self.syncer = None
+        self.sync_error = None
+
+    def _apply_scale(self):
+        self.requests.capacity = max(1.0, self.base_rpm * self.scale)
+        self.tokens.capacity = max(1.0, self.base_tpm * self.scale)
+
+    # 🔹 Quota share (processes calling Gemini, coordinated through the log store)
+    def sync_share(self):
+        """Heartbeat this process in gemini_clients and take 1/N of the quota, N = live processes"""
+        now = time.time()
+        with log_store.connection() as conn:
+            cur = conn.cursor()
+            cur.execute("""CREATE TABLE IF NOT EXISTS gemini_clients (
+                               client TEXT PRIMARY KEY,
+                               heartbeat_at DOUBLE PRECISION NOT NULL
+                           )""")
+            cur.execute(log_store.sql("""INSERT INTO gemini_clients (client, heartbeat_at) VALUES (%s, %s)
+                                         ON CONFLICT (client) DO UPDATE SET heartbeat_at = EXCLUDED.heartbeat_at"""),
+                        (f"{socket.gethostname()}-{os.getpid()}", now))
+            # A process that stopped heartbeating gives its share back
+            cur.execute(log_store.sql("DELETE FROM gemini_clients WHERE heartbeat_at < %s"),
+                        (now - 3 * GEMINI_SHARE_SYNC_SECONDS,))
+            cur.execute("SELECT COUNT(*) FROM gemini_clients")
+            clients = cur.fetchone()[0]
+            cur.close()
+        with self.lock:
+            self.shares = max(1, clients)
+            self.base_rpm = max(1, self.quota_rpm // self.shares)
+            self.base_tpm = max(1, self.quota_tpm // self.shares)
+            self._apply_scale()
+
+    def _sync_loop(self):
+        while True:
+            try:
+                self.sync_share()
+                self.sync_error = None
+            except Exception as e:
+                if self.sync_error is None:
+                    print(f"⚠️ Gemini quota share not synced, keeping 1/{self.shares}: {e}")
+                self.sync_error = str(e)
+            time.sleep(GEMINI_SHARE_SYNC_SECONDS)
+
+    def _ensure_syncer(self):
+        if self.syncer is None:
+            with self.lock:
+                if self.syncer is None:
+                    self.syncer = threading.Thread(target=self._sync_loop, daemon=True)
+                    self.syncer.start()
+
+    def _wait_time(self, estimated_tokens: int, priority: str) -> float:
+        now = time.monotonic()
+        self.requests.refill(now)
+        self.tokens.refill(now)
+        reserve = GEMINI_HIGH_PRIORITY_RESERVE if priority == PRIORITY_LOW else 0.0
+        return max(
+            self.requests.wait_time(1, self.requests.capacity * reserve),
+            self.tokens.wait_time(estimated_tokens, self.tokens.capacity * reserve),
+        )
+
+    def acquire(self, estimated_tokens: int, priority: str = PRIORITY_HIGH) -> bool:
+        """Reserve capacity for one call. Returns False if the call should be degraded."""
+        self._ensure_syncer()
+        deadline = time.monotonic() + GEMINI_MAX_QUEUE_SECONDS
+        queued = False
+        try:
+            while True:
+                with self.lock:
+                    wait = self._wait_time(estimated_tokens, priority)
+                    if wait == 0:
+                        self.requests.take(1)
+                        self.tokens.take(estimated_tokens)
+                        self.stats["admitted"] += 1
+                        return True
+                    if priority == PRIORITY_LOW or time.monotonic() + wait > deadline:
+                        self.stats["degraded"] += 1
+                        return False
+                    if not queued:
+                        queued = True
+                        self.queued += 1
+                        self.stats["queued"] += 1
+                time.sleep(min(wait, 0.5))
+        finally:
+            if queued:
+                with self.lock:
+                    self.queued -= 1
+
+    def report_success(self, estimated_tokens: int, actual_tokens: int):
+        """Reconcile the token estimate and slowly restore capacity after throttling"""
+        with self.lock:
+            self.tokens.take(actual_tokens - estimated_tokens)
+            if self.scale < 1.0:
+                self.scale = min(1.0, self.scale + 0.05)
+                self._apply_scale()
+
+    def report_throttled(self):
+        """Gemini returned 429: halve the effective quota and empty the buckets"""
+        with self.lock:
+            self.stats["throttled"] += 1
+            self.scale = max(0.1, self.scale * 0.5)
+            self._apply_scale()
+            self.requests.drain()
+            self.tokens.drain()
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            now = time.monotonic()
+            self.requests.refill(now)
+            self.tokens.refill(now)
+            return {
+                "rpm_limit": self.base_rpm,
+                "tpm_limit": self.base_tpm,
+                "quota_shares": self.shares,
+                "scale": round(self.scale, 2),
+                "requests_available": round(self.requests.tokens, 1),
+                "tokens_available": round(self.tokens.tokens),
+                "queued_now": self.queued,
+                **self.stats,
+            }
+
+
+def _empty_bucket():
+    return {
+        "calls": 0, "errors": 0, "degraded": 0,
+        "prompt_tokens": 0, "output_tokens": 0, "total_tokens": 0,
+        "cost_usd": 0.0,
+    }
+
+
+def _merge(target: dict, source: dict):
+    for key, value in source.items():
+        target[key] = target.get(key, 0) + value
+
+
+class UsageLedger:
+    """Per-minute token ledger, kept in memory and flushed to the shared `gemini_usage` table"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}   # (minute, endpoint, service) -> counters not yet in the store
+        self.history = {}   # same keys, everything from the last USAGE_MEMORY_MINUTES
+        self.db_available = None
+        self.flusher = None
+
+    def record(self, endpoint: str, service: str, prompt_tokens: int = 0,
+               output_tokens: int = 0, error: bool = False, degraded: bool = False):
+        minute = datetime.utcnow().replace(second=0, microsecond=0)
+        cost = (prompt_tokens * GEMINI_INPUT_COST_PER_1M + output_tokens * GEMINI_OUTPUT_COST_PER_1M) / 1_000_000
+        counters = {
+            "calls": 0 if degraded else 1,
+            "errors": int(error),
+            "degraded": int(degraded),
+            "prompt_tokens": prompt_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": prompt_tokens + output_tokens,
+            "cost_usd": cost,
+        }
+        key = (minute, endpoint, service or "unknown")
+        with self.lock:
+            _merge(self.pending.setdefault(key, _empty_bucket()), counters)
+            _merge(self.history.setdefault(key, _empty_bucket()), counters)
+        self._ensure_flusher()
+
+    def _ensure_flusher(self):
+        if self.flusher is None:
+            with self.lock:
+                if self.flusher is None:
+                    self.flusher = threading.Thread(target=self._flush_loop, daemon=True)
+                    self.flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(USAGE_FLUSH_SECONDS)
+            self.flush()
+            self._prune()
+
+    def _prune(self):
+        cutoff = datetime.utcnow() - timedelta(minutes=USAGE_MEMORY_MINUTES)
+        with self.lock:
+            for key in [k for k in self.history if k[0] < cutoff]:
+                del self.history[key]
+
+    def prune_table(self):
+        """Delete minutes older than USAGE_RETENTION_DAYS from gemini_usage (once a flush has created it)"""
+        if not self.db_available:
+            return
+        cutoff = datetime.utcnow() - timedelta(days=USAGE_RETENTION_DAYS)
+        log_store.execute("DELETE FROM gemini_usage WHERE minute < %s", (cutoff.strftime('%Y-%m-%d %H:%M'),))
+
+    def _init_table(self, cur):
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS gemini_usage (
+                minute TEXT NOT NULL,
+                endpoint TEXT NOT NULL,
+                service TEXT NOT NULL,
+                calls INTEGER NOT NULL DEFAULT 0,
+                errors INTEGER NOT NULL DEFAULT 0,
+                degraded INTEGER NOT NULL DEFAULT 0,
+                prompt_tokens BIGINT NOT NULL DEFAULT 0,
+                output_tokens BIGINT NOT NULL DEFAULT 0,
+                total_tokens BIGINT NOT NULL DEFAULT 0,
+                cost_usd DOUBLE PRECISION NOT NULL DEFAULT 0,
+                PRIMARY KEY (minute, endpoint, service)
+            )
+        """)
+
+    def flush(self) -> bool:
+        """Upsert pending counters into the log store. Keeps them in memory if the DB is down."""
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        if not pending and self.db_available is not None:
+            return self.db_available
+
+        try:
+            with DB_QUERY_SECONDS.time(backend=log_store.backend, operation="upsert gemini_usage"), \
+                    log_store.connection() as conn:
+                cur = conn.cursor()
+                if not self.db_available:
+                    self._init_table(cur)
+                for (minute, endpoint, service), c in pending.items():
+                    cur.execute(log_store.sql("""
+                        INSERT INTO gemini_usage (minute, endpoint, service, calls, errors, degraded,
+                                                  prompt_tokens, output_tokens, total_tokens, cost_usd)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                        ON CONFLICT (minute, endpoint, service) DO UPDATE SET
+                            calls = gemini_usage.calls + EXCLUDED.calls,
+                            errors = gemini_usage.errors + EXCLUDED.errors,
+                            degraded = gemini_usage.degraded + EXCLUDED.degraded,
+                            prompt_tokens = gemini_usage.prompt_tokens + EXCLUDED.prompt_tokens,
+                            output_tokens = gemini_usage.output_tokens + EXCLUDED.output_tokens,
+                            total_tokens = gemini_usage.total_tokens + EXCLUDED.total_tokens,
+                            cost_usd = gemini_usage.cost_usd + EXCLUDED.cost_usd
+                    """), (minute.strftime('%Y-%m-%d %H:%M'), endpoint, service, c["calls"], c["errors"], c["degraded"],
+                          c["prompt_tokens"], c["output_tokens"], c["total_tokens"], c["cost_usd"]))
+                cur.close()
+            self.db_available = True
+            return True
+        except Exception as e:
+            if self.db_available is not False:
+                print(f"⚠️ Gemini usage ledger using in-memory storage only: {e}")
+            self.db_available = False
+            with self.lock:
+                for key, counters in pending.items():
+                    _merge(self.pending.setdefault(key, _empty_bucket()), counters)
+            return False
+
+    def _rows_from_db(self, since):
+        rows = log_store.fetchall("""
+            SELECT minute, endpoint, service, calls, errors, degraded,
+                   prompt_tokens, output_tokens, total_tokens, cost_usd
+            FROM gemini_usage WHERE minute >= %s
+        """, (since.strftime('%Y-%m-%d %H:%M'),))
+        fields = ["calls", "errors", "degraded", "prompt_tokens", "output_tokens", "total_tokens", "cost_usd"]
+        parse = lambda m: m if isinstance(m, datetime) else datetime.strptime(m, '%Y-%m-%d %H:%M')
+        return [((parse(r[0]), r[1], r[2]), dict(zip(fields, r[3:]))) for r in rows]
+
+    def summary(self, minutes: int = 60) -> dict:
+        """Aggregate usage for the last `minutes`, grouped per endpoint, service and minute"""
+        since = datetime.utcnow().replace(second=0, microsecond=0) - timedelta(minutes=minutes)
+        source = "memory"
+        rows = None
+        if self.flush():
+            try:
+                rows = self._rows_from_db(since)
+                source = log_store.backend
+            except Exception as e:
+                print(f"⚠️ Failed to read Gemini usage from DB: {e}")
+        if rows is None:
+            with self.lock:
+                rows = [(k, dict(v)) for k, v in self.history.items() if k[0] >= since]
+
+        totals = _empty_bucket()
+        by_endpoint, by_service, per_minute = {}, {}, {}
+        for (minute, endpoint, service), counters in rows:
+            _merge(totals, counters)
+            _merge(by_endpoint.setdefault(endpoint, _empty_bucket()), counters)
+            _merge(by_service.setdefault(service, _empty_bucket()), counters)
+            _merge(per_minute.setdefault(minute.strftime('%Y-%m-%d %H:%M'), _empty_bucket()), counters)
+
+        return {
+            "window_minutes": minutes,
+            "source": source,
+            "totals": totals,
+            "by_endpoint": by_endpoint,
+            "by_service": by_service,
+            "per_minute": [{"minute": m, **per_minute[m]} for m in sorted(per_minute)],
+        }
+
+
+def _usage_counts(response, prompt: str):
+    """Read prompt/output token counts from the response, estimating if metadata is missing"""
+    usage = getattr(response, "usage_metadata", None)
+    prompt_tokens = getattr(usage, "prompt_token_count", None)
+    output_tokens = getattr(usage, "candidates_token_count", None)
+    if prompt_tokens is None:
+        prompt_tokens = estimate_tokens(prompt)
+    if output_tokens is None:
+        try:
+            output_tokens = estimate_tokens(response.text)
+        except Exception:
+            output_tokens = 0
+    return int(prompt_tokens), int(output_tokens)
+
+
+def metered_generate(model, prompt: str, endpoint: str, service: str = "all",
+                     priority: str = PRIORITY_HIGH, expected_output_tokens: int = 512):
+    """
+    Call `model.generate_content(prompt)` under the rate limiter and record its usage.
+    Returns the response, or None if the call was degraded because of the quota.
+    Errors from Gemini are recorded and re-raised for the caller to handle.
+    """
+    estimated = estimate_tokens(prompt) + expected_output_tokens
+    if not gemini_limiter.acquire(estimated, priority):
+        usage_ledger.record(endpoint, service, degraded=True)
+        GEMINI_REQUESTS.inc(endpoint=endpoint, outcome="degraded")
+        return None
+
+    started = time.perf_counter()
+    try:
+        response = model.generate_content(prompt)
+    except Exception as e:
+        outcome = "error"
+        if is_rate_limit_error(e):
+            gemini_limiter.report_throttled()
+            outcome = "throttled"
+        usage_ledger.record(endpoint, service, prompt_tokens=estimate_tokens(prompt), error=True)
+        GEMINI_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint, outcome=outcome)
+        GEMINI_REQUESTS.inc(endpoint=endpoint, outcome=outcome)
+        raise
+
+    GEMINI_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint, outcome="success")
+    GEMINI_REQUESTS.inc(endpoint=endpoint, outcome="success")
+    prompt_tokens, output_tokens = _usage_counts(response, prompt)
+    GEMINI_TOKENS.inc(prompt_tokens, endpoint=endpoint, kind="prompt")
+    GEMINI_TOKENS.inc(output_tokens, endpoint=endpoint, kind="output")
+    gemini_limiter.report_success(estimated, prompt_tokens + output_tokens)
+    usage_ledger.record(endpoint, service, prompt_tokens, output_tokens)
+    return response
+
+
+# Global instances
+gemini_limiter = AdaptiveRateLimiter()
+usage_ledger = UsageLedger()
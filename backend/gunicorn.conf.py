@@ -0,0 +1,28 @@
+# gunicorn.conf.py
+"""
+Production server mode for the SmartGuard API:
+
+    cd backend && gunicorn -c gunicorn.conf.py api:app
+
+Runs API_WORKERS uvicorn workers. Shared startup work (tables, demo data) is
+attempted once in the master before any worker is forked; anything that isn't
+ready yet is retried by each worker in the background (see api.lifespan).
+"""
+
+import multiprocessing
+import os
+
+bind = f"{os.getenv('API_HOST', '0.0.0.0')}:{os.getenv('API_PORT', '8000')}"
+workers = int(os.getenv("API_WORKERS", str(multiprocessing.cpu_count())))
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = int(os.getenv("API_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+
+# Workers read this to split the Gemini quota between them
+os.environ["API_WORKERS"] = str(workers)
+
+
+def on_starting(server):
+    from api import prepare_shared_state
+    prepare_shared_state()
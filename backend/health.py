@@ -0,0 +1,123 @@
+# health.py
+"""
+Cached dependency status for /readyz.
+
+Health endpoints must be constant-time and never touch the database, Gemini,
+GCP or Slack on the request path. Instead `dependency_monitor` runs every
+registered check in the background every HEALTH_REFRESH_SECONDS and /readyz
+only returns the last snapshot.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from datetime import datetime
+from dotenv import load_dotenv
+from log_store import log_store
+
+# Load environment
+load_dotenv()
+
+HEALTH_REFRESH_SECONDS = float(os.getenv("HEALTH_REFRESH_SECONDS", "30"))
+# Dependencies that must be OK for /readyz to return 200 (others are informational)
+READINESS_REQUIRED = [d.strip() for d in os.getenv("READINESS_REQUIRED", "log_store").split(",") if d.strip()]
+
+
+class DependencyMonitor:
+    """Runs dependency checks in the background and keeps the latest results"""
+
+    def __init__(self):
+        self.checks = {}
+        self.status = {}
+        self.lock = threading.Lock()
+
+    def register(self, name: str, check):
+        """`check()` returns (ok, detail) or raises; it may do slow I/O"""
+        self.checks[name] = check
+
+    def refresh(self):
+        for name, check in list(self.checks.items()):
+            started = time.perf_counter()
+            try:
+                ok, detail = check()
+            except Exception as e:
+                ok, detail = False, str(e)
+            result = {
+                "ok": bool(ok),
+                "detail": detail,
+                "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+                "checked_at": datetime.utcnow().isoformat() + "Z",
+            }
+            with self.lock:
+                self.status[name] = result
+
+    async def run(self):
+        """Background loop started from the API lifespan"""
+        while True:
+            await asyncio.to_thread(self.refresh)
+            await asyncio.sleep(HEALTH_REFRESH_SECONDS)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {name: dict(result) for name, result in self.status.items()}
+
+    def required_ok(self) -> bool:
+        with self.lock:
+            return all(self.status.get(name, {}).get("ok") for name in READINESS_REQUIRED)
+
+
+# 🔹 Checks (run in the background thread only)
+def check_log_store():
+    log_store.fetchall("SELECT 1")
+    return True, f"{log_store.backend} store reachable"
+
+
+def check_database():
+    """SmartGuard Postgres used by the ingest path"""
+    from smartguard import get_db_connection
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT 1")
+        cur.close()
+    finally:
+        conn.close()
+    return True, "postgres reachable"
+
+
+def check_gemini(client):
+    if client is None:
+        return False, "GEMINI_API_KEY not configured (demo mode)"
+    import google.generativeai as genai
+    from gemini_client import GEMINI_MODEL
+    from gemini_usage import gemini_limiter
+    genai.get_model(f"models/{GEMINI_MODEL}")
+    if gemini_limiter.scale < 1.0:
+        return True, f"reachable, throttled to {gemini_limiter.scale:.0%} of quota"
+    return True, "reachable"
+
+
+def check_gcp_logging():
+    credentials = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
+    if not credentials:
+        return False, "GOOGLE_APPLICATION_CREDENTIALS not set"
+    if not os.path.exists(credentials):
+        return False, f"credentials file {credentials} not found"
+    from smartguard import get_logging_client
+    get_logging_client()
+    return True, "client configured"
+
+
+def check_slack():
+    # Never post to the webhook from a health check, only validate the configuration
+    webhook = os.getenv("SLACK_WEBHOOK_URL")
+    if not webhook or webhook == "your_slack_webhook_url":
+        return False, "SLACK_WEBHOOK_URL not configured"
+    if not webhook.startswith("https://hooks.slack.com/"):
+        return False, "SLACK_WEBHOOK_URL does not look like a Slack webhook"
+    return True, "webhook configured"
+
+
+# Global instance
+dependency_monitor = DependencyMonitor()
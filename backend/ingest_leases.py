@@ -0,0 +1,193 @@
+# ingest_leases.py
+"""
+Work assignment for several ingest monitor replicas.
+
+Every replica running `smartguard.py` is a member: it heartbeats into
+`ingest_members` and may only poll a log source while it holds that source's
+lease in `ingest_leases` (owner + expiry, renewed every
+INGEST_LEASE_RENEW_SECONDS). All lease changes happen inside one
+`locked_transaction` (Postgres advisory lock, or the SQLite write lock of the
+local stand-in), so two replicas never hold the same source.
+
+Sources are spread with rendezvous hashing over the live members: each source
+prefers the member with the highest hash(member, source) that still has room
+(at most ceil(sources / members) each). A member claims the sources it is
+preferred for once they are free or their lease expired, and hands back
+(after the running cycle) the ones now preferred elsewhere. So:
+- a new replica takes over about 1/N of the sources and little else moves;
+- a crashed replica stops heartbeating, drops out of the member list after
+  INGEST_LEASE_TTL_SECONDS and its leases expire, then its sources are claimed
+  by their next preferred members;
+- a replica that can't reach the database stops polling when its own leases
+  run out, before anyone else may claim them.
+
+The lease row also carries the source's cursor, so a new owner resumes where
+the previous one stopped instead of re-reading (and re-alerting on) the
+lookback window. Cursor writes are fenced by the owner column.
+"""
+
+import hashlib
+import json
+import os
+import socket
+import time
+from datetime import datetime
+from dotenv import load_dotenv
+from log_store import log_store
+from instrumentation import Counter, Gauge
+
+# Load environment
+load_dotenv()
+
+# Replicas coordinate through leases in the log store; false = every replica polls every source
+INGEST_COORDINATION = os.getenv("INGEST_COORDINATION", "true").lower() == "true"
+INGEST_LEASE_TTL_SECONDS = float(os.getenv("INGEST_LEASE_TTL_SECONDS", "30"))
+INGEST_LEASE_RENEW_SECONDS = float(os.getenv("INGEST_LEASE_RENEW_SECONDS", "10"))
+# Unique per replica; the pod name (hostname) plus pid by default
+INGEST_MEMBER_ID = os.getenv("INGEST_MEMBER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+INGEST_LEASE_LOCK_ID = 2024061505
+# Stop polling a source this long before its lease would expire, in case renewal is failing
+LEASE_SAFETY_SECONDS = 2.0
+
+INGEST_LEASES_HELD = Gauge("smartguard_ingest_leases_held", "Log sources this replica holds the lease for")
+INGEST_LEASE_CHANGES = Counter("smartguard_ingest_lease_changes_total",
+                               "Leases acquired, released (rebalanced) or lost by this replica", ["event"])
+
+
+def assign(sources, members) -> dict:
+    """
+    {source: member} by rendezvous (highest random weight) hashing, bounded to ceil(sources / members)
+    per member: deterministic, so every replica computes the same plan, and little moves when members change.
+    """
+    members = sorted(members)
+    capacity = -(-len(sources) // max(len(members), 1))
+    load = {member: 0 for member in members}
+    plan = {}
+    for source in sorted(sources):
+        ranked = sorted(members, key=lambda member: hashlib.sha1(f"{member}\0{source}".encode()).hexdigest(),
+                        reverse=True)
+        member = next(member for member in ranked if load[member] < capacity)
+        load[member] += 1
+        plan[source] = member
+    return plan
+
+
+def encode_cursor(source) -> str:
+    if source.cursor is None:
+        return None
+    return json.dumps({"cursor": source.cursor.isoformat(), "ids": sorted(source.cursor_ids)})
+
+
+def decode_cursor(value):
+    """(cursor, cursor_ids) stored by encode_cursor, (None, set()) when there is none"""
+    if not value:
+        return None, set()
+    state = json.loads(value)
+    return datetime.fromisoformat(state["cursor"]), set(state["ids"])
+
+
+class LeaseCoordinator:
+    """Membership, lease renewal and rebalancing of log sources across ingest replicas"""
+
+    def __init__(self, member: str = INGEST_MEMBER_ID, ttl: float = INGEST_LEASE_TTL_SECONDS,
+                 renew_seconds: float = INGEST_LEASE_RENEW_SECONDS):
+        self.member = member
+        self.ttl = ttl
+        self.renew_seconds = renew_seconds
+        self.held = {}  # source name -> lease expiry (local clock of the last successful renewal)
+
+    def owns(self, name: str, now: float = None) -> bool:
+        expires = self.held.get(name)
+        return expires is not None and expires - LEASE_SAFETY_SECONDS > (now or time.time())
+
+    def sync(self, sources: list, busy=()) -> set:
+        """
+        Heartbeat, renew held leases, claim preferred free ones and release the ones preferred
+        elsewhere (unless `busy`, i.e. a cycle is running). Newly acquired sources get the stored cursor.
+        Returns the names of the sources this replica holds.
+        """
+        by_name = {source.name: source for source in sources}
+        with log_store.locked_transaction(INGEST_LEASE_LOCK_ID) as cur:
+            now = time.time()
+            expires = now + self.ttl
+            cur.execute(log_store.sql("""INSERT INTO ingest_members (member, heartbeat_at) VALUES (%s, %s)
+                                         ON CONFLICT (member) DO UPDATE SET
+                                             heartbeat_at = EXCLUDED.heartbeat_at"""),
+                        (self.member, now))
+            cur.execute(log_store.sql("DELETE FROM ingest_members WHERE heartbeat_at < %s"), (now - self.ttl,))
+            cur.execute("SELECT member FROM ingest_members")
+            members = [row[0] for row in cur.fetchall()]
+            cur.execute("SELECT source, owner, expires_at, cursor FROM ingest_leases")
+            leases = {row[0]: row[1:] for row in cur.fetchall()}
+
+            plan = assign(by_name, members)
+            held, released = {}, set()
+            for name in sorted(by_name):
+                owner, lease_expires, cursor = leases.get(name, (None, 0.0, None))
+                mine = owner == self.member and lease_expires > now
+                free = owner is None or lease_expires <= now
+                preferred = plan[name] == self.member
+                if mine and not preferred and name not in busy:
+                    # Rebalance: hand it back, its preferred member claims it on its next sync
+                    cur.execute(log_store.sql("UPDATE ingest_leases SET owner = NULL, expires_at = 0 "
+                                              "WHERE source = %s AND owner = %s"), (name, self.member))
+                    released.add(name)
+                    INGEST_LEASE_CHANGES.inc(event="released")
+                elif mine or (free and preferred):
+                    cur.execute(log_store.sql("""INSERT INTO ingest_leases (source, owner, expires_at)
+                                                 VALUES (%s, %s, %s)
+                                                 ON CONFLICT (source) DO UPDATE SET
+                                                     owner = EXCLUDED.owner, expires_at = EXCLUDED.expires_at"""),
+                                (name, self.member, expires))
+                    held[name] = expires
+                    if name not in self.held:
+                        source = by_name[name]
+                        source.cursor, source.cursor_ids = decode_cursor(cursor)
+                        source.pending = None
+                        INGEST_LEASE_CHANGES.inc(event="acquired")
+
+        for name in set(self.held) - set(held) - released:
+            INGEST_LEASE_CHANGES.inc(event="lost")
+            print(f"⚠️ Lease on log source {name} lost to another member")
+        self.held = held
+        INGEST_LEASES_HELD.set(len(held))
+        return set(held)
+
+    def save_cursor(self, source) -> bool:
+        """Persist the source's cursor; False (and the lease is dropped locally) if another member owns it now"""
+        with log_store.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(log_store.sql("UPDATE ingest_leases SET cursor = %s WHERE source = %s AND owner = %s"),
+                        (encode_cursor(source), source.name, self.member))
+            saved = cur.rowcount > 0
+            cur.close()
+        if not saved:
+            self.held.pop(source.name, None)
+            INGEST_LEASE_CHANGES.inc(event="lost")
+            print(f"⚠️ Lease on log source {source.name} was taken over, cursor not saved")
+        return saved
+
+    def leave(self):
+        """Release every lease and the membership on a clean shutdown, so others take over immediately"""
+        with log_store.locked_transaction(INGEST_LEASE_LOCK_ID) as cur:
+            cur.execute(log_store.sql("UPDATE ingest_leases SET owner = NULL, expires_at = 0 WHERE owner = %s"),
+                        (self.member,))
+            cur.execute(log_store.sql("DELETE FROM ingest_members WHERE member = %s"), (self.member,))
+        self.held = {}
+        INGEST_LEASES_HELD.set(0)
+
+
+def assignments() -> dict:
+    """Members and leases as seen by everyone (for /ingest/leases)"""
+    now = time.time()
+    members = log_store.fetchall("SELECT member, heartbeat_at FROM ingest_members ORDER BY member")
+    leases = log_store.fetchall("SELECT source, owner, expires_at, cursor FROM ingest_leases ORDER BY source")
+    return {
+        "members": [{"member": member, "heartbeat_age_seconds": round(now - heartbeat_at, 1),
+                     "alive": now - heartbeat_at <= INGEST_LEASE_TTL_SECONDS}
+                    for member, heartbeat_at in members],
+        "leases": [{"source": source, "owner": owner if expires_at > now else None,
+                    "expires_in_seconds": round(max(0.0, expires_at - now), 1),
+                    "cursor": decode_cursor(cursor)[0].isoformat() + "Z" if cursor else None}
+                   for source, owner, expires_at, cursor in leases],
+    }
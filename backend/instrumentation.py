@@ -0,0 +1,241 @@
+# instrumentation.py
+"""
+SmartGuard's own metrics, in the Prometheus text exposition format.
+
+A tiny dependency-free registry (counters, gauges, histograms with labels)
+used across the hot paths: API request latency, Gemini calls, DB queries,
+ingest lag, Slack alerts and cache hit ratios. The API exports it on
+GET /internal/metrics; standalone processes (the ingest monitor) can call
+`serve_metrics(port)`.
+
+Metrics are per process: with API_WORKERS > 1 each scrape sees one worker,
+so prefer rates/quantiles aggregated over the pod rather than raw values.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+
+    def add_collector(self, collector):
+        """`collector()` is called before every render, to refresh derived gauges"""
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self.collectors:
+            try:
+                collector()
+            except Exception as e:
+                print(f"⚠️ Metrics collector failed: {e}")
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+        registry.register(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(label, "")) for label in self.labelnames)
+
+    def _labels(self, key: tuple) -> dict:
+        return dict(zip(self.labelnames, key))
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self.values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self.lock:
+            items = list(self.values.items())
+        for key, value in items:
+            yield self.name, self._labels(key), value
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self):
+        with self.lock:
+            items = list(self.values.items())
+        for key, value in items:
+            yield self.name, self._labels(key), value
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self.values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the `with` block (also when it raises)"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self.lock:
+            items = [(key, (list(counts), total)) for key, (counts, total) in self.values.items()]
+        for key, (counts, total) in items:
+            labels = self._labels(key)
+            for bound, count in zip(self.buckets, counts):
+                yield f"{self.name}_bucket", dict(labels, le=_format_value(bound)), count
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, counts[-1]
+
+
+# 🔹 API
+HTTP_REQUEST_SECONDS = Histogram(
+    "smartguard_http_request_duration_seconds", "API request latency per endpoint",
+    ["method", "route", "status"])
+HTTP_IN_FLIGHT = Gauge("smartguard_http_requests_in_flight", "API requests currently being served")
+
+# 🔹 Gemini
+GEMINI_REQUEST_SECONDS = Histogram(
+    "smartguard_gemini_request_duration_seconds", "Gemini generate_content latency",
+    ["endpoint", "outcome"])
+GEMINI_REQUESTS = Counter(
+    "smartguard_gemini_requests_total", "Gemini calls by outcome (success/error/throttled/degraded)",
+    ["endpoint", "outcome"])
+GEMINI_RETRIES = Counter("smartguard_gemini_retries_total", "Gemini calls retried after a failure", ["endpoint"])
+GEMINI_TOKENS = Counter("smartguard_gemini_tokens_total", "Gemini tokens consumed", ["endpoint", "kind"])
+
+# 🔹 Database
+DB_QUERY_SECONDS = Histogram(
+    "smartguard_db_query_duration_seconds", "Database query/insert latency",
+    ["backend", "operation"])
+
+# 🔹 Ingest
+INGEST_LAG_SECONDS = Gauge(
+    "smartguard_ingest_lag_seconds", "Age of the newest log fetched from GCP at fetch time", ["source"])
+INGEST_FETCH_SECONDS = Histogram("smartguard_ingest_fetch_duration_seconds", "GCP list_entries latency", ["source"])
+INGEST_LOGS = Counter("smartguard_ingest_logs_total", "Log entries fetched from GCP", ["source"])
+INGEST_CYCLE_SECONDS = Histogram(
+    "smartguard_ingest_cycle_duration_seconds", "One ingest cycle (fetch, analyze, store, alert) of a log source",
+    ["source"], buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0))
+INGEST_SCHEDULE_DELAY_SECONDS = Gauge(
+    "smartguard_ingest_schedule_delay_seconds", "How long the last due cycle of a source waited for a worker",
+    ["source"])
+INGEST_FAILURES = Counter("smartguard_ingest_failures_total", "Failed ingest cycles", ["source"])
+
+# 🔹 Alerts
+ALERT_SEND_SECONDS = Histogram("smartguard_alert_send_duration_seconds", "Slack webhook latency", ["outcome"])
+
+# 🔹 Caches
+CACHE_REQUESTS = Counter("smartguard_cache_requests_total", "Cache lookups by result (hit/miss)", ["cache", "result"])
+CACHE_HIT_RATIO = Gauge("smartguard_cache_hit_ratio", "Hits / lookups since process start", ["cache"])
+
+
+def _collect_cache_ratios():
+    caches = {key[0] for key in list(CACHE_REQUESTS.values)}
+    for cache in caches:
+        hits = CACHE_REQUESTS.get(cache=cache, result="hit")
+        total = hits + CACHE_REQUESTS.get(cache=cache, result="miss")
+        CACHE_HIT_RATIO.set(hits / total if total else 0.0, cache=cache)
+
+
+registry.add_collector(_collect_cache_ratios)
+
+
+def render_metrics() -> str:
+    return registry.render()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = render_metrics().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve_metrics(port: int):
+    """Expose /internal/metrics-style output on `port` from a background thread"""
+    server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"📈 Metrics available on :{port}")
+    return server
@@ -0,0 +1,202 @@
+# live_updates.py
+"""
+Push-based live updates for the dashboard.
+
+One poller per API worker reads logs newer than its cursor (primary key range,
+so each poll costs O(new rows)) every LIVE_POLL_SECONDS and fans the resulting
+delta out to every subscriber:
+
+    {"cursor": 1234, "logs": [...], "alerts": [...],
+     "counts": {"ERROR": 3, ...}, "services": {"cartservice": {"total": 9, "errors": 1}}, "more": false}
+
+Clients either hold a Server-Sent Events stream (/events/stream, resumable via
+Last-Event-ID) or ask for the delta after their cursor (/events/delta), which is
+what the Streamlit dashboard does from a fragment. Either way they add deltas to
+what they already have instead of reloading every endpoint.
+
+Ids are assigned when a row is inserted, not when it commits, so with several
+writers id N+1 can become visible before N. The cursor therefore stops just
+below an id missing between it and the newest log for up to LIVE_GAP_SECONDS,
+and the logs above it come again in the next delta: /events/delta clients
+dedupe by id (counts cover the logs of each delta), streams are deduped here.
+"""
+
+import asyncio
+import json
+import os
+import time
+from dotenv import load_dotenv
+from log_store import log_store
+from instrumentation import Gauge
+
+# Load environment
+load_dotenv()
+
+LIVE_POLL_SECONDS = float(os.getenv("LIVE_POLL_SECONDS", "2"))
+LIVE_HEARTBEAT_SECONDS = float(os.getenv("LIVE_HEARTBEAT_SECONDS", "15"))
+LIVE_BATCH_ROWS = int(os.getenv("LIVE_BATCH_ROWS", "500"))
+# How long a missing id may still show up (an insert committing late) before the cursor moves past it
+LIVE_GAP_SECONDS = float(os.getenv("LIVE_GAP_SECONDS", "10"))
+LIVE_QUEUE_SIZE = 100  # deltas buffered per subscriber before the oldest are dropped
+LIVE_MAX_GAP_IDS = 1000  # missing ids tracked per hole (a sequence jump is not a pending insert)
+
+LIVE_SUBSCRIBERS = Gauge("smartguard_live_subscribers", "Open /events/stream connections")
+
+
+def build_delta(logs: list, cursor: int, more: bool = False) -> dict:
+    """Delta message for new logs (oldest first): the logs, new alerts and count increments; `cursor` is where
+    the next delta starts"""
+    counts, services = {}, {}
+    for log in logs:
+        counts[log["severity"]] = counts.get(log["severity"], 0) + 1
+        stats = services.setdefault(log["service"], {"total": 0, "errors": 0})
+        stats["total"] += 1
+        stats["errors"] += log["severity"] == "ERROR"
+    return {
+        "cursor": cursor,
+        "logs": logs,
+        "alerts": [log for log in logs if log["severity"] == "ERROR"],
+        "counts": counts,
+        "services": services,
+        "more": more,
+    }
+
+
+def format_event(delta: dict) -> str:
+    """One SSE message; the cursor is the event id, so reconnects resume via Last-Event-ID"""
+    return f"id: {delta['cursor']}\nevent: delta\ndata: {json.dumps(delta, default=str)}\n\n"
+
+
+def unsent(delta: dict, cursor: int, sent: set):
+    """
+    (`delta` without the logs a client already got, its new cursor): `sent` holds the ids it got above
+    `cursor`, which a held cursor makes come again
+    """
+    logs = [log for log in delta["logs"] if log["id"] > cursor and log["id"] not in sent]
+    cursor = max(cursor, delta["cursor"])
+    sent.update(log["id"] for log in logs)
+    sent.difference_update([log_id for log_id in sent if log_id <= cursor])
+    return build_delta(logs, cursor, delta["more"]), cursor
+
+
+class LiveFeed:
+    """Polls the log store once per worker and broadcasts deltas to subscribers"""
+
+    def __init__(self, poll_seconds: float = LIVE_POLL_SECONDS, batch_rows: int = LIVE_BATCH_ROWS):
+        self.poll_seconds = poll_seconds
+        self.batch_rows = batch_rows
+        self.cursor = None
+        self.sent = set()  # ids above `cursor` the poller already published
+        self.gaps = {}     # missing id -> when it was first noticed (monotonic)
+        self.subscribers = set()
+
+    def _settled(self, after_id: int, logs: list) -> int:
+        """Cursor after `logs`: their newest id, or just below the oldest recently noticed id missing among them"""
+        now = time.monotonic()
+        hold, expected = None, after_id + 1
+        for log in logs:
+            for missing in range(expected, min(log["id"], expected + LIVE_MAX_GAP_IDS)):
+                noticed = self.gaps.setdefault(missing, now)
+                if hold is None and now - noticed < LIVE_GAP_SECONDS:
+                    hold = missing - 1
+            self.gaps.pop(log["id"], None)
+            expected = log["id"] + 1
+        for missing, noticed in list(self.gaps.items()):
+            if now - noticed > 2 * LIVE_GAP_SECONDS:
+                self.gaps.pop(missing, None)
+        if hold is not None:
+            return hold
+        return logs[-1]["id"] if logs else after_id
+
+    def delta(self, after_id: int = None, limit: int = None) -> dict:
+        """Logs after `after_id` (None: start from now, nothing to catch up on)"""
+        if after_id is None:
+            return build_delta([], log_store.max_log_id())
+        limit = limit or self.batch_rows
+        logs = log_store.logs_after(after_id, limit)
+        cursor = self._settled(after_id, logs)
+        # While held, the same page would come back: wait for the next poll instead of draining
+        held = bool(logs) and cursor < logs[-1]["id"]
+        return build_delta(logs, cursor, more=len(logs) == limit and not held)
+
+    def _publish(self, delta: dict):
+        for queue in list(self.subscribers):
+            if queue.full():
+                # Slow consumer: drop what it has buffered, it re-reads from its cursor instead
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.overflowed = True
+            queue.put_nowait(delta)
+
+    async def _catch_up(self, cursor):
+        """Deltas straight from the store until `cursor` is current"""
+        while True:
+            delta = await asyncio.to_thread(self.delta, cursor)
+            cursor = delta["cursor"]
+            yield delta
+            if not delta["more"]:
+                return
+
+    async def run(self):
+        """Background loop started from the API lifespan"""
+        while True:
+            try:
+                if self.subscribers and self.cursor is not None:
+                    delta, self.cursor = unsent(await asyncio.to_thread(self.delta, self.cursor),
+                                                self.cursor, self.sent)
+                    if delta["logs"]:
+                        self._publish(delta)
+                    if delta["more"]:
+                        continue  # burst: drain without waiting
+                elif not self.subscribers:
+                    self.cursor = None  # nobody listening: don't read, re-anchor on the next subscriber
+                    self.sent = set()
+            except Exception as e:
+                print(f"⚠️ Live update poll failed: {e}")
+            await asyncio.sleep(self.poll_seconds)
+
+    async def stream(self, request, after_id: int = None):
+        """SSE messages for one client: catch up from `after_id`, then live deltas and heartbeats"""
+        queue = asyncio.Queue(maxsize=LIVE_QUEUE_SIZE)
+        queue.overflowed = False
+        self.subscribers.add(queue)
+        LIVE_SUBSCRIBERS.inc()
+        try:
+            # Anchor the shared poller before catching up, so nothing falls between the two
+            if self.cursor is None:
+                anchor = await asyncio.to_thread(log_store.max_log_id)
+                if self.cursor is None:
+                    self.cursor = anchor
+            cursor, sent = after_id, set()
+            async for delta in self._catch_up(cursor):
+                if cursor is None:
+                    cursor = delta["cursor"]
+                    yield format_event(delta)
+                    continue
+                delta, cursor = unsent(delta, cursor, sent)
+                if delta["logs"]:
+                    yield format_event(delta)
+            while not await request.is_disconnected():
+                try:
+                    delta = await asyncio.wait_for(queue.get(), timeout=LIVE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+                if queue.overflowed:
+                    queue.overflowed = False
+                    async for delta in self._catch_up(cursor):
+                        delta, cursor = unsent(delta, cursor, sent)
+                        if delta["logs"]:
+                            yield format_event(delta)
+                    continue
+                # The shared poller may have started before this client caught up
+                delta, cursor = unsent(delta, cursor, sent)
+                if delta["logs"]:
+                    yield format_event(delta)
+        finally:
+            self.subscribers.discard(queue)
+            LIVE_SUBSCRIBERS.dec()
+
+
+# Global instance
+live_feed = LiveFeed()
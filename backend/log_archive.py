@@ -0,0 +1,318 @@
+# log_archive.py
+"""
+Columnar archive tier for old logs.
+
+A background archiver moves logs older than ARCHIVE_AFTER_DAYS out of the
+row-oriented `logs` table into Parquet files partitioned by day and service:
+
+    ARCHIVE_DIR/day=2026-01-31/service=checkoutservice/part-<first id>-<last id>.parquet
+
+Batches are written first and deleted from the store afterwards, in one
+transaction holding a cross-process lock, so only one worker archives at a time
+and a crash never loses rows (a re-run rewrites the same part file).
+The `archive_watermark` app_state value marks the boundary: archived data is
+read for timestamps before it, the hot store for everything after. Retention
+(retention.py) may later drop or rewrite partitions and bumps
+`archive_generation` when it does.
+
+Long-range queries (/timeline, /metrics-enhanced) scan the archive with
+pyarrow datasets over memory-mapped files, pruning partitions by day; results
+for a given watermark are immutable and cached in process.
+"""
+
+import asyncio
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from log_store import log_store, SELECT_COLUMNS
+from log_fields import JSON_COLUMNS
+from instrumentation import Histogram
+
+# Load environment
+load_dotenv()
+
+# Archiving deletes rows from the logs table, so it is opt-in and needs ARCHIVE_DIR on persistent storage
+ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "false").lower() == "true"
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "")
+ARCHIVE_AFTER_DAYS = float(os.getenv("ARCHIVE_AFTER_DAYS", "7"))
+ARCHIVE_INTERVAL_SECONDS = float(os.getenv("ARCHIVE_INTERVAL_SECONDS", "3600"))
+ARCHIVE_BATCH_ROWS = int(os.getenv("ARCHIVE_BATCH_ROWS", "20000"))
+ARCHIVE_LOCK_ID = 2024061502
+ARCHIVE_CACHE_SIZE = 256
+_EPOCH = datetime(1970, 1, 1)
+
+ARCHIVE_SCAN_SECONDS = Histogram("smartguard_archive_scan_duration_seconds", "Parquet archive query latency", ["query"])
+ARCHIVE_BATCH_SECONDS = Histogram("smartguard_archive_batch_duration_seconds", "Archiver batch (write + delete) latency")
+
+
+def file_schema():
+    """Columns stored in every part file (day/service come from the directory names)"""
+    import pyarrow as pa
+    return pa.schema([
+        ("id", pa.int64()), ("timestamp", pa.timestamp("us")), ("severity", pa.string()),
+        ("raw_log", pa.string()), ("ai_summary", pa.string()),
+        ("trace_id", pa.string()), ("span_id", pa.string()), ("parent_span_id", pa.string()),
+        ("http_status", pa.int32()),
+        ("latency_ms", pa.float64()), ("insert_id", pa.string()),
+        ("labels", pa.string()), ("payload", pa.string()),  # JSON text
+    ])
+
+
+def _to_datetime(value) -> datetime:
+    return value if isinstance(value, datetime) else datetime.fromisoformat(str(value))
+
+
+class LogArchive:
+    """Writes old logs to Parquet and answers aggregate queries over them"""
+
+    def __init__(self, path: str = ARCHIVE_DIR):
+        self.path = path
+        self.cache = {}
+        self.cache_lock = threading.Lock()
+        try:
+            import pyarrow  # noqa: F401
+            self.available = bool(path)  # no ARCHIVE_DIR: nothing archived, nothing to read
+        except ImportError:
+            self.available = False
+
+    # 🔹 Boundary between archive and hot store
+    def watermark(self):
+        """Logs before this datetime live in the archive (None until something was archived)"""
+        try:
+            value = log_store.get_state("archive_watermark")
+        except Exception:
+            return None
+        return datetime.fromisoformat(value) if value else None
+
+    def _version(self):
+        """(watermark, generation): changes whenever archived data does (archiving or retention)"""
+        try:
+            rows = log_store.fetchall("SELECT key, value FROM app_state WHERE key IN (%s, %s)",
+                                      ("archive_watermark", "archive_generation"))
+        except Exception:
+            return None, None
+        state = dict(rows)
+        return state.get("archive_watermark"), state.get("archive_generation")
+
+    # 🔹 Archiver
+    def _write_logs(self, logs):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        groups = {}
+        for log in logs:
+            log["timestamp"] = _to_datetime(log["timestamp"])
+            groups.setdefault((log["timestamp"].date().isoformat(), log["service"] or "unknown"), []).append(log)
+
+        for (day, service), logs in groups.items():
+            directory = os.path.join(self.path, f"day={day}", f"service={service}")
+            os.makedirs(directory, exist_ok=True)
+            columns = {name: [log.get(name) for log in logs] for name in file_schema().names}
+            for name in JSON_COLUMNS:
+                columns[name] = [None if value is None else json.dumps(value, default=str) for value in columns[name]]
+            table = pa.table(columns, schema=file_schema())
+            target = os.path.join(directory, f"part-{logs[0]['id']}-{logs[-1]['id']}.parquet")
+            # Write then rename: a scan never sees a half-written file
+            pq.write_table(table, target + ".tmp", compression="zstd")
+            os.replace(target + ".tmp", target)
+
+    def _archive_batch(self, cutoff: datetime) -> int:
+        with ARCHIVE_BATCH_SECONDS.time(), log_store.locked_transaction(ARCHIVE_LOCK_ID, wait=False) as cur:
+            if cur is None:
+                return 0  # another worker is archiving
+            cur.execute(
+                log_store.sql(f"SELECT {SELECT_COLUMNS} FROM logs WHERE timestamp < %s "
+                              "ORDER BY timestamp, id LIMIT %s"),
+                (log_store.ts(cutoff), ARCHIVE_BATCH_ROWS),
+            )
+            rows = cur.fetchall()
+            if not rows:
+                log_store.set_state("archive_watermark", cutoff.isoformat(), cur)
+                return 0
+            full = len(rows) == ARCHIVE_BATCH_ROWS
+            if full:
+                # Take the rest of the newest timestamp too, so the watermark can move past it
+                cur.execute(log_store.sql(f"SELECT {SELECT_COLUMNS} FROM logs WHERE timestamp = %s AND id > %s "
+                                          "ORDER BY id"), (rows[-1][1], rows[-1][0]))
+                rows += cur.fetchall()
+
+            # The archive keeps full bodies, so deduplicated payloads are resolved first
+            logs = log_store.rows_to_logs(rows)
+            self._write_logs(logs)
+            ids = [log["id"] for log in logs]
+            for start in range(0, len(ids), 1000):
+                chunk = ids[start:start + 1000]
+                cur.execute(log_store.sql(f"DELETE FROM logs WHERE id IN ({', '.join(['%s'] * len(chunk))})"),
+                            tuple(chunk))
+            # Every row up to and including the newest archived timestamp has left the hot store; archive
+            # reads are `timestamp < watermark`, so the watermark goes just past it
+            boundary = logs[-1]["timestamp"] + timedelta(microseconds=1) if full else cutoff
+            log_store.set_state("archive_watermark", boundary.isoformat(), cur)
+            return len(rows)
+
+    def archive_older_than(self, days: float = ARCHIVE_AFTER_DAYS) -> int:
+        """Move every log older than `days` into the archive; returns the number of rows moved"""
+        if not self.available:
+            return 0
+        cutoff = datetime.now() - timedelta(days=days)
+        previous = self.watermark()
+        if previous and previous > cutoff:
+            return 0
+        moved = 0
+        while True:
+            count = self._archive_batch(cutoff)
+            moved += count
+            if count < ARCHIVE_BATCH_ROWS:
+                break
+        if moved:
+            print(f"📦 Archived {moved} logs older than {cutoff.isoformat(timespec='seconds')} to {self.path}")
+        return moved
+
+    async def run(self):
+        """Background loop started from the API lifespan"""
+        while True:
+            try:
+                await asyncio.to_thread(self.archive_older_than)
+            except Exception as e:
+                print(f"⚠️ Log archiver failed: {e}")
+            await asyncio.sleep(ARCHIVE_INTERVAL_SECONDS)
+
+    # 🔹 Queries
+    def _dataset(self):
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        from pyarrow import fs
+
+        partition_schema = pa.schema([("day", pa.string()), ("service", pa.string())])
+        partitioning = ds.partitioning(partition_schema, flavor="hive")
+        # Explicit schema: part files written before a column existed read it as nulls
+        schema = pa.unify_schemas([file_schema(), partition_schema])
+        return ds.dataset(self.path, format="parquet", partitioning=partitioning, schema=schema,
+                          filesystem=fs.LocalFileSystem(use_mmap=True), exclude_invalid_files=True)
+
+    def _scan(self, columns, since=None, until=None, severities=None, services=None):
+        """Arrow table of `columns` for since <= timestamp < until, pruning day partitions"""
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+
+        if not os.path.isdir(self.path):
+            return None
+        condition = None
+        clauses = []
+        if since is not None:
+            clauses += [ds.field("day") >= since.date().isoformat(),
+                        ds.field("timestamp") >= pa.scalar(since, pa.timestamp("us"))]
+        if until is not None:
+            clauses += [ds.field("day") <= until.date().isoformat(),
+                        ds.field("timestamp") < pa.scalar(until, pa.timestamp("us"))]
+        if severities:
+            clauses.append(ds.field("severity").isin(list(severities)))
+        if services:
+            clauses.append(ds.field("service").isin(list(services)))
+        for clause in clauses:
+            condition = clause if condition is None else condition & clause
+        return self._dataset().to_table(columns=columns, filter=condition)
+
+    def _cached(self, key, compute):
+        """Archived data only changes with the watermark or generation, so results are cached per version"""
+        key = self._version() + key
+        with self.cache_lock:
+            if key in self.cache:
+                return self.cache[key]
+        value = compute()
+        with self.cache_lock:
+            if len(self.cache) >= ARCHIVE_CACHE_SIZE:
+                self.cache.clear()
+            self.cache[key] = value
+        return value
+
+    def _range(self, since, until):
+        """Clamp a requested range to what is actually archived"""
+        watermark = self.watermark()
+        if not self.available or watermark is None:
+            return None
+        until = min(until or watermark, watermark)
+        if since is not None and since >= until:
+            return None
+        return since, until
+
+    def hourly_severity_counts(self, since=None, until=None):
+        """[(hour 'YYYY-MM-DD HH:00', severity, count)] newest hour first, same shape as the log store"""
+        return self.bucket_severity_counts(3600, since, until)
+
+    def bucket_severity_counts(self, bucket_seconds: int, since=None, until=None):
+        """
+        [(bucket start 'YYYY-MM-DD HH:MM', severity, count)] newest first, in epoch-aligned buckets;
+        `since` is taken from the start of its bucket (whole buckets, and a cache key that doesn't change per call)
+        """
+        if since is not None:
+            seconds = int((since - _EPOCH).total_seconds()) // bucket_seconds * bucket_seconds
+            since = _EPOCH + timedelta(seconds=seconds)
+        bounds = self._range(since, until)
+        if bounds is None:
+            return []
+
+        def compute():
+            import pyarrow.compute as pc
+            with ARCHIVE_SCAN_SECONDS.time(query="bucket_severity_counts"):
+                table = self._scan(["timestamp", "severity"], *bounds)
+                if table is None or table.num_rows == 0:
+                    return []
+                buckets = pc.strftime(pc.floor_temporal(table["timestamp"], multiple=bucket_seconds, unit="second"),
+                                      format="%Y-%m-%d %H:%M")
+                grouped = table.append_column("bucket", buckets).group_by(["bucket", "severity"]).aggregate(
+                    [("timestamp", "count")])
+                rows = zip(grouped["bucket"].to_pylist(), grouped["severity"].to_pylist(),
+                           grouped["timestamp_count"].to_pylist())
+                return sorted(rows, key=lambda row: row[0], reverse=True)
+
+        return self._cached(("buckets", bucket_seconds, bounds), compute)
+
+    def service_severity_counts(self, since=None, until=None):
+        """[(service, severity, count)] over the archived range"""
+        bounds = self._range(since, until)
+        if bounds is None:
+            return []
+
+        def compute():
+            with ARCHIVE_SCAN_SECONDS.time(query="service_severity_counts"):
+                table = self._scan(["service", "severity"], *bounds)
+                if table is None or table.num_rows == 0:
+                    return []
+                grouped = table.group_by(["service", "severity"]).aggregate([("severity", "count")])
+                return list(zip(grouped["service"].to_pylist(), grouped["severity"].to_pylist(),
+                                grouped["severity_count"].to_pylist()))
+
+        return self._cached(("services", bounds), compute)
+
+    def events(self, since=None, until=None, severities=("ERROR", "WARNING"), limit=500, offset=0,
+               services=None, with_total=False):
+        """
+        Most recent archived logs of the given severities (None: all), newest first,
+        plus the total match count when `with_total` is set (timeline drill-down).
+        """
+        bounds = self._range(since, until)
+        if bounds is None:
+            return ([], 0) if with_total else []
+
+        def compute():
+            with ARCHIVE_SCAN_SECONDS.time(query="events"):
+                table = self._scan(["id", "timestamp", "service", "severity", "raw_log", "ai_summary", "trace_id"],
+                                   *bounds, severities=severities, services=services)
+                if table is None or table.num_rows == 0:
+                    return [], 0
+                total = table.num_rows
+                table = table.sort_by([("timestamp", "descending"), ("id", "descending")]).slice(offset, limit)
+                logs = table.to_pylist()
+                for log in logs:
+                    log["timestamp"] = log["timestamp"].isoformat()
+                return logs, total
+
+        key = ("events", bounds, tuple(severities or ()), tuple(services or ()), limit, offset)
+        logs, total = self._cached(key, compute)
+        return (logs, total) if with_total else logs
+
+# Global instance
+log_archive = LogArchive()
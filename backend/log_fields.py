@@ -0,0 +1,220 @@
+# log_fields.py
+"""
+Structured fields extracted from log entries at ingest.
+
+Instead of flattening every Cloud Logging entry to `str(entry.payload)`,
+fetch_logs keeps:
+- trace_id / span_id (entry.trace "projects/<p>/traces/<id>", entry.span_id or
+  the usual jsonPayload keys) and parent_span_id when the application logs it,
+- http_status and latency_ms (entry.http_request, jsonPayload.httpRequest or
+  status/latency keys in the payload),
+- insert_id, the entry labels merged over the resource labels,
+- the jsonPayload itself, while raw_log becomes its message.
+
+They are stored as typed columns plus JSON (labels, payload): JSONB with GIN
+indexes on Postgres, TEXT read with json_extract on SQLite. Filters such as
+"5xx from checkoutservice slower than 2s" then use the
+(service, http_status, latency_ms) index instead of scanning raw_log text.
+"""
+
+import json
+from datetime import timedelta
+
+FIELD_COLUMNS = ["trace_id", "span_id", "parent_span_id", "http_status", "latency_ms",
+                 "insert_id", "labels", "payload"]
+JSON_COLUMNS = ("labels", "payload")
+
+_COLUMN_TYPES = {
+    "postgres": {"trace_id": "TEXT", "span_id": "TEXT", "parent_span_id": "TEXT", "http_status": "INTEGER",
+                 "latency_ms": "DOUBLE PRECISION", "insert_id": "TEXT", "labels": "JSONB", "payload": "JSONB"},
+    "sqlite": {"trace_id": "TEXT", "span_id": "TEXT", "parent_span_id": "TEXT", "http_status": "INTEGER",
+               "latency_ms": "REAL", "insert_id": "TEXT", "labels": "TEXT", "payload": "TEXT"},
+}
+
+_TRACE_KEYS = ("logging.googleapis.com/trace", "trace_id", "traceId", "trace")
+_SPAN_KEYS = ("logging.googleapis.com/spanId", "span_id", "spanId")
+_PARENT_SPAN_KEYS = ("parent_span_id", "parentSpanId")  # OpenTelemetry-style log correlation
+_STATUS_KEYS = ("status", "http_status", "statusCode", "status_code")
+_LATENCY_MS_KEYS = ("latency_ms", "latencyMs", "duration_ms", "durationMs")
+_LATENCY_KEYS = ("latency", "duration")  # Duration strings ("1.5s") or seconds
+_MESSAGE_KEYS = ("message", "msg", "textPayload")
+
+
+def add_field_columns(cur, backend: str):
+    """Structured columns on logs and their indexes (idempotent)"""
+    types = _COLUMN_TYPES["postgres" if backend == "postgres" else "sqlite"]
+    if backend == "postgres":
+        for column, column_type in types.items():
+            cur.execute(f"ALTER TABLE logs ADD COLUMN IF NOT EXISTS {column} {column_type}")
+    else:
+        cur.execute("PRAGMA table_info(logs)")
+        existing = {row[1] for row in cur.fetchall()}
+        for column, column_type in types.items():
+            if column not in existing:
+                cur.execute(f"ALTER TABLE logs ADD COLUMN {column} {column_type}")
+
+    statements = [
+        "CREATE INDEX IF NOT EXISTS idx_logs_trace_id ON logs (trace_id) WHERE trace_id IS NOT NULL",
+        "CREATE INDEX IF NOT EXISTS idx_logs_insert_id ON logs (insert_id) WHERE insert_id IS NOT NULL",
+        "CREATE INDEX IF NOT EXISTS idx_logs_http ON logs (service, http_status, latency_ms) "
+        "WHERE http_status IS NOT NULL",
+    ]
+    if backend == "postgres":
+        statements += [
+            "CREATE INDEX IF NOT EXISTS idx_logs_labels ON logs USING GIN (labels jsonb_path_ops)",
+            "CREATE INDEX IF NOT EXISTS idx_logs_payload ON logs USING GIN (payload jsonb_path_ops)",
+        ]
+    for statement in statements:
+        cur.execute(statement)
+
+
+# 🔹 Parsing helpers
+def trace_id(value):
+    """'projects/<p>/traces/<id>' -> '<id>'"""
+    if not value:
+        return None
+    return str(value).rsplit("/", 1)[-1] or None
+
+
+def parse_status(value):
+    try:
+        status = int(value)
+    except (TypeError, ValueError):
+        return None
+    return status if 100 <= status <= 599 else None
+
+
+def parse_latency_ms(value):
+    """Duration ('1.5s', '120ms', {'seconds': 1, 'nanos': 5e8}, timedelta, seconds) -> milliseconds"""
+    if value is None or value == "":
+        return None
+    try:
+        if isinstance(value, timedelta):
+            return value.total_seconds() * 1000
+        if isinstance(value, dict):
+            return (float(value.get("seconds", 0)) + float(value.get("nanos", 0)) / 1e9) * 1000
+        if isinstance(value, (int, float)):
+            return float(value) * 1000
+        text = str(value).strip()
+        if text.endswith("ms"):
+            return float(text[:-2])
+        return float(text.rstrip("s")) * 1000
+    except (TypeError, ValueError):
+        return None
+
+
+def _first(mapping: dict, keys):
+    for key in keys:
+        value = mapping.get(key)
+        if value not in (None, ""):
+            return value
+    return None
+
+
+def _http_fields(http_request) -> dict:
+    """status/latency from a Cloud Logging HttpRequest (dict, camelCase or snake_case keys)"""
+    if not http_request:
+        return {}
+    if not isinstance(http_request, dict):
+        http_request = {key: getattr(http_request, key, None) for key in ("status", "latency")}
+    return {
+        "http_status": parse_status(http_request.get("status")),
+        "latency_ms": parse_latency_ms(http_request.get("latency")),
+    }
+
+
+def parse_payload(payload) -> dict:
+    """
+    {raw_log, trace_id, span_id, parent_span_id, http_status, latency_ms, payload} from a jsonPayload dict,
+    a text payload (JSON text is parsed too) or anything else (kept as text).
+    """
+    if isinstance(payload, str) and payload.lstrip().startswith("{"):
+        try:
+            payload = json.loads(payload)
+        except ValueError:
+            pass
+    if not isinstance(payload, dict):
+        return {"raw_log": "" if payload is None else str(payload)}
+
+    fields = _http_fields(payload.get("httpRequest") or payload.get("http_request"))
+    if fields.get("http_status") is None:
+        fields["http_status"] = parse_status(_first(payload, _STATUS_KEYS))
+    if fields.get("latency_ms") is None:
+        latency_ms = _first(payload, _LATENCY_MS_KEYS)
+        try:
+            fields["latency_ms"] = float(latency_ms) if latency_ms is not None else parse_latency_ms(
+                _first(payload, _LATENCY_KEYS))
+        except (TypeError, ValueError):
+            fields["latency_ms"] = None
+    message = _first(payload, _MESSAGE_KEYS)
+    fields.update({
+        "raw_log": str(message) if message is not None else json.dumps(payload, default=str, sort_keys=True),
+        "trace_id": trace_id(_first(payload, _TRACE_KEYS)),
+        "span_id": _first(payload, _SPAN_KEYS),
+        "parent_span_id": _first(payload, _PARENT_SPAN_KEYS),
+        "payload": payload,
+    })
+    return fields
+
+
+def entry_fields(entry) -> dict:
+    """raw_log plus the structured fields of a google-cloud-logging LogEntry"""
+    payload = entry.payload
+    if hasattr(payload, "items") and not isinstance(payload, dict):
+        payload = dict(payload)  # proto Struct / MapComposite
+    fields = parse_payload(payload)
+
+    # Entry-level metadata wins over what the application wrote into its payload
+    for key, value in _http_fields(getattr(entry, "http_request", None)).items():
+        if value is not None:
+            fields[key] = value
+    fields["trace_id"] = trace_id(getattr(entry, "trace", None)) or fields.get("trace_id")
+    fields["span_id"] = getattr(entry, "span_id", None) or fields.get("span_id")
+    fields["insert_id"] = getattr(entry, "insert_id", None)
+    resource = getattr(entry, "resource", None)
+    labels = dict(getattr(resource, "labels", None) or {})
+    labels.update(getattr(entry, "labels", None) or {})
+    fields["labels"] = labels or None
+    return fields
+
+
+# 🔹 Storage
+def field_values(log: dict) -> tuple:
+    """FIELD_COLUMNS values of a log dict, ready to bind (JSON columns serialized)"""
+    values = []
+    for column in FIELD_COLUMNS:
+        value = log.get(column)
+        if column in JSON_COLUMNS and value is not None:
+            value = json.dumps(value, default=str)
+        values.append(value)
+    return tuple(values)
+
+
+def decode_json(value):
+    """JSONB comes back as dict from psycopg2 and as text from SQLite"""
+    if isinstance(value, (str, bytes)):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return None
+    return value
+
+
+def parse_filters(pairs, typed: bool = False) -> dict:
+    """
+    ['region=us-east1', 'status=500'] -> {'region': 'us-east1', 'status': '500'};
+    with `typed`, values are parsed as JSON where possible ('500' -> 500).
+    """
+    filters = {}
+    for pair in pairs or []:
+        key, sep, value = pair.partition("=")
+        if not sep or not key:
+            raise ValueError(f"Invalid filter '{pair}', expected key=value")
+        if not typed:
+            filters[key] = value
+            continue
+        try:
+            filters[key] = json.loads(value)
+        except ValueError:
+            filters[key] = value
+    return filters
@@ -0,0 +1,274 @@
+# log_sources.py
+"""
+Registry of the GCP projects/clusters SmartGuard ingests from, and the worker
+pool that polls them.
+
+Sources come from LOG_SOURCES (inline JSON) or LOG_SOURCES_FILE (a JSON file),
+a list of:
+
+    {"name": "shop-prod", "project": "shop-prod-123", "filter": "severity >= ERROR",
+     "poll_seconds": 60, "slack_webhook": "https://hooks.slack.com/...", "slack_channel": "#shop-alerts",
+     "max_entries": 200, "weight": 1.0, "ai_budget": 20}
+
+Only `name` is required: `project` defaults to the credentials' project,
+`filter` to "severity >= ERROR", the Slack webhook to SLACK_WEBHOOK_URL. Without
+a registry there is one "default" source built from those same defaults.
+
+Each source is an isolated worker: its own Cloud Logging client, cursor (the
+timestamp of the last entry ingested, so entries are read once instead of
+re-reading a fixed window), admission queue and error backoff. A failing or
+slow project only delays itself.
+
+The pool runs at most SOURCE_WORKERS cycles at a time and never two cycles of
+the same source. When more sources are due than workers are free, the one that
+has used the least worker time (divided by its weight) goes first, so a noisy
+source whose cycles are long, or which keeps hitting `max_entries` and comes
+straight back, cannot starve the quiet ones. The scheduling delay, cycle time,
+lag and failures are exported per source (`source` label).
+"""
+
+import inspect
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from admission import AdmissionController, AI_ANALYSIS_BUDGET
+from instrumentation import INGEST_CYCLE_SECONDS, INGEST_FAILURES, INGEST_SCHEDULE_DELAY_SECONDS
+
+# Load environment
+load_dotenv()
+
+LOG_SOURCES = os.getenv("LOG_SOURCES")
+LOG_SOURCES_FILE = os.getenv("LOG_SOURCES_FILE")
+SOURCE_WORKERS = int(os.getenv("SOURCE_WORKERS", "4"))
+SOURCE_POLL_SECONDS = float(os.getenv("SOURCE_POLL_SECONDS", "60"))
+SOURCE_MAX_ENTRIES = int(os.getenv("SOURCE_MAX_ENTRIES", "200"))
+SOURCE_LOOKBACK_MINUTES = float(os.getenv("SOURCE_LOOKBACK_MINUTES", "5"))
+SOURCE_MAX_BACKOFF_SECONDS = float(os.getenv("SOURCE_MAX_BACKOFF_SECONDS", "900"))
+DEFAULT_FILTER = "severity >= ERROR"
+
+
+def to_utc(timestamp):
+    """Aware or naive datetime -> naive UTC (what the cursor and lag arithmetic use)"""
+    if timestamp is None:
+        return None
+    return timestamp.replace(tzinfo=None) - (timestamp.utcoffset() or timedelta(0))
+
+
+class LogSource:
+    """One project/cluster to ingest from, with the state of its worker"""
+
+    def __init__(self, name: str, project: str = None, filter: str = DEFAULT_FILTER,
+                 poll_seconds: float = SOURCE_POLL_SECONDS, slack_webhook: str = None, slack_channel: str = None,
+                 max_entries: int = SOURCE_MAX_ENTRIES, weight: float = 1.0, ai_budget: int = AI_ANALYSIS_BUDGET):
+        if not name:
+            raise ValueError("A log source needs a name")
+        if weight <= 0 or poll_seconds <= 0 or max_entries <= 0:
+            raise ValueError(f"Log source '{name}': weight, poll_seconds and max_entries must be positive")
+        self.name = name
+        self.project = project
+        self.filter = filter or DEFAULT_FILTER
+        self.poll_seconds = float(poll_seconds)
+        self.slack_webhook = slack_webhook or os.getenv("SLACK_WEBHOOK_URL")
+        self.slack_channel = slack_channel
+        self.max_entries = int(max_entries)
+        self.weight = float(weight)
+        self.admission = AdmissionController(budget=ai_budget, name=name)
+
+        # Worker state, only touched by the cycle running for this source (and the pool under its lock)
+        self.cursor = None          # UTC timestamp of the newest entry ingested
+        self.cursor_ids = set()     # insert_ids already ingested at exactly `cursor`
+        self.pending = None         # (cursor, cursor_ids) after the batch being processed
+        self.next_run = 0.0
+        self.used_seconds = 0.0     # worker time consumed / weight: the fair-share clock
+        self.failures = 0
+        self.last_result = None
+        self.last_error = None
+
+    @classmethod
+    def from_dict(cls, config: dict) -> "LogSource":
+        unknown = set(config) - set(inspect.signature(cls).parameters)
+        if unknown:
+            raise ValueError(f"Log source '{config.get('name')}': unknown keys {sorted(unknown)}")
+        return cls(**config)
+
+    # 🔹 Cursor
+    def fetch_filter(self) -> str:
+        """Cloud Logging filter for the entries this source hasn't ingested yet"""
+        since = self.cursor or datetime.utcnow() - timedelta(minutes=SOURCE_LOOKBACK_MINUTES)
+        return f'timestamp >= "{since.isoformat()}Z" AND ({self.filter})'
+
+    def fetch_limit(self) -> int:
+        # Entries at the cursor timestamp come back again (>=), so they don't count against max_entries
+        return self.max_entries + len(self.cursor_ids)
+
+    def unseen(self, entries: list) -> list:
+        """Drop entries already ingested at the cursor timestamp and remember where this batch (oldest first) ends"""
+        fresh = [entry for entry in entries
+                 if not (self.cursor and to_utc(entry.timestamp) == self.cursor and entry.insert_id in self.cursor_ids)]
+        stamped = [entry for entry in entries if entry.timestamp]
+        self.pending = None
+        if stamped:
+            newest = to_utc(stamped[-1].timestamp)
+            ids = {entry.insert_id for entry in stamped if to_utc(entry.timestamp) == newest}
+            self.pending = (newest, ids | self.cursor_ids if newest == self.cursor else ids)
+        return fresh
+
+    def commit(self):
+        """Move the cursor past the fetched batch once it is stored (a failed cycle re-reads it)"""
+        if self.pending:
+            self.cursor, self.cursor_ids = self.pending
+            self.pending = None
+
+    def snapshot(self) -> dict:
+        return {
+            "name": self.name,
+            "project": self.project,
+            "filter": self.filter,
+            "poll_seconds": self.poll_seconds,
+            "slack_channel": self.slack_channel,
+            "cursor": self.cursor.isoformat() + "Z" if self.cursor else None,
+            "failures": self.failures,
+            "last_result": self.last_result,
+            "last_error": self.last_error,
+        }
+
+
+def load_sources(inline: str = LOG_SOURCES, path: str = LOG_SOURCES_FILE) -> list:
+    """Sources from LOG_SOURCES / LOG_SOURCES_FILE, or the single default source"""
+    if inline:
+        configs = json.loads(inline)
+    elif path:
+        with open(path) as f:
+            configs = json.load(f)
+    else:
+        return [LogSource("default")]
+    sources = [LogSource.from_dict(config) for config in configs]
+    names = [source.name for source in sources]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Duplicate log source names in {names}")
+    return sources
+
+
+class SourcePool:
+    """Shared worker pool running one cycle per due source, least-served source first"""
+
+    def __init__(self, sources: list, workers: int = SOURCE_WORKERS, cycle=None, coordinator=None, release=None):
+        self.sources = sources
+        self.workers = max(1, workers)
+        self.cycle = cycle  # callable(source) -> result dict; defaults to smartguard.run_cycle
+        # callable(admission) storing the logs still queued for analysis; defaults to smartguard.flush_admission
+        self.release = release
+        self.coordinator = coordinator  # ingest_leases.LeaseCoordinator with several replicas, None = own everything
+        self.running = set()
+        self.condition = threading.Condition()
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="log-source")
+
+    def _run_cycle(self, source):
+        if self.cycle is None:
+            from smartguard import run_cycle
+            self.cycle = run_cycle
+        return self.cycle(source)
+
+    def release_pending(self, sources=None):
+        """
+        Store the logs still waiting in the admission queues of `sources` (default: all) without analysis,
+        for sources this replica stops polling: at shutdown or when their lease moved to another replica
+        """
+        if self.release is None:
+            from smartguard import flush_admission
+            self.release = flush_admission
+        for source in self.sources if sources is None else sources:
+            if not source.admission.has_pending():
+                continue
+            try:
+                count = self.release(source.admission)
+                print(f"⏭️ [{source.name}] {count} queued logs stored without AI analysis")
+            except Exception as e:
+                print(f"⚠️ Could not store the queued logs of {source.name}: {e}")
+
+    def due(self, now: float) -> list:
+        """Due, idle sources in the order they should get a worker"""
+        ready = [source for source in self.sources if source.name not in self.running and source.next_run <= now
+                 and (self.coordinator is None or self.coordinator.owns(source.name))]
+        return sorted(ready, key=lambda source: (source.used_seconds, source.next_run, source.name))
+
+    def _work(self, source, due_at: float):
+        started = time.monotonic()
+        INGEST_SCHEDULE_DELAY_SECONDS.set(max(0.0, started - due_at), source=source.name)
+        try:
+            with INGEST_CYCLE_SECONDS.time(source=source.name):
+                result = self._run_cycle(source)
+            source.failures, source.last_error = 0, None
+            source.last_result = result
+            if self.coordinator is not None:
+                self.coordinator.save_cursor(source)
+            # A capped fetch means the source is behind: it is due again right away (still in fair-share order)
+            backlog = (result or {}).get("fetched", 0) >= source.max_entries
+            delay = 0.0 if backlog else source.poll_seconds
+        except Exception as e:
+            source.failures += 1
+            source.last_error = str(e)
+            INGEST_FAILURES.inc(source=source.name)
+            delay = min(source.poll_seconds * 2 ** source.failures, SOURCE_MAX_BACKOFF_SECONDS)
+            print(f"⚠️ Log source {source.name} failed ({source.failures}x), retrying in {delay:.0f}s: {e}")
+        finished = time.monotonic()
+        with self.condition:
+            source.used_seconds += (finished - started) / source.weight
+            source.next_run = finished + delay
+            self.running.discard(source.name)
+            self.condition.notify_all()
+
+    def _dispatch(self, now: float):
+        """Hand free workers to due sources (caller holds the condition)"""
+        for source in self.due(now):
+            if len(self.running) >= self.workers:
+                return
+            self.running.add(source.name)
+            self.executor.submit(self._work, source, source.next_run or now)
+
+    def _sync(self):
+        """Renew/claim/hand back leases (no-op without a coordinator); failures only stop polling at lease expiry"""
+        if self.coordinator is None:
+            return
+        with self.condition:
+            busy = set(self.running)
+        try:
+            self.coordinator.sync(self.sources, busy)
+        except Exception as e:
+            print(f"⚠️ Lease renewal failed: {e}")
+        # Sources handed to another replica won't run here again: don't leave their queued logs behind
+        self.release_pending([source for source in self.sources
+                              if source.name not in busy and not self.coordinator.owns(source.name)])
+
+    def run_forever(self, stop: threading.Event = None):
+        """Schedule sources until `stop` is set (SIGTERM/Ctrl-C when run from smartguard.py)"""
+        print(f"🛰️ Polling {len(self.sources)} log source(s) with {self.workers} worker(s)")
+        next_sync = 0.0
+        while stop is None or not stop.is_set():
+            if self.coordinator is not None and time.monotonic() >= next_sync:
+                self._sync()
+                next_sync = time.monotonic() + self.coordinator.renew_seconds
+            with self.condition:
+                now = time.monotonic()
+                self._dispatch(now)
+                idle = [source.next_run for source in self.sources if source.name not in self.running]
+                wait = min(idle) - now if idle else SOURCE_POLL_SECONDS
+                self.condition.wait(timeout=min(max(wait, 0.05), 1.0))
+        self.executor.shutdown(wait=True)
+
+    def run_once(self) -> dict:
+        """One cycle of every source this replica holds (through the pool), {name: result or error}"""
+        self._sync()
+        sources = [source for source in self.sources
+                   if self.coordinator is None or self.coordinator.owns(source.name)]
+        with self.condition:
+            self.running.update(source.name for source in sources)
+        now = time.monotonic()
+        for future in [self.executor.submit(self._work, source, now) for source in sources]:
+            future.result()
+        return {source.name: source.last_result if source.last_error is None else {"error": source.last_error}
+                for source in sources}
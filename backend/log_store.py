@@ -0,0 +1,639 @@
+# log_store.py
+"""
+Shared log store behind the API endpoints.
+
+With several API worker processes nothing that matters may live in one
+process' memory, so logs and cached aggregates are kept in:
+- Postgres (LOG_STORE=postgres): the `logs` table written by smartguard.py, or
+- a local SQLite file (LOG_STORE=sqlite, the default): an on-disk stand-in
+  shared by every worker on the host and seeded with demo logs.
+
+Queries are written once with `%s` placeholders and translated for SQLite.
+"""
+
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from instrumentation import CACHE_REQUESTS, DB_QUERY_SECONDS
+from payload_store import (payload_store, add_payload_column, search_clause as payload_search_clause,
+                           schema_statements as payload_schema_statements)
+from log_fields import FIELD_COLUMNS, JSON_COLUMNS, add_field_columns, decode_json, field_values
+
+# Load environment
+load_dotenv()
+
+LOG_STORE = os.getenv("LOG_STORE", "sqlite").lower()
+SQLITE_PATH = os.getenv("SMARTGUARD_STATE_DB", os.path.join(tempfile.gettempdir(), "smartguard_state.db"))
+# Demo logs are only seeded into the local stand-in unless asked for explicitly
+SEED_SAMPLE_LOGS = os.getenv("SEED_SAMPLE_LOGS", "true" if LOG_STORE == "sqlite" else "false").lower() == "true"
+SAMPLE_LOG_COUNT = int(os.getenv("SAMPLE_LOG_COUNT", "100"))
+SAMPLE_LOGS_MAX_AGE_HOURS = float(os.getenv("SAMPLE_LOGS_MAX_AGE_HOURS", "12"))
+SHARED_CACHE_TTL_SECONDS = float(os.getenv("SHARED_CACHE_TTL_SECONDS", "30"))
+SHARED_CACHE_PURGE_SECONDS = float(os.getenv("SHARED_CACHE_PURGE_SECONDS", "300"))
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "5"))
+
+DB_HOST = os.getenv("DB_HOST", "postgres")
+DB_PORT = os.getenv("DB_PORT", "5432")
+DB_NAME = os.getenv("DB_NAME", "smartguard")
+DB_USER = os.getenv("DB_USER", "postgres")
+DB_PASSWORD = os.getenv("DB_PASSWORD", "password")
+# Read-only replica for dashboard reads (see read_replica.py); empty = read from the primary
+DB_READ_HOST = os.getenv("DB_READ_HOST", "")
+DB_READ_PORT = os.getenv("DB_READ_PORT", DB_PORT)
+# Server-side cap on every dashboard read statement, 0 = none
+READ_STATEMENT_TIMEOUT_MS = int(os.getenv("READ_STATEMENT_TIMEOUT_MS", "15000"))
+
+LOG_COLUMNS = ["id", "timestamp", "service", "severity", "raw_log", "ai_summary"]
+SELECT_COLUMNS = ", ".join(LOG_COLUMNS + FIELD_COLUMNS + ["payload_hash"])
+SEED_LOCK_ID = 2024061501
+
+
+_TABLE_PATTERN = re.compile(r"\b(?:FROM|INTO|UPDATE)\s+(\w+)", re.I)
+
+
+def _operation(query: str) -> str:
+    """Metric label for a query: its verb and first table, e.g. 'select logs'"""
+    verb = query.split(None, 1)[0].lower() if query.strip() else "unknown"
+    table = _TABLE_PATTERN.search(query)
+    return f"{verb} {table.group(1)}" if table else verb
+
+
+def _iso(value):
+    """Timestamps come back as datetime from Postgres and as ISO text from SQLite"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def service_stats_from(counts):
+    """[(service, severity, count, last_seen)] -> {service: {total, errors, last_seen}}"""
+    stats = {}
+    for service, severity, count, last_seen in counts:
+        entry = stats.setdefault(service, {"total": 0, "errors": 0, "last_seen": None})
+        entry["total"] += count
+        if severity == "ERROR":
+            entry["errors"] += count
+        if last_seen and (entry["last_seen"] is None or last_seen > entry["last_seen"]):
+            entry["last_seen"] = last_seen
+    return stats
+
+
+class LogStore:
+    """Connection handling and the read/aggregate queries used by api.py"""
+
+    def __init__(self, backend: str = LOG_STORE, host: str = DB_HOST, port: str = DB_PORT,
+                 statement_timeout_ms: int = 0, read_only: bool = False):
+        self.backend = backend
+        self.host = host
+        self.port = port
+        self.statement_timeout_ms = statement_timeout_ms
+        self.read_only = read_only
+        self.local = threading.local()
+        self.pool = None
+        self.pool_lock = threading.Lock()
+        self.schema_ready = False
+
+    # 🔹 Connections
+    def _reset_after_fork(self):
+        # Connections must never be shared between a parent and forked workers
+        self.local = threading.local()
+        self.pool = None
+        self.pool_lock = threading.Lock()
+
+    def server_settings(self) -> dict:
+        """Session settings for this store's Postgres connections"""
+        settings = {}
+        if self.statement_timeout_ms:
+            settings["statement_timeout"] = str(self.statement_timeout_ms)
+        if self.read_only:
+            settings["default_transaction_read_only"] = "on"
+        return settings
+
+    def _pg_pool(self):
+        if self.pool is None:
+            with self.pool_lock:
+                if self.pool is None:
+                    from psycopg2.pool import ThreadedConnectionPool
+                    options = " ".join(f"-c {name}={value}" for name, value in self.server_settings().items())
+                    self.pool = ThreadedConnectionPool(
+                        1, DB_POOL_SIZE,
+                        host=self.host, port=self.port, dbname=DB_NAME,
+                        user=DB_USER, password=DB_PASSWORD,
+                        connect_timeout=DB_CONNECT_TIMEOUT, options=options or None,
+                    )
+        return self.pool
+
+    def _sqlite_conn(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(SQLITE_PATH, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Yield a DB-API connection; commits on success, rolls back on error"""
+        if self.backend == "postgres":
+            pool = self._pg_pool()
+            conn = pool.getconn()
+            try:
+                yield conn
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                pool.putconn(conn)
+        else:
+            conn = self._sqlite_conn()
+            try:
+                yield conn
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    @contextmanager
+    def locked_transaction(self, lock_id: int, wait: bool = True):
+        """
+        Yield a cursor inside a transaction that holds a cross-process lock
+        (Postgres advisory xact lock / SQLite write lock), released on commit.
+        With wait=False, yields None instead of waiting when the lock is taken.
+        """
+        with self.connection() as conn:
+            if self.backend == "sqlite":
+                conn.isolation_level = None  # manage the transaction explicitly
+                if not wait:
+                    conn.execute("PRAGMA busy_timeout = 0")
+            cur = conn.cursor()
+            try:
+                acquired = True
+                if self.backend == "postgres":
+                    if wait:
+                        cur.execute("SELECT pg_advisory_xact_lock(%s)", (lock_id,))
+                    else:
+                        cur.execute("SELECT pg_try_advisory_xact_lock(%s)", (lock_id,))
+                        acquired = cur.fetchone()[0]
+                else:
+                    try:
+                        cur.execute("BEGIN IMMEDIATE")
+                    except sqlite3.OperationalError:
+                        if wait:
+                            raise
+                        acquired = False
+                yield cur if acquired else None
+                if self.backend == "sqlite" and acquired:
+                    cur.execute("COMMIT")
+            except Exception:
+                if self.backend == "sqlite" and conn.in_transaction:
+                    cur.execute("ROLLBACK")
+                raise
+            finally:
+                cur.close()
+                if self.backend == "sqlite":
+                    conn.isolation_level = ""
+                    conn.execute("PRAGMA busy_timeout = 30000")
+
+    def sql(self, query: str) -> str:
+        return query if self.backend == "postgres" else query.replace("%s", "?")
+
+    def ts(self, value: datetime):
+        """Bind a datetime the way the backend stores it"""
+        return value if self.backend == "postgres" else value.isoformat()
+
+    def fetchall(self, query: str, params=()):
+        with DB_QUERY_SECONDS.time(backend=self.backend, operation=_operation(query)), self.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(self.sql(query), params)
+            rows = cur.fetchall()
+            cur.close()
+            return rows
+
+    def execute(self, query: str, params=()):
+        with DB_QUERY_SECONDS.time(backend=self.backend, operation=_operation(query)), self.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(self.sql(query), params)
+            cur.close()
+
+    # 🔹 Schema & startup
+    def init_schema(self):
+        """Create the logs/cache/state tables (idempotent)"""
+        if self.backend == "postgres":
+            statements = [
+                """CREATE TABLE IF NOT EXISTS logs (
+                    id SERIAL PRIMARY KEY,
+                    timestamp TIMESTAMP,
+                    service TEXT,
+                    severity TEXT,
+                    raw_log TEXT,
+                    ai_summary TEXT
+                )""",
+                "CREATE TABLE IF NOT EXISTS shared_cache (key TEXT PRIMARY KEY, value TEXT, expires_at DOUBLE PRECISION)",
+            ]
+        else:
+            statements = [
+                """CREATE TABLE IF NOT EXISTS logs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    timestamp TEXT,
+                    service TEXT,
+                    severity TEXT,
+                    raw_log TEXT,
+                    ai_summary TEXT
+                )""",
+                "CREATE TABLE IF NOT EXISTS shared_cache (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)",
+            ]
+        statements += [
+            "CREATE TABLE IF NOT EXISTS app_state (key TEXT PRIMARY KEY, value TEXT)",
+            # Hourly counts of logs removed by retention (hour is 'YYYY-MM-DD HH:00')
+            """CREATE TABLE IF NOT EXISTS log_rollups (
+                hour TEXT NOT NULL,
+                service TEXT NOT NULL,
+                severity TEXT NOT NULL,
+                count BIGINT NOT NULL,
+                PRIMARY KEY (hour, service, severity)
+            )""",
+            # Service call graph maintained incrementally from trace links (service_graph.py)
+            """CREATE TABLE IF NOT EXISTS service_edges (
+                caller TEXT NOT NULL,
+                callee TEXT NOT NULL,
+                calls BIGINT NOT NULL,
+                errors BIGINT NOT NULL,
+                last_seen TEXT NOT NULL,
+                PRIMARY KEY (caller, callee)
+            )""",
+            # Ingest monitor replicas and their leases on log sources (ingest_leases.py)
+            """CREATE TABLE IF NOT EXISTS ingest_members (
+                member TEXT PRIMARY KEY,
+                heartbeat_at DOUBLE PRECISION NOT NULL
+            )""",
+            """CREATE TABLE IF NOT EXISTS ingest_leases (
+                source TEXT PRIMARY KEY,
+                owner TEXT,
+                expires_at DOUBLE PRECISION NOT NULL DEFAULT 0,
+                cursor TEXT
+            )""",
+            "CREATE INDEX IF NOT EXISTS idx_logs_timestamp ON logs (timestamp)",
+            "CREATE INDEX IF NOT EXISTS idx_logs_service_severity ON logs (service, severity)",
+        ] + payload_schema_statements(self.backend)
+        with self.connection() as conn:
+            cur = conn.cursor()
+            for statement in statements:
+                cur.execute(statement)
+            add_payload_column(cur, self.backend)
+            add_field_columns(cur, self.backend)
+            cur.close()
+        self.schema_ready = True
+
+    def _lock_for_seeding(self, cur):
+        """Serialize seeding across worker processes for the rest of the transaction"""
+        if self.backend == "postgres":
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (SEED_LOCK_ID,))
+        else:
+            cur.execute("BEGIN IMMEDIATE")
+
+    def bootstrap(self, sample_factory, reset: bool = False):
+        """
+        One-time startup work: create tables and (in demo mode) seed sample logs.
+        Safe to call from every worker; only one of them does the seeding.
+        """
+        self.init_schema()
+        if not SEED_SAMPLE_LOGS:
+            return
+
+        with self.connection() as conn:
+            if self.backend == "sqlite":
+                conn.isolation_level = None  # manage the transaction explicitly
+            cur = conn.cursor()
+            try:
+                self._lock_for_seeding(cur)
+                cur.execute(self.sql("SELECT value FROM app_state WHERE key = %s"), ("sample_seeded_at",))
+                row = cur.fetchone()
+                cur.execute("SELECT COUNT(*) FROM logs")
+                existing = cur.fetchone()[0]
+                stale = row is None or time.time() - float(row[0]) > SAMPLE_LOGS_MAX_AGE_HOURS * 3600
+
+                # Never wipe a real Postgres table, only top up an empty one
+                if self.backend == "postgres":
+                    reseed = existing == 0
+                else:
+                    reseed = reset or stale or existing == 0
+
+                if reseed:
+                    if self.backend == "sqlite":
+                        cur.execute("DELETE FROM logs")
+                        cur.execute("DELETE FROM service_edges")
+                    self._insert(cur, sample_factory(SAMPLE_LOG_COUNT))
+                    cur.execute("DELETE FROM shared_cache")
+                    cur.execute(self.sql("DELETE FROM app_state WHERE key = %s"), ("sample_seeded_at",))
+                    cur.execute(self.sql("INSERT INTO app_state (key, value) VALUES (%s, %s)"),
+                                ("sample_seeded_at", str(time.time())))
+                    print(f"✅ Seeded {SAMPLE_LOG_COUNT} sample logs into the {self.backend} log store")
+                if self.backend == "sqlite":
+                    cur.execute("COMMIT")
+            except Exception:
+                if self.backend == "sqlite":
+                    cur.execute("ROLLBACK")
+                raise
+            finally:
+                cur.close()
+                if self.backend == "sqlite":
+                    conn.isolation_level = ""
+
+    # 🔹 Writes
+    def _insert(self, cur, logs):
+        rows = []
+        for log in logs:
+            # Large payloads are stored once in log_payloads; the row keeps a preview + hash
+            raw_log, payload_hash = payload_store.prepare(cur, log["raw_log"], self.sql, self.backend)
+            rows.append((log["timestamp"], log["service"], log["severity"], raw_log, log["ai_summary"], payload_hash)
+                        + field_values(log))
+        columns = ["timestamp", "service", "severity", "raw_log", "ai_summary", "payload_hash"] + FIELD_COLUMNS
+        cur.executemany(
+            self.sql(f"INSERT INTO logs ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})"),
+            rows,
+        )
+
+    def insert_logs(self, logs):
+        with DB_QUERY_SECONDS.time(backend=self.backend, operation="insert logs"), self.connection() as conn:
+            cur = conn.cursor()
+            self._insert(cur, logs)
+            cur.close()
+
+    # 🔹 Reads
+    def rows_to_logs(self, rows):
+        """Rows selected with SELECT_COLUMNS -> log dicts, with deduplicated payloads resolved"""
+        logs = self.log_dicts(rows)
+        payload_store.resolve(logs, self.fetchall)
+        return self.finish_logs(logs)
+
+    def log_dicts(self, rows):
+        """Rows selected with SELECT_COLUMNS -> log dicts (payloads not resolved yet)"""
+        columns = LOG_COLUMNS + FIELD_COLUMNS + ["payload_hash"]
+        return [dict(zip(columns, (row[0], _iso(row[1])) + tuple(row[2:]))) for row in rows]
+
+    def finish_logs(self, logs):
+        """Drop the payload hash and decode JSON columns once payloads are resolved"""
+        for log in logs:
+            log.pop("payload_hash", None)
+            for column in JSON_COLUMNS:
+                log[column] = decode_json(log[column])
+        return logs
+
+    def _where(self, services=None, severities=None, since=None, text=None, trace_id=None,
+               status_min=None, status_max=None, min_latency_ms=None, labels=None, payload=None, until=None):
+        clauses, params = [], []
+        if services:
+            clauses.append("service IN (" + ", ".join(["%s"] * len(services)) + ")")
+            params.extend(services)
+        if severities:
+            clauses.append("severity IN (" + ", ".join(["%s"] * len(severities)) + ")")
+            params.extend(severities)
+        if since is not None:
+            clauses.append("timestamp >= %s")
+            params.append(self.ts(since))
+        if until is not None:
+            clauses.append("timestamp < %s")
+            params.append(self.ts(until))
+        if text:
+            # raw_log only holds a preview of deduplicated payloads: their full text is matched too
+            clauses.append(f"(LOWER(ai_summary) LIKE %s OR LOWER(raw_log) LIKE %s OR {payload_search_clause()})")
+            pattern = f"%{text.lower()}%"
+            params.extend([pattern, pattern, pattern])
+        # Structured fields (indexed columns, JSONB containment / json_extract)
+        if trace_id:
+            clauses.append("trace_id = %s")
+            params.append(trace_id)
+        if status_min is not None:
+            clauses.append("http_status >= %s")
+            params.append(status_min)
+        if status_max is not None:
+            clauses.append("http_status <= %s")
+            params.append(status_max)
+        if min_latency_ms is not None:
+            clauses.append("latency_ms >= %s")
+            params.append(min_latency_ms)
+        for column, match in (("labels", labels), ("payload", payload)):
+            if not match:
+                continue
+            if self.backend == "postgres":
+                clauses.append(f"{column} @> %s::jsonb")
+                params.append(json.dumps(match))
+            else:
+                for key, value in match.items():
+                    clauses.append(f"json_extract({column}, %s) = %s")
+                    params.extend([f'$."{key}"', value])
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def get_logs(self, service=None, severity=None, limit=20, offset=0):
+        """Most recent logs first, optionally filtered by service/severity"""
+        return self.filter_logs(
+            services=[service] if service else None,
+            severities=[severity] if severity else None,
+            limit=limit, offset=offset, with_total=False,
+        )
+
+    def filter_logs(self, services=None, severities=None, since=None, text=None,
+                    limit=20, offset=0, with_total=True, **fields):
+        """
+        Filtered logs, plus the total match count when `with_total` is set.
+        `fields`: until, trace_id, status_min, status_max, min_latency_ms, labels / payload ({key: value} to match)
+        """
+        where, params = self._where(services, severities, since, text, **fields)
+        rows = self.fetchall(
+            f"SELECT {SELECT_COLUMNS} FROM logs{where} ORDER BY timestamp DESC, id DESC LIMIT %s OFFSET %s",
+            tuple(params) + (limit, offset),
+        )
+        logs = self.rows_to_logs(rows)
+        if not with_total:
+            return logs
+        total = self.fetchall(f"SELECT COUNT(*) FROM logs{where}", tuple(params))[0][0]
+        return logs, total
+
+    def severity_counts(self):
+        return {severity: count for severity, count in
+                self.fetchall("SELECT severity, COUNT(*) FROM logs GROUP BY severity")}
+
+    def service_severity_counts(self, since=None):
+        """[(service, severity, count, last_seen)] for every service/severity pair"""
+        where, params = self._where(since=since)
+        rows = self.fetchall(
+            f"SELECT service, severity, COUNT(*), MAX(timestamp) FROM logs{where} GROUP BY service, severity",
+            tuple(params),
+        )
+        return [(service, severity, count, _iso(last_seen)) for service, severity, count, last_seen in rows]
+
+    def service_stats(self):
+        """{service: {total, errors, last_seen}}"""
+        return service_stats_from(self.service_severity_counts())
+
+    def logs_since(self, since):
+        """All logs newer than `since`, oldest first (timeline building)"""
+        where, params = self._where(since=since)
+        rows = self.fetchall(
+            f"SELECT {SELECT_COLUMNS} FROM logs{where} ORDER BY timestamp",
+            tuple(params),
+        )
+        return self.rows_to_logs(rows)
+
+    # 🔹 Live updates (see live_updates.py)
+    def max_log_id(self) -> int:
+        return self.fetchall("SELECT MAX(id) FROM logs")[0][0] or 0
+
+    def logs_after(self, after_id: int, limit: int = 500):
+        """Light log dicts with id > after_id, oldest first"""
+        columns = ["id", "timestamp", "service", "severity", "raw_log", "ai_summary", "trace_id"]
+        rows = self.fetchall(f"SELECT {', '.join(columns)} FROM logs WHERE id > %s ORDER BY id LIMIT %s",
+                             (after_id, limit))
+        return [dict(zip(columns, row[:1] + (_iso(row[1]),) + row[2:])) for row in rows]
+
+    # 🔹 Spans (trace correlation, see correlation.py)
+    def span_logs(self, since, severities=("ERROR", "WARNING")):
+        """Light log dicts (raw_log is the stored preview) for the given severities, oldest first"""
+        columns = ["id", "timestamp", "service", "severity", "raw_log", "ai_summary", "trace_id", "span_id",
+                   "parent_span_id", "http_status", "latency_ms"]
+        where, params = self._where(severities=list(severities), since=since)
+        rows = self.fetchall(f"SELECT {', '.join(columns)} FROM logs{where} ORDER BY timestamp", tuple(params))
+        return [dict(zip(columns, row[:1] + (_iso(row[1]),) + row[2:])) for row in rows]
+
+    def trace_spans(self, trace_ids):
+        """[(trace_id, span_id, parent_span_id, service, severity)] for every log of the given traces"""
+        trace_ids = list(trace_ids)
+        spans = []
+        for start in range(0, len(trace_ids), 500):
+            chunk = trace_ids[start:start + 500]
+            spans += self.fetchall(
+                "SELECT trace_id, span_id, parent_span_id, service, severity FROM logs "
+                f"WHERE trace_id IN ({', '.join(['%s'] * len(chunk))})",
+                tuple(chunk),
+            )
+        return spans
+
+    def hourly_severity_counts(self, since):
+        """[(hour 'YYYY-MM-DD HH:00', severity, count)] newest hour first"""
+        if self.backend == "postgres":
+            hour = "to_char(date_trunc('hour', timestamp), 'YYYY-MM-DD HH24:00')"
+        else:
+            hour = "strftime('%Y-%m-%d %H:00', timestamp)"
+        where, params = self._where(since=since)
+        return self.fetchall(
+            f"SELECT {hour} AS hour, severity, COUNT(*) FROM logs{where} GROUP BY hour, severity ORDER BY hour DESC",
+            tuple(params),
+        )
+
+    def _bucket(self) -> str:
+        """SQL for the index of the epoch-aligned bucket of a log's timestamp (one %s: bucket seconds)"""
+        if self.backend == "postgres":
+            return "FLOOR(EXTRACT(EPOCH FROM timestamp) / %s)"
+        # julianday() is fractional days; round to milliseconds so boundary rows don't slip a bucket
+        return "CAST(ROUND((julianday(timestamp) - 2440587.5) * 86400000) AS INTEGER) / (%s * 1000)"
+
+    def bucket_severity_counts(self, since, bucket_seconds: int):
+        """[(bucket start 'YYYY-MM-DD HH:MM', severity, count)] in epoch-aligned buckets of `bucket_seconds`"""
+        where, params = self._where(since=since)
+        rows = self.fetchall(
+            f"SELECT {self._bucket()} AS bucket, severity, COUNT(*) FROM logs{where} GROUP BY bucket, severity",
+            (bucket_seconds,) + tuple(params),
+        )
+        epoch = datetime(1970, 1, 1)
+        return [((epoch + timedelta(seconds=int(index) * bucket_seconds)).strftime("%Y-%m-%d %H:%M"), severity, count)
+                for index, severity, count in rows]
+
+    def bucket_events(self, since, bucket_seconds: int, per_bucket: int, severities=("ERROR", "WARNING")):
+        """
+        Light log dicts (timestamp, service, severity, raw_log preview, ai_summary) of the given severities:
+        at most `per_bucket` per epoch-aligned bucket, errors first, then newest (timeline representatives)
+        """
+        columns = ["timestamp", "service", "severity", "raw_log", "ai_summary"]
+        where, params = self._where(severities=list(severities), since=since)
+        rows = self.fetchall(
+            f"""SELECT {', '.join(columns)} FROM (
+                    SELECT {', '.join(columns)}, ROW_NUMBER() OVER (
+                        PARTITION BY {self._bucket()}
+                        ORDER BY CASE WHEN severity = 'ERROR' THEN 0 ELSE 1 END, timestamp DESC) AS rank
+                    FROM logs{where}) ranked
+                WHERE rank <= %s""",
+            (bucket_seconds,) + tuple(params) + (per_bucket,),
+        )
+        return [dict(zip(columns, (_iso(row[0]),) + row[1:])) for row in rows]
+
+    # 🔹 Rollups (downsampled history of logs deleted by retention)
+    def add_rollups(self, cur, counts: dict):
+        """Add {(hour, service, severity): count} to log_rollups inside the caller's transaction"""
+        if not counts:
+            return
+        cur.executemany(
+            self.sql("""INSERT INTO log_rollups (hour, service, severity, count) VALUES (%s, %s, %s, %s)
+                        ON CONFLICT (hour, service, severity) DO UPDATE SET count = log_rollups.count + EXCLUDED.count"""),
+            [(hour, service, severity, count) for (hour, service, severity), count in counts.items()],
+        )
+
+    def rollup_hourly_severity_counts(self, since=None):
+        """[(hour, severity, count)] from log_rollups, same shape as hourly_severity_counts"""
+        where, params = "", ()
+        if since is not None:
+            where, params = " WHERE hour >= %s", (since.strftime("%Y-%m-%d %H:00"),)
+        return self.fetchall(
+            f"SELECT hour, severity, SUM(count) FROM log_rollups{where} GROUP BY hour, severity ORDER BY hour DESC",
+            params,
+        )
+
+    def rollup_service_severity_counts(self):
+        """[(service, severity, count)] over all rolled-up history"""
+        return self.fetchall("SELECT service, severity, SUM(count) FROM log_rollups GROUP BY service, severity")
+
+    # 🔹 App state (small key/value settings shared by all workers)
+    def get_state(self, key: str, default=None):
+        rows = self.fetchall("SELECT value FROM app_state WHERE key = %s", (key,))
+        return rows[0][0] if rows else default
+
+    def set_state(self, key: str, value: str, cur=None):
+        """Upsert a state value, inside the caller's transaction when `cur` is given"""
+        query = self.sql("""INSERT INTO app_state (key, value) VALUES (%s, %s)
+                            ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value""")
+        if cur is not None:
+            cur.execute(query, (key, value))
+        else:
+            self.execute(query, (key, value))
+
+    # 🔹 Shared cache (replaces per-process lru_cache)
+    def cached(self, key: str, compute, ttl: float = SHARED_CACHE_TTL_SECONDS, store_if=None):
+        """
+        Return the cached JSON value for `key`, recomputing it when expired.
+        With `store_if`, only values for which it returns True are cached.
+        """
+        now = time.time()
+        name = key.split(":", 1)[0]  # metric label without per-request parameters
+        rows = self.fetchall("SELECT value, expires_at FROM shared_cache WHERE key = %s", (key,))
+        if rows and rows[0][1] > now:
+            CACHE_REQUESTS.inc(cache=name, result="hit")
+            return json.loads(rows[0][0])
+
+        CACHE_REQUESTS.inc(cache=name, result="miss")
+        value = compute()
+        if store_if is not None and not store_if(value):
+            return value
+        self.execute(
+            """INSERT INTO shared_cache (key, value, expires_at) VALUES (%s, %s, %s)
+               ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value, expires_at = EXCLUDED.expires_at""",
+            (key, json.dumps(value, default=str), now + ttl),
+        )
+        return value
+
+    def purge_cache(self):
+        """Delete expired shared_cache rows (keys carry request parameters, so most are never read again)"""
+        self.execute("DELETE FROM shared_cache WHERE expires_at < %s", (time.time(),))
+
+
+# Global instance
+log_store = LogStore()
+os.register_at_fork(after_in_child=log_store._reset_after_fork)
@@ -0,0 +1,234 @@
+# payload_store.py
+"""
+Deduplicated, compressed storage for large raw log payloads.
+
+The same stack traces arrive thousands of times. A raw_log longer than
+PAYLOAD_DEDUP_MIN_BYTES is stored once in `log_payloads`, keyed by its SHA-256,
+and compressed (zstd when the `zstandard` package is installed, zlib
+otherwise) if it is larger than PAYLOAD_COMPRESS_MIN_BYTES. The `logs` row
+keeps a short preview in raw_log plus `payload_hash`; the payload row also
+keeps the lowercased body uncompressed in `search_text`, so text search
+(`search_clause`) matches the whole body, not just the preview.
+
+Garbage collection takes PAYLOAD_LOCK_ID exclusively while writers hold it
+shared (Postgres), so a payload can't be deleted between a writer's upsert and
+the commit of the log row that references it. SQLite serializes writes anyway.
+
+Reads are transparent: `resolve()` swaps previews for the full bodies, with an
+in-process LRU cache since hot payloads repeat.
+"""
+
+import hashlib
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from dotenv import load_dotenv
+from instrumentation import Counter
+
+# Load environment
+load_dotenv()
+
+PAYLOAD_DEDUP_MIN_BYTES = int(os.getenv("PAYLOAD_DEDUP_MIN_BYTES", "512"))
+PAYLOAD_COMPRESS_MIN_BYTES = int(os.getenv("PAYLOAD_COMPRESS_MIN_BYTES", "1024"))
+PAYLOAD_PREVIEW_CHARS = int(os.getenv("PAYLOAD_PREVIEW_CHARS", "200"))
+PAYLOAD_CACHE_SIZE = int(os.getenv("PAYLOAD_CACHE_SIZE", "2048"))
+PAYLOAD_LOCK_ID = 2024061506
+
+try:
+    import zstandard
+    CODEC = "zstd"
+except ImportError:
+    zstandard = None
+    CODEC = "zlib"
+
+PAYLOAD_BYTES = Counter(
+    "smartguard_payload_bytes_total",
+    "Raw log bytes written, by kind: raw (before), stored (new payloads and search text), deduplicated (skipped)",
+    ["kind"])
+
+_ORPHANS = "FROM log_payloads p WHERE NOT EXISTS (SELECT 1 FROM logs WHERE logs.payload_hash = p.hash)"
+_SIZE = "LENGTH(body) + COALESCE(LENGTH(search_text), 0)"
+
+
+def schema_statements(backend: str) -> list:
+    """DDL for log_payloads; the logs.payload_hash column is added by `add_payload_column`"""
+    blob = "BYTEA" if backend == "postgres" else "BLOB"
+    return [
+        f"""CREATE TABLE IF NOT EXISTS log_payloads (
+            hash TEXT PRIMARY KEY,
+            encoding TEXT NOT NULL,
+            body {blob} NOT NULL,
+            size INTEGER NOT NULL,
+            search_text TEXT
+        )""",
+    ]
+
+
+def add_payload_column(cur, backend: str):
+    """logs.payload_hash (nullable: small logs stay inline), and search_text on payloads stored before it existed"""
+    sql = (lambda query: query) if backend == "postgres" else (lambda query: query.replace("%s", "?"))
+    if backend == "postgres":
+        cur.execute("ALTER TABLE logs ADD COLUMN IF NOT EXISTS payload_hash TEXT")
+        cur.execute("ALTER TABLE log_payloads ADD COLUMN IF NOT EXISTS search_text TEXT")
+    else:
+        cur.execute("PRAGMA table_info(logs)")
+        if "payload_hash" not in [row[1] for row in cur.fetchall()]:
+            cur.execute("ALTER TABLE logs ADD COLUMN payload_hash TEXT")
+        cur.execute("PRAGMA table_info(log_payloads)")
+        if "search_text" not in [row[1] for row in cur.fetchall()]:
+            cur.execute("ALTER TABLE log_payloads ADD COLUMN search_text TEXT")
+    # Lets retention find orphaned payloads without scanning logs
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_logs_payload_hash ON logs (payload_hash)")
+    while True:
+        cur.execute("SELECT hash, encoding, body FROM log_payloads WHERE search_text IS NULL LIMIT 500")
+        rows = cur.fetchall()
+        if not rows:
+            break
+        cur.executemany(sql("UPDATE log_payloads SET search_text = %s WHERE hash = %s"),
+                        [(decode(encoding, body).lower(), digest) for digest, encoding, body in rows])
+
+
+def search_clause():
+    """SQL condition on logs matching a lowercased LIKE pattern (one %s) anywhere in a deduplicated payload"""
+    return "payload_hash IN (SELECT hash FROM log_payloads WHERE search_text LIKE %s)"
+
+
+def encode(text: str):
+    """(encoding, bytes) for a payload body"""
+    data = text.encode("utf-8")
+    if len(data) < PAYLOAD_COMPRESS_MIN_BYTES:
+        return "plain", data
+    if CODEC == "zstd":
+        return "zstd", zstandard.ZstdCompressor(level=6).compress(data)
+    return "zlib", zlib.compress(data, 6)
+
+
+def decode(encoding: str, body) -> str:
+    body = bytes(body)  # psycopg2 returns memoryview for BYTEA
+    if encoding == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstd-compressed payload found but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(body).decode("utf-8")
+    if encoding == "zlib":
+        return zlib.decompress(body).decode("utf-8")
+    return body.decode("utf-8")
+
+
+class PayloadStore:
+    """Writes payloads once and resolves previews back to full bodies"""
+
+    def __init__(self, cache_size: int = PAYLOAD_CACHE_SIZE):
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.encoded = OrderedDict()  # digest -> (encoding, body): repeats skip recompression
+        self.lock = threading.Lock()
+
+    def _remember(self, cache: OrderedDict, digest: str, value):
+        with self.lock:
+            cache[digest] = value
+            cache.move_to_end(digest)
+            while len(cache) > self.cache_size:
+                cache.popitem(last=False)
+
+    def prepare(self, cur, raw_log, sql=lambda query: query, backend: str = "postgres"):
+        """
+        Store a large payload (deduplicated) using the caller's cursor/transaction, which must insert
+        the logs row before committing. Returns (raw_log value for the logs row, payload_hash or None).
+        """
+        if raw_log is None:
+            return None, None
+        size = len(raw_log.encode("utf-8"))
+        PAYLOAD_BYTES.inc(size, kind="raw")
+        if size < PAYLOAD_DEDUP_MIN_BYTES:
+            return raw_log, None
+
+        digest = hashlib.sha256(raw_log.encode("utf-8")).hexdigest()
+        with self.lock:
+            encoded = self.encoded.get(digest)
+        encoding, body = encoded or encode(raw_log)
+        if backend == "postgres":
+            # Held until commit: garbage collection can't delete the payload before the logs row exists
+            cur.execute("SELECT pg_advisory_xact_lock_shared(%s)", (PAYLOAD_LOCK_ID,))
+        # Always upsert (cheap primary key hit) so rolled back or purged payloads are rewritten
+        cur.execute(
+            sql("INSERT INTO log_payloads (hash, encoding, body, size, search_text) VALUES (%s, %s, %s, %s, %s) "
+                "ON CONFLICT (hash) DO NOTHING"),
+            (digest, encoding, body, size, raw_log.lower()),
+        )
+        if cur.rowcount == 1:
+            PAYLOAD_BYTES.inc(len(body) + size, kind="stored")  # body plus its search_text
+        else:
+            PAYLOAD_BYTES.inc(size, kind="deduplicated")
+        self._remember(self.encoded, digest, (encoding, body))
+        self._remember(self.cache, digest, raw_log)
+        return raw_log[:PAYLOAD_PREVIEW_CHARS], digest
+
+    def resolve(self, logs: list, fetchall) -> list:
+        """Replace previews with full payloads for logs carrying a `payload_hash`"""
+        bodies, missing = self._cached_bodies(logs)
+        rows = []
+        for start in range(0, len(missing), 500):
+            chunk = missing[start:start + 500]
+            rows += fetchall(
+                f"SELECT hash, encoding, body FROM log_payloads WHERE hash IN ({', '.join(['%s'] * len(chunk))})",
+                tuple(chunk),
+            )
+        return self._fill(logs, bodies, rows)
+
+    async def resolve_async(self, logs: list, fetch) -> list:
+        """resolve() on an asyncpg connection (`fetch(query, *args)`, Postgres only)"""
+        bodies, missing = self._cached_bodies(logs)
+        rows = []
+        if missing:
+            rows = await fetch("SELECT hash, encoding, body FROM log_payloads WHERE hash = ANY($1::text[])", missing)
+        return self._fill(logs, bodies, rows)
+
+    def _cached_bodies(self, logs: list):
+        """({hash: body} already in the process cache, [hashes to look up]) for the logs' payloads"""
+        wanted = {log["payload_hash"] for log in logs if log.get("payload_hash")}
+        bodies = {}
+        with self.lock:
+            for digest in wanted:
+                if digest in self.cache:
+                    bodies[digest] = self.cache[digest]
+                    self.cache.move_to_end(digest)
+        return bodies, list(wanted - bodies.keys())
+
+    def _fill(self, logs: list, bodies: dict, rows) -> list:
+        for digest, encoding, body in rows:
+            bodies[digest] = decode(encoding, body)
+            self._remember(self.cache, digest, bodies[digest])
+        for log in logs:
+            digest = log.get("payload_hash")
+            if digest in bodies:
+                log["raw_log"] = bodies[digest]
+        return logs
+
+    # 🔹 Garbage collection (payloads whose logs were all deleted)
+    def orphans(self, fetchall):
+        """(count, bytes) of payloads no log references any more"""
+        count, size = fetchall(f"SELECT COUNT(*), COALESCE(SUM({_SIZE}), 0) {_ORPHANS}")[0]
+        return count, int(size)
+
+    def collect_garbage(self, cur, sql=lambda query: query, limit: int = 5000, backend: str = "postgres"):
+        """
+        Delete up to `limit` orphaned payloads in the caller's transaction; returns (count, bytes).
+        Waits for writers that may be about to reference a payload (see `prepare`) to commit first.
+        """
+        if backend == "postgres":
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (PAYLOAD_LOCK_ID,))
+        cur.execute(sql(f"SELECT hash, {_SIZE} {_ORPHANS} LIMIT %s"), (limit,))
+        rows = cur.fetchall()
+        for start in range(0, len(rows), 500):
+            chunk = [digest for digest, _ in rows[start:start + 500]]
+            cur.execute(sql(f"DELETE FROM log_payloads WHERE hash IN ({', '.join(['%s'] * len(chunk))})"),
+                        tuple(chunk))
+        with self.lock:
+            for digest, _ in rows:
+                self.encoded.pop(digest, None)
+        return len(rows), sum(size for _, size in rows)
+
+
+# Global instance
+payload_store = PayloadStore()
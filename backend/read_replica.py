@@ -0,0 +1,117 @@
+# read_replica.py
+"""
+Routing of dashboard reads to a Postgres read replica.
+
+The ingest writer, archive and retention jobs use log_store's pool on the
+primary. Dashboard aggregations and the AI context queries go through
+`read_router` instead:
+- with DB_READ_HOST set, to a read-only pool on the replica (plus an asyncpg
+  pool for /logs and /alerts), as long as its replication lag stays within
+  REPLICA_MAX_LAG_SECONDS;
+- otherwise (no replica, replica down or lagging) to a separate pool on the
+  primary, so a burst of dashboard reads still can't take the connections the
+  background jobs need.
+
+Every read session has `statement_timeout = READ_STATEMENT_TIMEOUT_MS`, so a
+runaway query is cancelled by the server instead of holding a connection.
+Writes (shared cache, state) always go to the primary.
+
+The lag is measured in the background every REPLICA_LAG_CHECK_SECONDS as the
+age of the last replayed transaction (0 while the replica has replayed all WAL
+it received, so an idle primary doesn't look like lag). It is exported as
+`smartguard_db_replica_lag_seconds` and on /db/replication.
+"""
+
+import asyncio
+import os
+import time
+from dotenv import load_dotenv
+from log_store import LogStore, log_store, DB_READ_HOST, DB_READ_PORT, READ_STATEMENT_TIMEOUT_MS
+from async_store import AsyncLogStore, async_store
+from instrumentation import Gauge
+
+# Load environment
+load_dotenv()
+
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "30"))
+REPLICA_LAG_CHECK_SECONDS = float(os.getenv("REPLICA_LAG_CHECK_SECONDS", "5"))
+
+_LAG_QUERY = """SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                            ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"""
+
+REPLICA_LAG_SECONDS = Gauge("smartguard_db_replica_lag_seconds", "Replication lag of the read replica")
+READS_ON_REPLICA = Gauge("smartguard_db_reads_on_replica", "1 while dashboard reads go to the replica, 0 on the primary")
+
+
+class ReadRouter:
+    """Picks the replica or the primary for dashboard reads from the last lag measurement"""
+
+    def __init__(self, replica_host: str = DB_READ_HOST, max_lag: float = REPLICA_MAX_LAG_SECONDS):
+        self.primary = async_store.store
+        self.replica = None
+        self.async_replica = None
+        if replica_host and log_store.backend == "postgres":
+            self.replica = LogStore("postgres", host=replica_host, port=DB_READ_PORT,
+                                    statement_timeout_ms=READ_STATEMENT_TIMEOUT_MS, read_only=True)
+            self.async_replica = AsyncLogStore(self.replica)
+            os.register_at_fork(after_in_child=self.replica._reset_after_fork)
+        self.max_lag = max_lag
+        self.lag = None         # seconds, None until measured or while the replica is unreachable
+        self.checked_at = None
+        self.last_error = None
+
+    @property
+    def on_replica(self) -> bool:
+        return self.replica is not None and self.lag is not None and self.lag <= self.max_lag
+
+    @property
+    def store(self):
+        """Sync LogStore for the next dashboard read"""
+        return self.replica if self.on_replica else self.primary
+
+    async def call(self, name: str, *args, **kwargs):
+        """AsyncLogStore.call on the replica or the primary, whichever `store` would pick"""
+        target = self.async_replica if self.on_replica else async_store
+        return await target.call(name, *args, **kwargs)
+
+    # 🔹 Lag
+    def check(self):
+        """Measure the replica's lag; unreachable counts as lagging"""
+        try:
+            lag = float(self.replica.fetchall(_LAG_QUERY)[0][0])
+            self.last_error = None
+        except Exception as e:
+            lag = None
+            if self.last_error is None:
+                print(f"⚠️ Read replica {self.replica.host} unreachable, reading from the primary: {e}")
+            self.last_error = str(e)
+        was_on_replica = self.on_replica
+        self.lag, self.checked_at = lag, time.time()
+        if lag is not None:
+            REPLICA_LAG_SECONDS.set(lag)
+        if was_on_replica and not self.on_replica and lag is not None:
+            print(f"⚠️ Read replica is {lag:.0f}s behind, reading from the primary")
+        elif self.on_replica and not was_on_replica:
+            print(f"✅ Dashboard reads on the read replica {self.replica.host} (lag {lag:.1f}s)")
+        READS_ON_REPLICA.set(1 if self.on_replica else 0)
+
+    async def run(self):
+        """Background loop started from the API lifespan (only with a replica configured)"""
+        while True:
+            await asyncio.to_thread(self.check)
+            await asyncio.sleep(REPLICA_LAG_CHECK_SECONDS)
+
+    def status(self) -> dict:
+        return {
+            "replica": f"{self.replica.host}:{self.replica.port}" if self.replica else None,
+            "reads_from": "replica" if self.on_replica else "primary",
+            "lag_seconds": round(self.lag, 3) if self.lag is not None else None,
+            "max_lag_seconds": self.max_lag,
+            "checked_seconds_ago": round(time.time() - self.checked_at, 1) if self.checked_at else None,
+            "statement_timeout_ms": READ_STATEMENT_TIMEOUT_MS if log_store.backend == "postgres" else None,
+            "error": self.last_error,
+        }
+
+
+# Global instance
+read_router = ReadRouter()
@@ -0,0 +1,325 @@
+# retention.py
+"""
+Retention and downsampling policy for stored logs.
+
+Rules give how many days logs are kept, by severity and/or service:
+
+    RETENTION_RULES='{"INFO": 3, "ERROR": 90, "checkoutservice:ERROR": 180, "loadgenerator:*": 1}'
+
+The most specific rule wins ("service:SEVERITY", then "service:*", then
+"SEVERITY", then "*"); logs matching no rule (or a null rule) are kept forever.
+Retention deletes data, so it is opt-in: nothing expires without
+RETENTION_RULES, and the background enforcement needs RETENTION_ENABLED=true.
+
+Expired logs are downsampled before they go: their hourly counts per service
+and severity are added to `log_rollups`, which /timeline and /metrics-enhanced
+read next to live and archived data. Enforcement runs in the background:
+- hot store: short batched deletes (RETENTION_BATCH_ROWS rows per transaction,
+  pausing in between) so ingestion is never blocked for long;
+- Parquet archive: a day/service partition whose rows all expired is dropped
+  as a directory, one where only some severities expired is rewritten;
+- payloads no log references any more are garbage collected.
+
+`plan()` is the dry run: what would be removed and roughly how much space that frees.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import time
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from log_store import log_store
+from log_archive import log_archive, file_schema
+from payload_store import payload_store
+from instrumentation import Counter, Histogram
+
+# Load environment
+load_dotenv()
+
+RETENTION_ENABLED = os.getenv("RETENTION_ENABLED", "false").lower() == "true"
+RETENTION_INTERVAL_SECONDS = float(os.getenv("RETENTION_INTERVAL_SECONDS", "3600"))
+RETENTION_BATCH_ROWS = int(os.getenv("RETENTION_BATCH_ROWS", "5000"))
+RETENTION_BATCH_PAUSE_SECONDS = float(os.getenv("RETENTION_BATCH_PAUSE_SECONDS", "0.1"))
+ROLLUP_RETENTION_DAYS = float(os.getenv("ROLLUP_RETENTION_DAYS", "400"))
+RETENTION_LOCK_ID = 2024061503
+# Per-row storage overhead beyond the text columns (tuple header, id, timestamp, index entries), for estimates
+ROW_OVERHEAD_BYTES = 64
+
+# Days to keep, by "SEVERITY", "service:SEVERITY", "service:*" or "*"; none by default (keep everything)
+RETENTION_RULES = json.loads(os.getenv("RETENTION_RULES") or "{}")
+
+RETENTION_DELETED_ROWS = Counter("smartguard_retention_deleted_rows_total", "Logs removed by retention", ["tier"])
+RETENTION_BATCH_SECONDS = Histogram("smartguard_retention_batch_duration_seconds",
+                                    "Retention batch (rollup + delete) latency", ["tier"])
+
+# Rows of one service/severity pair older than a cutoff (NULLs compare as '')
+_EXPIRED = "COALESCE(service, '') = %s AND COALESCE(severity, '') = %s AND timestamp < %s"
+
+
+def retention_days(service, severity, rules: dict = None):
+    """Days to keep logs of this service/severity, or None to keep them forever"""
+    rules = RETENTION_RULES if rules is None else rules
+    for key in (f"{service}:{severity}", f"{service}:*", severity, "*"):
+        if key in rules:
+            return rules[key]
+    return None
+
+
+def _hour(value) -> str:
+    value = value if isinstance(value, datetime) else datetime.fromisoformat(str(value))
+    return value.strftime("%Y-%m-%d %H:00")
+
+
+class RetentionPolicy:
+    """Applies RETENTION_RULES to the hot store, the archive and the payload table"""
+
+    def __init__(self, rules: dict = None, batch_rows: int = RETENTION_BATCH_ROWS,
+                 pause_seconds: float = RETENTION_BATCH_PAUSE_SECONDS):
+        self.rules = RETENTION_RULES if rules is None else rules
+        self.batch_rows = batch_rows
+        self.pause_seconds = pause_seconds
+
+    def _cutoff(self, service, severity, now: datetime):
+        days = retention_days(service or "unknown", severity or "DEFAULT", self.rules)
+        return None if days is None else now - timedelta(days=float(days))
+
+    # 🔹 Hot store
+    def _expired_pairs(self, now: datetime):
+        """[(service, severity, cutoff)] for every pair present in the store that has a rule"""
+        pairs = []
+        for service, severity in log_store.fetchall("SELECT DISTINCT service, severity FROM logs"):
+            cutoff = self._cutoff(service, severity, now)
+            if cutoff is not None:
+                pairs.append((service, severity, cutoff))
+        return pairs
+
+    def _delete_batch(self, service, severity, cutoff: datetime):
+        """Roll up and delete one batch; returns the row count, or None if another worker holds the lock"""
+        with RETENTION_BATCH_SECONDS.time(tier="hot"), \
+                log_store.locked_transaction(RETENTION_LOCK_ID, wait=False) as cur:
+            if cur is None:
+                return None
+            cur.execute(
+                log_store.sql(f"SELECT id, timestamp FROM logs WHERE {_EXPIRED} ORDER BY timestamp LIMIT %s"),
+                (service or "", severity or "", log_store.ts(cutoff), self.batch_rows),
+            )
+            rows = cur.fetchall()
+            counts = {}
+            for _, timestamp in rows:
+                key = (_hour(timestamp), service or "unknown", severity or "DEFAULT")
+                counts[key] = counts.get(key, 0) + 1
+            log_store.add_rollups(cur, counts)
+            ids = [row[0] for row in rows]
+            for start in range(0, len(ids), 1000):
+                chunk = ids[start:start + 1000]
+                cur.execute(log_store.sql(f"DELETE FROM logs WHERE id IN ({', '.join(['%s'] * len(chunk))})"),
+                            tuple(chunk))
+        RETENTION_DELETED_ROWS.inc(len(rows), tier="hot")
+        return len(rows)
+
+    def enforce_hot_store(self, now: datetime) -> int:
+        deleted = 0
+        for service, severity, cutoff in self._expired_pairs(now):
+            while True:
+                count = self._delete_batch(service, severity, cutoff)
+                if count is None:
+                    return deleted  # another worker is enforcing retention
+                deleted += count
+                if count < self.batch_rows:
+                    break
+                time.sleep(self.pause_seconds)  # let writers in between batches
+        return deleted
+
+    # 🔹 Archive
+    def _partitions(self, now: datetime):
+        """(day, service, directory) for archive partitions old enough for some rule to apply"""
+        if not log_archive.available or not os.path.isdir(log_archive.path):
+            return
+        days = [float(value) for value in self.rules.values() if value is not None]
+        if not days:
+            return
+        oldest_cutoff = (now - timedelta(days=min(days))).date()
+        for day_dir in sorted(os.listdir(log_archive.path)):
+            if not day_dir.startswith("day=") or day_dir[4:] >= oldest_cutoff.isoformat():
+                continue
+            for service_dir in sorted(os.listdir(os.path.join(log_archive.path, day_dir))):
+                if service_dir.startswith("service="):
+                    yield day_dir[4:], service_dir[8:], os.path.join(log_archive.path, day_dir, service_dir)
+
+    def _inspect_partition(self, day: str, service: str, directory: str, now: datetime):
+        """(files, table of timestamp/severity, expired severities); a partition expires a whole day at a time"""
+        import pyarrow.dataset as ds
+
+        files = [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".parquet")]
+        if not files:
+            return files, None, set()
+        table = ds.dataset(files, format="parquet", schema=file_schema()).to_table(columns=["timestamp", "severity"])
+        day_end = datetime.fromisoformat(day) + timedelta(days=1)
+        expired = set()
+        for severity in set(table["severity"].to_pylist()):
+            cutoff = self._cutoff(service, severity, now)
+            if severity is not None and cutoff is not None and day_end <= cutoff:
+                expired.add(severity)
+        return files, table, expired
+
+    def _enforce_partition(self, day: str, service: str, directory: str, now: datetime):
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.dataset as ds
+        import pyarrow.parquet as pq
+
+        files, table, expired = self._inspect_partition(day, service, directory, now)
+        if not expired:
+            return 0
+        with RETENTION_BATCH_SECONDS.time(tier="archive"), \
+                log_store.locked_transaction(RETENTION_LOCK_ID, wait=False) as cur:
+            if cur is None:
+                return None
+            mask = pc.is_in(table["severity"], value_set=pa.array(sorted(expired)))
+            expired_rows = table.filter(mask)
+            hours = pc.strftime(pc.floor_temporal(expired_rows["timestamp"], unit="hour"), format="%Y-%m-%d %H:00")
+            grouped = expired_rows.append_column("hour", hours).group_by(["hour", "severity"]).aggregate(
+                [("timestamp", "count")])
+            log_store.add_rollups(cur, {
+                (hour, service, severity): count for hour, severity, count in zip(
+                    grouped["hour"].to_pylist(), grouped["severity"].to_pylist(),
+                    grouped["timestamp_count"].to_pylist())
+            })
+
+            if expired_rows.num_rows == table.num_rows:
+                shutil.rmtree(directory)  # drop the whole partition
+            else:
+                dataset = ds.dataset(files, format="parquet", schema=file_schema())
+                retained = dataset.to_table().filter(pc.invert(mask))
+                ids = retained["id"]
+                target = os.path.join(directory, f"part-{pc.min(ids).as_py()}-{pc.max(ids).as_py()}.parquet")
+                pq.write_table(retained, target + ".tmp", compression="zstd")
+                os.replace(target + ".tmp", target)
+                for path in files:
+                    if path != target:
+                        os.remove(path)
+            log_store.set_state("archive_generation", str(time.time()), cur)
+        RETENTION_DELETED_ROWS.inc(expired_rows.num_rows, tier="archive")
+        return expired_rows.num_rows
+
+    def enforce_archive(self, now: datetime) -> int:
+        deleted = 0
+        for day, service, directory in self._partitions(now):
+            count = self._enforce_partition(day, service, directory, now)
+            if count is None:
+                break
+            deleted += count
+        return deleted
+
+    # 🔹 Payloads & rollups
+    def collect_payloads(self) -> int:
+        collected = 0
+        while True:
+            with log_store.locked_transaction(RETENTION_LOCK_ID, wait=False) as cur:
+                if cur is None:
+                    return collected
+                count, _ = payload_store.collect_garbage(cur, log_store.sql, self.batch_rows, log_store.backend)
+            collected += count
+            if count < self.batch_rows:
+                return collected
+            time.sleep(self.pause_seconds)
+
+    def prune_rollups(self, now: datetime) -> int:
+        cutoff = _hour(now - timedelta(days=ROLLUP_RETENTION_DAYS))
+        count = log_store.fetchall("SELECT COUNT(*) FROM log_rollups WHERE hour < %s", (cutoff,))[0][0]
+        if count:
+            log_store.execute("DELETE FROM log_rollups WHERE hour < %s", (cutoff,))
+        return count
+
+    # 🔹 Enforcement
+    def enforce(self) -> dict:
+        """Apply the rules everywhere; returns the number of rows/payloads removed per tier"""
+        now = datetime.now()
+        result = {
+            "hot_store": self.enforce_hot_store(now),
+            "archive": self.enforce_archive(now),
+            "payloads": self.collect_payloads(),
+            "rollups": self.prune_rollups(now),
+        }
+        if any(result.values()):
+            print(f"🧹 Retention removed {result['hot_store']} logs, {result['archive']} archived logs, "
+                  f"{result['payloads']} payloads and {result['rollups']} rollup rows")
+        return result
+
+    async def run(self):
+        """Background loop started from the API lifespan"""
+        while True:
+            try:
+                await asyncio.to_thread(self.enforce)
+            except Exception as e:
+                print(f"⚠️ Retention enforcement failed: {e}")
+            await asyncio.sleep(RETENTION_INTERVAL_SECONDS)
+
+    # 🔹 Dry run
+    def plan(self) -> dict:
+        """
+        What enforce() would remove right now, with estimated bytes reclaimed.
+        Payloads only become orphans once their logs are gone, so only current orphans are counted.
+        """
+        now = datetime.now()
+        hot = []
+        for service, severity, cutoff in self._expired_pairs(now):
+            count, size = log_store.fetchall(
+                f"SELECT COUNT(*), COALESCE(SUM(LENGTH(raw_log) + COALESCE(LENGTH(ai_summary), 0)), 0) "
+                f"FROM logs WHERE {_EXPIRED}",
+                (service or "", severity or "", log_store.ts(cutoff)),
+            )[0]
+            if count:
+                hot.append({"service": service, "severity": severity, "cutoff": cutoff.isoformat(),
+                            "rows": count, "bytes": int(size) + count * ROW_OVERHEAD_BYTES})
+
+        archive = []
+        for day, service, directory in self._partitions(now):
+            files, table, expired = self._inspect_partition(day, service, directory, now)
+            if not expired:
+                continue
+            expired_count = sum(1 for severity in table["severity"].to_pylist() if severity in expired)
+            size = sum(os.path.getsize(path) for path in files)
+            drop = expired_count == table.num_rows
+            archive.append({"partition": f"day={day}/service={service}", "action": "drop" if drop else "rewrite",
+                            "severities": sorted(expired), "rows": expired_count,
+                            "bytes": size if drop else int(size * expired_count / table.num_rows)})
+
+        payload_count, payload_bytes = payload_store.orphans(log_store.fetchall)
+        rollup_cutoff = _hour(now - timedelta(days=ROLLUP_RETENTION_DAYS))
+        rollup_rows = log_store.fetchall("SELECT COUNT(*) FROM log_rollups WHERE hour < %s", (rollup_cutoff,))[0][0]
+        hot_bytes = sum(entry["bytes"] for entry in hot)
+        archive_bytes = sum(entry["bytes"] for entry in archive)
+        return {
+            "dry_run": True,
+            "generated_at": now.isoformat(),
+            "rules": self.rules,
+            "hot_store": {"rows": sum(entry["rows"] for entry in hot), "bytes": hot_bytes, "groups": hot},
+            "archive": {"rows": sum(entry["rows"] for entry in archive), "bytes": archive_bytes,
+                        "partitions": archive},
+            "orphaned_payloads": {"count": payload_count, "bytes": payload_bytes},
+            "expired_rollup_rows": rollup_rows,
+            "estimated_bytes_reclaimed": hot_bytes + archive_bytes + payload_bytes,
+        }
+
+
+# Global instance
+retention_policy = RetentionPolicy()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report (default) or apply the log retention policy")
+    parser.add_argument("--apply", action="store_true", help="delete expired data instead of only reporting it")
+    args = parser.parse_args()
+    log_store.init_schema()
+    if args.apply:
+        print(json.dumps(retention_policy.enforce(), indent=2))
+    else:
+        print(json.dumps(retention_policy.plan(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
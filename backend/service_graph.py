@@ -0,0 +1,257 @@
+# service_graph.py
+"""
+Service dependency graph derived from observed traffic.
+
+An edge caller -> callee exists when a log of `callee` has a parent_span_id
+that is the span of a `caller` log in the same trace. Edges are kept in
+`service_edges` (calls, failing calls, last seen) and maintained incrementally:
+a background refresh only joins logs with ids above the `service_graph_last_id`
+watermark, in batches, so the cost follows ingest volume rather than table size.
+Edges not seen for SERVICE_GRAPH_EDGE_TTL_HOURS are dropped.
+
+Node positions are computed server side with a layered layout (callers left of
+their callees, crossings reduced by barycenter ordering). It is deterministic
+and cached per topology, so positions stay put across refreshes and only move
+when a service or an edge appears or disappears.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from log_store import log_store
+from read_replica import read_router
+from instrumentation import Histogram
+
+# Load environment
+load_dotenv()
+
+SERVICE_GRAPH_REFRESH_SECONDS = float(os.getenv("SERVICE_GRAPH_REFRESH_SECONDS", "30"))
+SERVICE_GRAPH_BATCH_ROWS = int(os.getenv("SERVICE_GRAPH_BATCH_ROWS", "50000"))
+SERVICE_GRAPH_EDGE_TTL_HOURS = float(os.getenv("SERVICE_GRAPH_EDGE_TTL_HOURS", "168"))
+SERVICE_GRAPH_LOCK_ID = 2024061504
+ORDERING_SWEEPS = 4
+
+SERVICE_GRAPH_REFRESH_SECONDS_HIST = Histogram("smartguard_service_graph_refresh_duration_seconds",
+                                               "Incremental service graph refresh latency")
+
+# Each call is folded in once, by the window holding the newer of its two logs (max(p.id, c.id) in (low, high]):
+# pairs whose callee is the newer log, and pairs whose caller is
+_CALLS = """SELECT p.service, c.service, COUNT(*), SUM(CASE WHEN c.severity = 'ERROR' THEN 1 ELSE 0 END),
+                   MAX(c.timestamp)
+            FROM logs c JOIN logs p ON p.trace_id = c.trace_id AND p.span_id = c.parent_span_id
+            WHERE {window} AND c.parent_span_id IS NOT NULL AND p.service <> c.service
+            GROUP BY p.service, c.service"""
+_NEW_CALLEES = _CALLS.format(window="c.id > %s AND c.id <= %s AND p.id < c.id")
+_NEW_CALLERS = _CALLS.format(window="p.id > %s AND p.id <= %s AND c.id < p.id")
+
+
+def _seen(value) -> str:
+    """Normalized ISO text so last_seen compares correctly as a string on both backends"""
+    value = value if isinstance(value, datetime) else datetime.fromisoformat(str(value))
+    return value.isoformat(timespec="seconds")
+
+
+def layout(nodes, edges) -> dict:
+    """{node: (x, y, layer)} in [0, 1]; deterministic for a given set of nodes and (caller, callee) edges"""
+    nodes = sorted(nodes)
+    callees = {node: [] for node in nodes}
+    callers = {node: [] for node in nodes}
+    for caller, callee in sorted(edges):
+        callees[caller].append(callee)
+        callers[callee].append(caller)
+
+    # Depth-first search from entry points marks back edges, so cycles don't break the layering
+    back, state = set(), {}
+    for root in sorted(nodes, key=lambda node: (bool(callers[node]), node)):
+        if root in state:
+            continue
+        state[root] = "open"
+        stack = [(root, iter(callees[root]))]
+        while stack:
+            node, pending = stack[-1]
+            child = next(pending, None)
+            if child is None:
+                state[node] = "done"
+                stack.pop()
+            elif state.get(child) == "open":
+                back.add((node, child))
+            elif child not in state:
+                state[child] = "open"
+                stack.append((child, iter(callees[child])))
+
+    # Longest-path layering over the remaining acyclic edges
+    forward = [(caller, callee) for caller, callee in sorted(edges) if (caller, callee) not in back]
+    indegree = {node: 0 for node in nodes}
+    for _, callee in forward:
+        indegree[callee] += 1
+    layer = {node: 0 for node in nodes}
+    ready = [node for node in nodes if indegree[node] == 0]
+    while ready:
+        node = ready.pop()
+        for callee in callees[node]:
+            if (node, callee) in back:
+                continue
+            layer[callee] = max(layer[callee], layer[node] + 1)
+            indegree[callee] -= 1
+            if indegree[callee] == 0:
+                ready.append(callee)
+
+    connected = [node for node in nodes if callers[node] or callees[node]]
+    columns = {}
+    for node in connected:
+        columns.setdefault(layer[node], []).append(node)
+    # Services without observed calls go to the right, wrapped into columns no taller than the graph
+    isolated = [node for node in nodes if not (callers[node] or callees[node])]
+    height = max([len(column) for column in columns.values()] + [10])
+    first_free = max(columns) + 1 if columns else 0
+    for index, node in enumerate(isolated):
+        layer[node] = first_free + index // height
+        columns.setdefault(layer[node], []).append(node)
+
+    # Barycenter ordering: place each node near the mean position of its neighbours in the adjacent column
+    def reorder(level, neighbours, reference):
+        rank = {node: index for index, node in enumerate(columns.get(reference, []))}
+
+        def barycenter(node):
+            ranks = [rank[other] for other in neighbours[node] if other in rank]
+            return sum(ranks) / len(ranks) if ranks else float("inf")
+
+        columns[level].sort(key=lambda node: (barycenter(node), node))
+
+    levels = sorted(level for level in columns if level < first_free)
+    for _ in range(ORDERING_SWEEPS):
+        for level in levels[1:]:
+            reorder(level, callers, level - 1)
+        for level in reversed(levels[:-1]):
+            reorder(level, callees, level + 1)
+
+    width = max(max(columns) if columns else 0, 1)
+    positions = {}
+    for level, column in columns.items():
+        for index, node in enumerate(column):
+            positions[node] = (round(level / width, 4), round(1 - (index + 1) / (len(column) + 1), 4), level)
+    return positions
+
+
+class ServiceGraph:
+    """Incrementally maintained call graph with a cached, stable layout"""
+
+    def __init__(self, batch_rows: int = SERVICE_GRAPH_BATCH_ROWS, edge_ttl_hours: float = SERVICE_GRAPH_EDGE_TTL_HOURS):
+        self.batch_rows = batch_rows
+        self.edge_ttl = timedelta(hours=edge_ttl_hours)
+        self._layout = (None, {})  # (topology version, positions)
+
+    # 🔹 Incremental maintenance
+    def refresh(self) -> int:
+        """Fold up to `batch_rows` new logs into service_edges; returns how many log ids were covered"""
+        with SERVICE_GRAPH_REFRESH_SECONDS_HIST.time(), \
+                log_store.locked_transaction(SERVICE_GRAPH_LOCK_ID, wait=False) as cur:
+            if cur is None:
+                return 0  # another worker is refreshing
+            cur.execute(log_store.sql("SELECT value FROM app_state WHERE key = %s"), ("service_graph_last_id",))
+            row = cur.fetchone()
+            last_id = int(row[0]) if row else 0
+            cur.execute("SELECT MAX(id) FROM logs")
+            newest = cur.fetchone()[0] or 0
+            if newest <= last_id:
+                return 0
+            high = min(newest, last_id + self.batch_rows)
+
+            edges = {}
+            for query, params in ((_NEW_CALLEES, (last_id, high)), (_NEW_CALLERS, (last_id, high))):
+                cur.execute(log_store.sql(query), params)
+                for caller, callee, calls, errors, last_seen in cur.fetchall():
+                    edge = edges.setdefault((caller, callee), [0, 0, ""])
+                    edge[0] += calls
+                    edge[1] += errors or 0
+                    edge[2] = max(edge[2], _seen(last_seen))
+            if edges:
+                cur.executemany(
+                    log_store.sql("""INSERT INTO service_edges (caller, callee, calls, errors, last_seen)
+                                     VALUES (%s, %s, %s, %s, %s)
+                                     ON CONFLICT (caller, callee) DO UPDATE SET
+                                         calls = service_edges.calls + EXCLUDED.calls,
+                                         errors = service_edges.errors + EXCLUDED.errors,
+                                         last_seen = CASE WHEN EXCLUDED.last_seen > service_edges.last_seen
+                                                          THEN EXCLUDED.last_seen ELSE service_edges.last_seen END"""),
+                    [(caller, callee, calls, errors, last_seen)
+                     for (caller, callee), (calls, errors, last_seen) in edges.items()],
+                )
+            cur.execute(log_store.sql("DELETE FROM service_edges WHERE last_seen < %s"),
+                        (_seen(datetime.now() - self.edge_ttl),))
+            log_store.set_state("service_graph_last_id", str(high), cur)
+            return high - last_id
+
+    def catch_up(self) -> int:
+        covered = 0
+        while True:
+            count = self.refresh()
+            covered += count
+            if count < self.batch_rows:
+                return covered
+
+    async def run(self):
+        """Background loop started from the API lifespan"""
+        while True:
+            try:
+                await asyncio.to_thread(self.catch_up)
+            except Exception as e:
+                print(f"⚠️ Service graph refresh failed: {e}")
+            await asyncio.sleep(SERVICE_GRAPH_REFRESH_SECONDS)
+
+    # 🔹 Queries
+    def edges(self) -> list:
+        """[(caller, callee, calls, errors, last_seen)] seen within the edge TTL"""
+        return log_store.fetchall(
+            "SELECT caller, callee, calls, errors, last_seen FROM service_edges WHERE last_seen >= %s "
+            "ORDER BY caller, callee",
+            (_seen(datetime.now() - self.edge_ttl),),
+        )
+
+    def positions(self, nodes, edges):
+        """(version, positions) for this topology, recomputed only when it changed"""
+        topology = json.dumps([sorted(nodes), sorted(edges)])
+        version = hashlib.sha1(topology.encode()).hexdigest()[:12]
+        cached_version, positions = self._layout
+        if cached_version != version:
+            positions = layout(nodes, edges)
+            self._layout = (version, positions)
+        return version, positions
+
+    def graph(self) -> dict:
+        """Nodes (with positions and log stats) and edges (with call/error counts) of the service graph"""
+        stats = read_router.store.service_stats()
+        edges = self.edges()
+        nodes = {service for service in stats if service} | {edge[0] for edge in edges} | {edge[1] for edge in edges}
+        version, positions = self.positions(nodes, [(edge[0], edge[1]) for edge in edges])
+
+        calls_in, calls_out = {}, {}
+        for caller, callee, calls, _, _ in edges:
+            calls_out[caller] = calls_out.get(caller, 0) + calls
+            calls_in[callee] = calls_in.get(callee, 0) + calls
+        result_nodes = []
+        for node in sorted(nodes):
+            x, y, level = positions[node]
+            node_stats = stats.get(node, {"total": 0, "errors": 0, "last_seen": None})
+            result_nodes.append({
+                "id": node, "x": x, "y": y, "layer": level,
+                "total_logs": node_stats["total"],
+                "error_rate": node_stats["errors"] / node_stats["total"] if node_stats["total"] else 0,
+                "last_seen": node_stats["last_seen"],
+                "calls_in": calls_in.get(node, 0),
+                "calls_out": calls_out.get(node, 0),
+            })
+        return {
+            "layout_version": version,
+            "nodes": result_nodes,
+            "edges": [{"source": caller, "target": callee, "calls": calls, "errors": errors,
+                       "error_rate": errors / calls if calls else 0, "last_seen": last_seen}
+                      for caller, callee, calls, errors, last_seen in edges],
+        }
+
+
+# Global instance
+service_graph = ServiceGraph()
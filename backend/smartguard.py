@@ -2,12 +2,24 @@
 
 import os
 import json
+import time
+import signal
+import argparse
+import itertools
+import threading
 import requests
 import psycopg2
 from dotenv import load_dotenv
-from google.cloud import logging_v2
-import google.generativeai as genai
 from datetime import datetime, timedelta
+from gemini_usage import metered_generate, PRIORITY_LOW
+from admission import admission_controller
+from instrumentation import (ALERT_SEND_SECONDS, DB_QUERY_SECONDS, INGEST_FETCH_SECONDS,
+                             INGEST_LAG_SECONDS, INGEST_LOGS, serve_metrics)
+from payload_store import payload_store, add_payload_column, schema_statements as payload_schema_statements
+from log_fields import FIELD_COLUMNS, add_field_columns, entry_fields, field_values
+from log_sources import SourcePool, load_sources, to_utc
+from log_store import log_store
+from ingest_leases import INGEST_COORDINATION, LeaseCoordinator
 
 # 🔹 Load .env file
 load_dotenv()
@@ -22,13 +34,36 @@ DB_PORT = os.getenv("DB_PORT", "5432")
 DB_NAME = os.getenv("DB_NAME", "smartguard")
 DB_USER = os.getenv("DB_USER", "postgres")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "password")
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "5"))
+# Prometheus metrics of the ingest monitor (per-source lag, cycle time...), 0 disables
+INGEST_METRICS_PORT = int(os.getenv("INGEST_METRICS_PORT", "9108"))
 
 # 🔹 GCP authentication
-os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = GOOGLE_APPLICATION_CREDENTIALS
+if GOOGLE_APPLICATION_CREDENTIALS:
+    os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = GOOGLE_APPLICATION_CREDENTIALS
 
-# 🔹 Initialize clients
-logging_client = logging_v2.Client()
-genai.configure(api_key=GEMINI_API_KEY)
+# 🔹 Clients are created on first use: the GCP/Gemini SDK imports and auth
+# are slow and must not run when this module is merely imported by the API
+_logging_clients = {}
+_logging_clients_lock = threading.Lock()
+_gemini_model = None
+
+def get_logging_client(project=None):
+    """Cloud Logging client for `project` (None: the credentials' project), created on first use"""
+    with _logging_clients_lock:
+        if project not in _logging_clients:
+            from google.cloud import logging_v2
+            _logging_clients[project] = logging_v2.Client(project=project)
+        return _logging_clients[project]
+
+def get_gemini_model():
+    """Gemini model, configured on first use"""
+    global _gemini_model
+    if _gemini_model is None:
+        import google.generativeai as genai
+        genai.configure(api_key=GEMINI_API_KEY)
+        _gemini_model = genai.GenerativeModel("gemini-2.5-flash")
+    return _gemini_model
 
 # 🔹 DB connection
 def get_db_connection():
@@ -37,14 +72,16 @@ def get_db_connection():
         port=DB_PORT,
         dbname=DB_NAME,
         user=DB_USER,
-        password=DB_PASSWORD
+        password=DB_PASSWORD,
+        connect_timeout=DB_CONNECT_TIMEOUT
     )
 
 def init_db():
     """Create logs table if it doesn't exist"""
     conn = get_db_connection()
     cur = conn.cursor()
-    cur.execute("""
+    with DB_QUERY_SECONDS.time(backend="postgres", operation="create logs"):
+        cur.execute("""
         CREATE TABLE IF NOT EXISTS logs (
             id SERIAL PRIMARY KEY,
             timestamp TIMESTAMP,
@@ -53,47 +90,72 @@ def init_db():
             raw_log TEXT,
             ai_summary TEXT
         )
-    """)
-    conn.commit()
+        """)
+        for statement in payload_schema_statements("postgres"):
+            cur.execute(statement)
+        add_payload_column(cur, "postgres")
+        add_field_columns(cur, "postgres")
+        conn.commit()
     cur.close()
     conn.close()
 
-def store_log(timestamp, service, severity, raw_log, ai_summary):
-    """Insert log into DB"""
+def store_log(timestamp, service, severity, raw_log, ai_summary, fields=None):
+    """Insert log into DB (`fields`: structured fields from fetch_logs, see log_fields.py)"""
     conn = get_db_connection()
     cur = conn.cursor()
-    cur.execute("""
-        INSERT INTO logs (timestamp, service, severity, raw_log, ai_summary)
-        VALUES (%s, %s, %s, %s, %s)
-    """, (timestamp, service, severity, raw_log, ai_summary))
-    conn.commit()
+    with DB_QUERY_SECONDS.time(backend="postgres", operation="insert logs"):
+        raw_log, payload_hash = payload_store.prepare(cur, raw_log)
+        cur.execute(f"""
+            INSERT INTO logs (timestamp, service, severity, raw_log, ai_summary, payload_hash, {', '.join(FIELD_COLUMNS)})
+            VALUES (%s, %s, %s, %s, %s, %s, {', '.join(['%s'] * len(FIELD_COLUMNS))})
+        """, (timestamp, service, severity, raw_log, ai_summary, payload_hash) + field_values(fields or {}))
+        conn.commit()
     cur.close()
     conn.close()
 
-def fetch_logs():
-    """Fetch recent error logs from GCP (last 5 minutes)"""
-    now = datetime.utcnow()
-    five_min_ago = now - timedelta(minutes=5)
-
-    filter_str = f"""
-        timestamp >= "{five_min_ago.isoformat()}Z"
-        severity >= ERROR
+def fetch_logs(source=None):
+    """
+    Fetch error logs from GCP. Without a source: the newest few of the last 5 minutes;
+    for a LogSource (log_sources.py): the entries after its cursor, oldest first, at most max_entries.
     """
+    from google.cloud.logging_v2 import ASCENDING, DESCENDING
+    label = source.name if source else "gcp"
+    if source is None:
+        five_min_ago = datetime.utcnow() - timedelta(minutes=5)
+        filter_str = f"""
+            timestamp >= "{five_min_ago.isoformat()}Z"
+            severity >= ERROR
+        """
+        client, order_by, limit = get_logging_client(), DESCENDING, 5
+    else:
+        filter_str = source.fetch_filter()
+        client, order_by, limit = get_logging_client(source.project), ASCENDING, source.fetch_limit()
 
-    entries = logging_client.list_entries(
-        filter_=filter_str,
-        order_by=logging_v2.DESCENDING,
-        page_size=5
-    )
+    with INGEST_FETCH_SECONDS.time(source=label):
+        entries = list(itertools.islice(client.list_entries(
+            filter_=filter_str,
+            order_by=order_by,
+            page_size=min(limit, 1000)
+        ), limit))
+    # How far behind GCP the ingest is running: age of the newest entry fetched (0 once a source is caught up)
+    newest = entries[-1 if source else 0].timestamp if entries else None
+    if newest:
+        INGEST_LAG_SECONDS.set(max(0.0, (datetime.utcnow() - to_utc(newest)).total_seconds()), source=label)
+    elif source is not None:
+        INGEST_LAG_SECONDS.set(0.0, source=label)
+    if source is not None:
+        entries = source.unseen(entries)
+    INGEST_LOGS.inc(len(entries), source=label)
 
     logs = []
     for entry in entries:
         try:
+            # Keep trace/HTTP/label structure instead of flattening the payload to text
             logs.append({
                 "timestamp": entry.timestamp.isoformat(),
                 "service": entry.resource.labels.get("container_name", "unknown"),
                 "severity": entry.severity,
-                "raw_log": str(entry.payload)
+                **entry_fields(entry)
             })
         except Exception as e:
             logs.append({
@@ -102,11 +164,14 @@ def fetch_logs():
                 "severity": "ERROR",
                 "raw_log": str(entry)
             })
+        if source is not None:
+            # Which registry source a stored log came from (label filter: smartguard_source=<name>)
+            logs[-1]["labels"] = dict(logs[-1].get("labels") or {}, smartguard_source=source.name)
     return logs
 
-def analyze_logs(logs):
-    """Analyze logs with Gemini"""
-    model = genai.GenerativeModel("gemini-2.5-flash")
+def analyze_logs(logs, service="all", priority=PRIORITY_LOW):
+    """Analyze logs with Gemini (degrades to a placeholder when the quota is exhausted)"""
+    model = get_gemini_model()
     prompt = f"""
     You are SmartGuard, an AI for DevOps.
     Analyze these logs:
@@ -119,27 +184,49 @@ def analyze_logs(logs):
 
     Respond concisely.
     """
-    response = model.generate_content(prompt)
+    response = metered_generate(model, prompt, "smartguard.analyze_logs", service, priority)
+    if response is None:
+        return "AI analysis deferred: Gemini quota reached. Log stored without analysis."
     return response.text
 
-def send_alert(msg):
-    """Send alert to Slack"""
+def send_alert(msg, webhook=None, channel=None):
+    """Send alert to Slack (`webhook`/`channel`: a log source's own, default SLACK_WEBHOOK_URL)"""
+    webhook = webhook or SLACK_WEBHOOK_URL
+    if not webhook:
+        print("⚠️ No Slack webhook configured, alert not sent")
+        return
     data = {"text": f"🚨 SmartGuard Alert 🚨\n{msg}"}
-    resp = requests.post(SLACK_WEBHOOK_URL, data=json.dumps(data), headers={"Content-Type": "application/json"})
+    if channel:
+        data["channel"] = channel
+    started = time.perf_counter()
+    try:
+        resp = requests.post(webhook, data=json.dumps(data), headers={"Content-Type": "application/json"})
+    except Exception:
+        ALERT_SEND_SECONDS.observe(time.perf_counter() - started, outcome="error")
+        raise
+    ALERT_SEND_SECONDS.observe(time.perf_counter() - started, outcome="sent" if resp.status_code == 200 else "failed")
     if resp.status_code == 200:
         print("✅ Alert sent to Slack")
     else:
         print(f"❌ Failed to send alert: {resp.status_code}, {resp.text}")
 
-if __name__ == "__main__":
-    init_db()  # Ensure DB table exists
-
-    logs = fetch_logs()
-    print(f"📄 Got {len(logs)} logs")
+def run_cycle(source=None):
+    """One ingest pass (of one log source): fetch, admit, analyze, store and alert. Returns counts per outcome."""
+    admission = source.admission if source else admission_controller
+    prefix = f"[{source.name}] " if source else ""
+    logs = fetch_logs(source)
+    print(f"📄 {prefix}Got {len(logs)} logs")
 
+    # Most important logs first, within the model budget; repeats are sampled
     for log in logs:
-        analysis = analyze_logs(log["raw_log"])
-        print("\n🤖 AI Analysis:\n", analysis)
+        admission.submit(log)
+
+    analyzed = 0
+    serious = []
+    for log in admission.drain():
+        analysis = analyze_logs(log["raw_log"], service=log["service"])
+        print(f"\n🤖 {prefix}AI Analysis:\n", analysis)
+        analyzed += 1
 
         # Save to DB
         store_log(
@@ -147,9 +234,83 @@ if __name__ == "__main__":
             service=log["service"],
             severity=log["severity"],
             raw_log=log["raw_log"],
-            ai_summary=analysis
+            ai_summary=analysis,
+            fields=log
         )
-
-        # Slack alert if serious
         if "error" in analysis.lower() or "suspicious" in analysis.lower():
-            send_alert(analysis)
+            serious.append(analysis)
+
+    # Logs that won't get a model call are still stored, just without AI analysis;
+    # the rest of the queue waits for the next windows (until AI_ANALYSIS_MAX_AGE_SECONDS)
+    skipped = admission.pop_dropped()
+    store_unanalyzed(skipped)
+    if skipped:
+        print(f"⏭️ {prefix}{len(skipped)} logs stored without AI analysis (sampled/shed/expired)")
+    if source:
+        source.commit()
+
+    # Slack alerts only once the batch is stored and the cursor moved past it:
+    # a failed store re-reads the batch, and must not alert for it twice
+    alerts = 0
+    for analysis in serious:
+        try:
+            if source:
+                send_alert(analysis, source.slack_webhook, source.slack_channel)
+            else:
+                send_alert(analysis)
+            alerts += 1
+        except Exception as e:
+            print(f"⚠️ {prefix}Slack alert failed: {e}")
+    return {"fetched": len(logs), "analyzed": analyzed, "skipped": len(skipped), "alerts": alerts,
+            "pending": len(admission.queue)}
+
+def store_unanalyzed(skipped):
+    """Store (log, reason) pairs from admission control without AI analysis"""
+    for log, reason in skipped:
+        store_log(
+            timestamp=log["timestamp"],
+            service=log["service"],
+            severity=log["severity"],
+            raw_log=log["raw_log"],
+            ai_summary=f"Not analyzed by AI ({reason} by admission control)",
+            fields=log
+        )
+
+def flush_admission(admission=admission_controller) -> int:
+    """Store everything still queued for analysis without it (the monitor stops polling its source)"""
+    skipped = admission.pop_dropped() + admission.flush_pending()
+    store_unanalyzed(skipped)
+    return len(skipped)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SmartGuard ingest monitor: poll the log sources in LOG_SOURCES")
+    parser.add_argument("--once", action="store_true", help="run one cycle of every source and exit")
+    parser.add_argument("--list", action="store_true", help="print the configured sources and exit")
+    args = parser.parse_args()
+
+    sources = load_sources()
+    if args.list:
+        print(json.dumps([source.snapshot() for source in sources], indent=2))
+    else:
+        init_db()  # Ensure DB table exists
+        # Several replicas split the sources between them through leases in the shared store
+        coordinator = None
+        if INGEST_COORDINATION:
+            log_store.init_schema()
+            coordinator = LeaseCoordinator()
+        pool = SourcePool(sources, coordinator=coordinator)
+        if args.once:
+            print(json.dumps(pool.run_once(), indent=2))
+        else:
+            if INGEST_METRICS_PORT:
+                serve_metrics(INGEST_METRICS_PORT)
+            stop = threading.Event()
+            signal.signal(signal.SIGTERM, lambda *_: stop.set())
+            try:
+                pool.run_forever(stop)
+            except KeyboardInterrupt:
+                pool.executor.shutdown(wait=True)  # let running cycles finish before giving up the leases
+            print("👋 Stopping ingest monitor")
+        pool.release_pending()  # the queues live in memory: store what is left before exiting
+        if coordinator is not None:
+            coordinator.leave()  # hand the sources over now instead of after the lease TTL
@@ -6,8 +6,11 @@ This bridges the gap between the working api.py/dashboard.py and the smartguard.
 
 import os
 import json
-from datetime import datetime, timedelta
+from datetime import datetime
 from dotenv import load_dotenv
+from gemini_usage import PRIORITY_HIGH
+from admission import admission_controller
+from synthetic_logs import sample_logs
 
 # Load environment
 load_dotenv()
@@ -33,29 +36,40 @@ class SmartGuardIntegration:
     
     def __init__(self):
         self.available = SMARTGUARD_AVAILABLE
-        if self.available:
-            try:
-                # Show resolved DB host for debugging
-                resolved_host = os.getenv("DB_HOST", "postgres")
+        self.db_ready = False
+
+    def init_database(self, max_attempts: int = 10, quiet: bool = False):
+        """
+        Create the SmartGuard tables, retrying while the DB is still coming up.
+        Run at startup (api retries it in the background), not at import time.
+        A failure leaves `db_ready` False so the caller can try again later; `quiet` skips the failure logs.
+        """
+        if not self.available or self.db_ready:
+            return self.db_ready
+        try:
+            # Show resolved DB host for debugging
+            resolved_host = os.getenv("DB_HOST", "postgres")
+            if not quiet:
                 print(f"ℹ️ SmartGuard DB host: {resolved_host}")
 
-                # Initialize database with simple retry/backoff in case DB is still coming up
-                import time
-                max_attempts = 10
-                for attempt in range(1, max_attempts + 1):
-                    try:
-                        init_db()
-                        print("✅ SmartGuard database initialized")
-                        break
-                    except Exception as db_err:
-                        if attempt == max_attempts:
-                            raise db_err
-                        wait_seconds = min(2 * attempt, 10)
-                        print(f"⏳ DB not ready (attempt {attempt}/{max_attempts}): {db_err}. Retrying in {wait_seconds}s...")
-                        time.sleep(wait_seconds)
-            except Exception as e:
+            # Initialize database with simple retry/backoff in case DB is still coming up
+            import time
+            for attempt in range(1, max_attempts + 1):
+                try:
+                    init_db()
+                    self.db_ready = True
+                    print("✅ SmartGuard database initialized")
+                    break
+                except Exception as db_err:
+                    if attempt == max_attempts:
+                        raise db_err
+                    wait_seconds = min(2 * attempt, 10)
+                    print(f"⏳ DB not ready (attempt {attempt}/{max_attempts}): {db_err}. Retrying in {wait_seconds}s...")
+                    time.sleep(wait_seconds)
+        except Exception as e:
+            if not quiet:
                 print(f"⚠️ SmartGuard database initialization failed: {e}")
-                self.available = False
+        return self.db_ready
     
     def get_real_logs(self, hours: int = 1):
         """Get real logs from GCP (if configured)"""
@@ -75,19 +89,23 @@ class SmartGuardIntegration:
             return "SmartGuard AI analysis not available"
         
         try:
-            analysis = analyze_logs(logs_data)
+            # Send one representative per repeated message, most important first
+            if isinstance(logs_data, list):
+                logs_data = admission_controller.prioritize(logs_data)
+            # Requested interactively through the API, so it may queue for quota
+            analysis = analyze_logs(logs_data, priority=PRIORITY_HIGH)
             return analysis
         except Exception as e:
             print(f"⚠️ SmartGuard AI analysis failed: {e}")
             return "AI analysis failed"
     
-    def store_log_with_ai(self, timestamp, service, severity, raw_log, ai_summary):
+    def store_log_with_ai(self, timestamp, service, severity, raw_log, ai_summary, fields=None):
         """Store log with AI analysis"""
-        if not self.available:
+        if not self.available or not self.db_ready:
             return False
         
         try:
-            store_log(timestamp, service, severity, raw_log, ai_summary)
+            store_log(timestamp, service, severity, raw_log, ai_summary, fields)
             return True
         except Exception as e:
             print(f"⚠️ Failed to store log: {e}")
@@ -109,50 +127,14 @@ class SmartGuardIntegration:
     
     def get_enhanced_sample_logs(self, count: int = 100):
         """Get enhanced sample logs with SmartGuard AI analysis"""
-        import random
-        
-        services = [
-            "frontend", "cartservice", "productcatalogservice", "recommendationservice",
-            "shippingservice", "checkoutservice", "paymentservice", "currencyservice",
-            "adservice", "emailservice", "loadgenerator"
-        ]
-        
-        severities = ["ERROR", "WARNING", "INFO"]
-        severity_weights = [0.1, 0.2, 0.7]
-        
-        enhanced_logs = []
-        
-        for i in range(count):
-            service = random.choice(services)
-            severity = random.choices(severities, weights=severity_weights)[0]
-            timestamp = datetime.now() - timedelta(hours=random.randint(0, 24))
-            
-            if severity == "ERROR":
-                message = f"Error in {service}: Database connection failed"
-                ai_summary = f"Critical issue in {service} affecting user experience. Database connectivity problems detected."
-            elif severity == "WARNING":
-                message = f"Warning in {service}: High memory usage detected"
-                ai_summary = f"Performance degradation in {service} requires monitoring. Memory usage above threshold."
-            else:
-                message = f"Info from {service}: User request processed successfully"
-                ai_summary = f"Normal operation in {service}. Request processed without issues."
-            
-            log_entry = {
-                "id": i + 1,
-                "service": service,
-                "severity": severity,
-                "raw_log": f"[{timestamp.isoformat()}] {service}: {message}",
-                "ai_summary": ai_summary,
-                "timestamp": timestamp.isoformat()
-            }
-            
-            enhanced_logs.append(log_entry)
-            
-            # Store in database if SmartGuard is available
-            if self.available:
+        enhanced_logs = sample_logs(count, hours=24)
+
+        # Store in database if SmartGuard is available
+        if self.available:
+            for log_entry in enhanced_logs:
                 self.store_log_with_ai(
-                    timestamp, service, severity, 
-                    log_entry["raw_log"], ai_summary
+                    datetime.fromisoformat(log_entry["timestamp"]), log_entry["service"], log_entry["severity"],
+                    log_entry["raw_log"], log_entry["ai_summary"], log_entry
                 )
         
         return enhanced_logs
@@ -0,0 +1,415 @@
+# synthetic_logs.py
+"""
+Vectorized synthetic log generator for demos, load tests and anomaly-detection checks.
+
+Logs are drawn per (minute, service) cell with NumPy:
+- per-service base rates (logs/minute) and error/warning shares,
+- a diurnal pattern (cosine around DIURNAL_PEAK_HOUR),
+- injected incidents: a service's volume multiplied and its error share raised
+  for a while, dominated by one repeated error message,
+- realistic message templates with variable ids, latencies and hosts,
+- structured fields: http_status by severity and heavy-tailed latency_ms
+  (slower for errors, much slower during incidents),
+- traces: logs are linked to a recent log of a calling service (SERVICE_CALLS)
+  with trace_id / span_id / parent_span_id, and failures propagate to callers.
+
+Output goes to plain dicts (the API's log format), NDJSON, Parquet (pyarrow),
+Postgres (COPY) or the SQLite log store, in batches so millions of rows never
+have to sit in memory at once.
+
+    python synthetic_logs.py --count 1000000 --hours 48 --incident checkoutservice:120:30 --format ndjson --out logs.ndjson
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+from datetime import datetime, timedelta
+import numpy as np
+
+SEVERITIES = np.array(["ERROR", "WARNING", "INFO"])
+# HTTP status drawn per severity (rows follow SEVERITIES)
+HTTP_STATUSES = np.array([[500, 502, 503, 504], [200, 404, 429, 499], [200, 200, 201, 304]])
+# Columns of a generated log, in output order
+ROW_FIELDS = ["timestamp", "service", "severity", "raw_log", "ai_summary", "http_status", "latency_ms",
+              "trace_id", "span_id", "parent_span_id"]
+
+# Online Boutique services: (logs/minute, error share, warning share)
+SERVICE_PROFILES = {
+    "frontend": (120.0, 0.04, 0.12),
+    "cartservice": (60.0, 0.05, 0.15),
+    "productcatalogservice": (80.0, 0.02, 0.10),
+    "currencyservice": (90.0, 0.02, 0.08),
+    "paymentservice": (20.0, 0.08, 0.15),
+    "shippingservice": (25.0, 0.04, 0.15),
+    "emailservice": (15.0, 0.05, 0.20),
+    "checkoutservice": (25.0, 0.08, 0.18),
+    "recommendationservice": (50.0, 0.03, 0.12),
+    "adservice": (40.0, 0.06, 0.20),
+    "loadgenerator": (30.0, 0.01, 0.05),
+}
+
+# Online Boutique call graph (caller -> callees), used to link logs into traces
+SERVICE_CALLS = {
+    "loadgenerator": ["frontend"],
+    "frontend": ["productcatalogservice", "currencyservice", "cartservice", "recommendationservice",
+                 "shippingservice", "checkoutservice", "adservice"],
+    "checkoutservice": ["productcatalogservice", "shippingservice", "paymentservice", "emailservice",
+                        "currencyservice", "cartservice"],
+    "recommendationservice": ["productcatalogservice"],
+}
+# A log is attached to the closest preceding caller log within this window (seconds), with this probability
+TRACE_LINK_SECONDS = 2.0
+TRACE_LINK_SHARE = 0.7
+# Chance that a caller span fails too when a callee span in its trace failed
+ERROR_PROPAGATION = 0.3
+
+DIURNAL_AMPLITUDE = 0.6
+DIURNAL_PEAK_HOUR = 14
+
+# Templates per severity: (message, ai_summary); {n} {ms} {id} {peer} {ip} are filled per row
+TEMPLATES = {
+    "ERROR": [
+        ("Database connection failed after {n} retries", "Database connectivity problems in {svc}"),
+        ("rpc error: code = Unavailable desc = connection refused to {peer}:{n}", "{svc} cannot reach {peer}"),
+        ("Request {id} timed out after {ms}ms calling {peer}", "Timeouts between {svc} and {peer}"),
+        ("Payment authorization failed for order {id}: card declined (code {n})", "Payment failures in {svc}"),
+        ("Unhandled exception in request handler: NullReferenceException at line {n}", "Application crash in {svc}"),
+        ("Out of memory: container killed after using {n}Mi", "{svc} restarted after running out of memory"),
+    ],
+    "WARNING": [
+        ("High memory usage detected: {n}% of limit", "Memory pressure in {svc}"),
+        ("Slow response from {peer}: {ms}ms", "Latency degradation between {svc} and {peer}"),
+        ("Retrying request {id} to {peer} (attempt {n})", "Transient failures from {peer}"),
+        ("Connection pool {n}% utilized", "{svc} close to its connection pool limit"),
+        ("Deprecated API version used by client {ip}", "Outdated clients calling {svc}"),
+    ],
+    "INFO": [
+        ("User request processed successfully in {ms}ms", "Normal operation in {svc}"),
+        ("GET /product/{id} 200 {ms}ms", "Normal operation in {svc}"),
+        ("Cache refreshed with {n} entries", "Routine cache refresh in {svc}"),
+        ("Health check passed from {ip}", "Normal operation in {svc}"),
+        ("Order {id} placed, {n} items", "Normal operation in {svc}"),
+    ],
+}
+
+
+def parse_incident(spec: str, end: datetime) -> dict:
+    """'service:minutes_ago:duration[:multiplier[:error_share]]' -> incident dict"""
+    parts = spec.split(":")
+    if len(parts) < 3:
+        raise ValueError(f"Invalid incident '{spec}', expected service:minutes_ago:duration[:multiplier[:error_share]]")
+    return {
+        "service": parts[0],
+        "start": end - timedelta(minutes=float(parts[1])),
+        "minutes": float(parts[2]),
+        "multiplier": float(parts[3]) if len(parts) > 3 else 8.0,
+        "error_share": float(parts[4]) if len(parts) > 4 else 0.6,
+    }
+
+
+class SyntheticLogGenerator:
+    """Draws logs for every (minute, service) cell between `start` and `end`"""
+
+    def __init__(self, hours: float = 24, end: datetime = None, service_profiles: dict = None,
+                 diurnal_amplitude: float = DIURNAL_AMPLITUDE, peak_hour: float = DIURNAL_PEAK_HOUR,
+                 incidents: list = None, rate_scale: float = 1.0, seed: int = None):
+        self.end = (end or datetime.now()).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        self.minutes = max(1, int(round(hours * 60)))
+        self.start = self.end - timedelta(minutes=self.minutes)
+        profiles = service_profiles or SERVICE_PROFILES
+        self.services = np.array(list(profiles))
+        self.base_rates = np.array([p[0] for p in profiles.values()]) * rate_scale
+        self.error_share = np.array([p[1] for p in profiles.values()])
+        self.warning_share = np.array([p[2] for p in profiles.values()])
+        self.diurnal_amplitude = diurnal_amplitude
+        self.peak_hour = peak_hour
+        self.incidents = incidents or []
+        self.rng = np.random.default_rng(seed)
+        self._build_intensity()
+
+    def _build_intensity(self):
+        """Expected logs per (minute, service) cell and error share per cell"""
+        minute_offsets = np.arange(self.minutes)
+        start_hour = self.start.hour + self.start.minute / 60
+        hours = (start_hour + minute_offsets / 60) % 24
+        diurnal = 1 + self.diurnal_amplitude * np.cos(2 * np.pi * (hours - self.peak_hour) / 24)
+
+        self.intensity = diurnal[:, None] * self.base_rates[None, :]        # (minutes, services)
+        self.cell_error_share = np.broadcast_to(self.error_share, self.intensity.shape).copy()
+        self.cell_incident = np.full(self.intensity.shape, -1, dtype=np.int32)
+        for i, incident in enumerate(self.incidents):
+            matches = np.nonzero(self.services == incident["service"])[0]
+            if not len(matches):
+                raise ValueError(f"Unknown service in incident: {incident['service']}")
+            first = int((incident["start"] - self.start).total_seconds() // 60)
+            last = first + int(incident["minutes"])
+            first, last = max(first, 0), min(last, self.minutes)
+            if first >= last:
+                continue
+            column = matches[0]
+            self.intensity[first:last, column] *= incident["multiplier"]
+            self.cell_error_share[first:last, column] = incident["error_share"]
+            self.cell_incident[first:last, column] = i
+
+    def expected_count(self) -> float:
+        return float(self.intensity.sum())
+
+    def cell_counts(self, count: int = None) -> np.ndarray:
+        """
+        Logs per cell, flattened minute-major (so output is roughly time ordered).
+        With `count`, exactly that many logs are spread over the cells (multinomial);
+        otherwise each cell is a Poisson draw of its rate.
+        """
+        flat = self.intensity.ravel()
+        if count is None:
+            return self.rng.poisson(flat)
+        return self.rng.multinomial(count, flat / flat.sum())
+
+    def batches(self, count: int = None, batch_size: int = 100_000):
+        """Yield column dicts of NumPy arrays, one per ROW_FIELDS entry"""
+        counts = self.cell_counts(count)
+        ends = np.cumsum(counts)
+        total = int(ends[-1]) if len(ends) else 0
+        n_services = len(self.services)
+        start_ns = np.datetime64(self.start, "ns")
+
+        for offset in range(0, total, batch_size):
+            size = min(batch_size, total - offset)
+            cells = np.searchsorted(ends, np.arange(offset, offset + size), side="right")
+            minute, service = np.divmod(cells, n_services)
+
+            seconds = minute * 60 + self.rng.random(size) * 60
+            timestamps = start_ns + (seconds * 1e9).astype("timedelta64[ns]")
+
+            error_share = self.cell_error_share.ravel()[cells]
+            warning_share = self.warning_share[service]
+            draw = self.rng.random(size)
+            severity = np.where(draw < error_share, 0, np.where(draw < error_share + warning_share, 1, 2))
+            parent = self._link_spans(service, seconds)
+            for _ in range(3):  # callers of failing spans fail too, one call level per pass
+                failing = parent[(severity == 0) & (parent >= 0)]
+                severity[failing[self.rng.random(len(failing)) < ERROR_PROPAGATION]] = 0
+
+            incident = self.cell_incident.ravel()[cells]
+            latency_ms = self.rng.lognormal(4.5, 0.8, size)
+            errors = severity == 0
+            latency_ms[errors] *= self.rng.lognormal(1.2, 0.8, int(errors.sum()))
+            latency_ms[incident >= 0] *= 4
+            http_status = HTTP_STATUSES[severity, self.rng.integers(0, HTTP_STATUSES.shape[1], size)]
+
+            raw_log, summaries = self._messages(timestamps, service, severity, incident, latency_ms.astype(np.int64))
+            yield {
+                "timestamp": timestamps,
+                "service": self.services[service],
+                "severity": SEVERITIES[severity],
+                "raw_log": raw_log,
+                "ai_summary": summaries,
+                "http_status": http_status,
+                "latency_ms": latency_ms.round(1),
+                **self._trace_ids(parent),
+            }
+
+    def _link_spans(self, service, seconds):
+        """Index of each row's parent span (closest preceding log of a calling service) or -1"""
+        parent = np.full(len(service), -1, dtype=np.int64)
+        names = self.services.tolist()
+        for callee_index, callee in enumerate(names):
+            callers = [names.index(caller) for caller, callees in SERVICE_CALLS.items()
+                       if callee in callees and caller in names]
+            children = np.nonzero(service == callee_index)[0]
+            candidates = np.nonzero(np.isin(service, callers))[0]
+            if not len(children) or not len(candidates):
+                continue
+            candidates = candidates[np.argsort(seconds[candidates], kind="stable")]
+            position = np.searchsorted(seconds[candidates], seconds[children]) - 1
+            linked = position >= 0
+            position = np.maximum(position, 0)
+            linked &= seconds[children] - seconds[candidates[position]] < TRACE_LINK_SECONDS
+            linked &= self.rng.random(len(children)) < TRACE_LINK_SHARE
+            parent[children[linked]] = candidates[position[linked]]
+        return parent
+
+    def _trace_ids(self, parent):
+        """trace_id (shared by a root log and its descendants), span_id and parent_span_id columns"""
+        root = np.arange(len(parent))
+        for _ in range(len(self.services)):  # walk up the (acyclic) call graph
+            up = parent[root]
+            if not (up >= 0).any():
+                break
+            root = np.where(up >= 0, up, root)
+        prefix = int(self.rng.integers(0, 1 << 62))
+        spans = [f"{span:016x}" for span in self.rng.integers(0, 1 << 62, len(parent)).tolist()]
+        return {
+            "trace_id": np.array([f"{prefix:016x}{index:016x}" for index in root.tolist()], dtype=object),
+            "span_id": np.array(spans, dtype=object),
+            "parent_span_id": np.array([spans[index] if index >= 0 else None for index in parent.tolist()],
+                                       dtype=object),
+        }
+
+    def _messages(self, timestamps, service, severity, incident, latencies):
+        size = len(service)
+        template_index = self.rng.integers(0, 60, size)  # 60 divides evenly by every template count
+        # During an incident most errors are the same message (what the admission controller collapses)
+        dominant = (incident >= 0) & (severity == 0) & (self.rng.random(size) < 0.8)
+        template_index[dominant] = incident[dominant] % len(TEMPLATES["ERROR"])
+        numbers = self.rng.integers(1, 5000, size)
+        ids = self.rng.integers(0, 1 << 48, size)
+        peers = self.rng.integers(0, len(self.services), size)
+        hosts = self.rng.integers(1, 255, size)
+
+        # Plain Python lists: indexing NumPy scalars one by one is far slower than the formatting itself
+        columns = zip(
+            np.datetime_as_string(timestamps, unit="ms").tolist(), self.services[service].tolist(),
+            SEVERITIES[severity].tolist(), template_index.tolist(), numbers.tolist(),
+            latencies.tolist(), ids.tolist(), self.services[peers].tolist(), hosts.tolist(),
+        )
+        raw_log, summaries = [], []
+        for stamp, svc, sev, index, n, ms, log_id, peer, host in columns:
+            templates = TEMPLATES[sev]
+            message, summary = templates[index % len(templates)]
+            values = {"n": n, "ms": ms, "id": f"{log_id:012x}", "peer": peer, "ip": f"10.0.{host}.{n % 255}", "svc": svc}
+            raw_log.append(f"[{stamp}] {svc}: {message.format(**values)}")
+            summaries.append(summary.format(**values))
+        return np.array(raw_log, dtype=object), np.array(summaries, dtype=object)
+
+    def records(self, count: int = None, batch_size: int = 100_000):
+        """Yield log dicts in the API format (timestamp as ISO string)"""
+        for batch in self.batches(count, batch_size):
+            for row in zip(*_row_columns(batch)):
+                yield dict(zip(ROW_FIELDS, row))
+
+
+def sample_logs(count: int = 100, hours: float = 24, incidents: list = None, seed: int = None) -> list:
+    """Small in-memory sample (demo data for the API), newest first, with ids"""
+    logs = list(SyntheticLogGenerator(hours=hours, incidents=incidents, seed=seed).records(count))
+    logs.sort(key=lambda log: log["timestamp"], reverse=True)
+    for i, log in enumerate(logs):
+        log["id"] = i + 1
+    return logs
+
+
+# 🔹 Writers
+def _row_columns(batch) -> list:
+    """Batch columns as plain Python lists in ROW_FIELDS order (timestamps as ISO strings)"""
+    return [np.datetime_as_string(batch["timestamp"], unit="us").tolist()] + [
+        batch[name].tolist() for name in ROW_FIELDS[1:]]
+
+
+def write_ndjson(batches, path) -> int:
+    written = 0
+    with open(path, "w") as f:
+        for batch in batches:
+            for row in zip(*_row_columns(batch)):
+                f.write(json.dumps(dict(zip(ROW_FIELDS, row))) + "\n")
+                written += 1
+    return written
+
+
+def write_parquet(batches, path) -> int:
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet output requires pyarrow (pip install pyarrow)")
+    written = 0
+    writer = None
+    try:
+        for batch in batches:
+            table = pa.table({
+                "timestamp": pa.array(batch["timestamp"].astype("datetime64[us]")),
+                "service": pa.array(batch["service"].tolist(), pa.string()),
+                "severity": pa.array(batch["severity"].tolist(), pa.string()),
+                "raw_log": pa.array(batch["raw_log"].tolist(), pa.string()),
+                "ai_summary": pa.array(batch["ai_summary"].tolist(), pa.string()),
+                "http_status": pa.array(batch["http_status"], pa.int32()),
+                "latency_ms": pa.array(batch["latency_ms"], pa.float64()),
+                "trace_id": pa.array(batch["trace_id"].tolist(), pa.string()),
+                "span_id": pa.array(batch["span_id"].tolist(), pa.string()),
+                "parent_span_id": pa.array(batch["parent_span_id"].tolist(), pa.string()),
+            })
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema, compression="zstd")
+            writer.write_table(table)
+            written += table.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+    return written
+
+
+def copy_to_postgres(batches, conn, table: str = "logs") -> int:
+    """Bulk load with COPY ... FROM STDIN (one COPY per batch)"""
+    written = 0
+    cur = conn.cursor()
+    for batch in batches:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        columns = _row_columns(batch)
+        writer.writerows(zip(*columns))
+        buffer.seek(0)
+        cur.copy_expert(f"COPY {table} ({', '.join(ROW_FIELDS)}) FROM STDIN WITH (FORMAT csv)", buffer)
+        conn.commit()
+        written += len(columns[0])
+    cur.close()
+    return written
+
+
+def write_log_store(batches, store) -> int:
+    """Load into the API's log store: COPY for Postgres, executemany for SQLite"""
+    if store.backend == "postgres":
+        with store.connection() as conn:
+            return copy_to_postgres(batches, conn)
+    written = 0
+    for batch in batches:
+        columns = _row_columns(batch)
+        with store.connection() as conn:
+            conn.executemany(
+                f"INSERT INTO logs ({', '.join(ROW_FIELDS)}) VALUES ({', '.join(['?'] * len(ROW_FIELDS))})",
+                zip(*columns),
+            )
+        written += len(columns[0])
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic SmartGuard logs")
+    parser.add_argument("--count", type=int, help="exact number of logs (default: draw from the service rates)")
+    parser.add_argument("--hours", type=float, default=24)
+    parser.add_argument("--rate-scale", type=float, default=1.0, help="multiply every service's logs/minute")
+    parser.add_argument("--incident", action="append", default=[],
+                        help="service:minutes_ago:duration[:multiplier[:error_share]] (repeatable)")
+    parser.add_argument("--diurnal-amplitude", type=float, default=DIURNAL_AMPLITUDE)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--batch-size", type=int, default=100_000)
+    parser.add_argument("--format", choices=["ndjson", "parquet", "postgres", "sqlite"], default="ndjson")
+    parser.add_argument("--out", help="output file for ndjson/parquet")
+    args = parser.parse_args()
+
+    end = datetime.now()
+    generator = SyntheticLogGenerator(
+        hours=args.hours, end=end, rate_scale=args.rate_scale, diurnal_amplitude=args.diurnal_amplitude,
+        incidents=[parse_incident(spec, end) for spec in args.incident], seed=args.seed,
+    )
+    print(f"🧪 Generating {args.count or f'~{int(generator.expected_count())}'} logs over {args.hours}h "
+          f"({len(args.incident)} incidents)")
+    batches = generator.batches(args.count, args.batch_size)
+    started = datetime.now()
+
+    if args.format in ("ndjson", "parquet"):
+        if not args.out:
+            parser.error("--out is required for ndjson/parquet")
+        written = (write_ndjson if args.format == "ndjson" else write_parquet)(batches, args.out)
+    else:
+        os.environ["LOG_STORE"] = args.format
+        from log_store import log_store
+        log_store.init_schema()
+        written = write_log_store(batches, log_store)
+
+    elapsed = (datetime.now() - started).total_seconds()
+    print(f"✅ Wrote {written:,} logs in {elapsed:.1f}s ({written / max(elapsed, 1e-9):,.0f} logs/sec)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+SmartGuard API load test.
+
+Seeds the log store (SQLite stand-in or Postgres) with synthetic logs, starts
+the real API with a stubbed Gemini and Slack, then hits each endpoint with a
+fixed number of concurrent keep-alive clients and records p50/p90/p99 latency
+and throughput. Results are written to benchmarks/results/*.json and can be
+compared with a previous run (--compare) to catch regressions.
+
+    python benchmarks/api_bench.py --rows 10k,1m --duration 15 --concurrency 8
+    python benchmarks/api_bench.py --rows 1m --compare benchmarks/results/api-<...>.json
+"""
+
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+from common import (
+    BENCH_DIR, DATA_DIR, SlackStub, compare_results, environment,
+    latency_stats, parse_count, save_results, seed_log_store, use_backend
+)
+
+ENDPOINTS = {
+    "/logs": ("GET", "/logs?limit=20", None),
+    "/alerts": ("GET", "/alerts?limit=10", None),
+    "/timeline": ("GET", "/timeline?hours=24", None),
+    "/service-health": ("GET", "/service-health", None),
+    "/metrics-enhanced": ("GET", "/metrics-enhanced", None),
+    "/dashboard/summary": ("GET", "/dashboard/summary", None),
+    "/ai-search": ("POST", "/ai-search", {"query": "payment errors in the last 24 hours"}),
+    "/ai-chat": ("POST", "/ai-chat", {"message": "Which service is failing the most right now?"}),
+}
+COMPARED_METRICS = [("latency_ms.p50", False), ("latency_ms.p99", False), ("throughput_rps", True)]
+
+
+def wait_until_ready(port: int, timeout: float = 180) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            conn.request("GET", "/readyz")
+            if conn.getresponse().status == 200:
+                return True
+        except OSError:
+            pass
+        time.sleep(1)
+    return False
+
+
+def start_api(args, env: dict):
+    server_env = dict(os.environ, **env)
+    server_env.update({
+        "API_PORT": str(args.port),
+        "API_WORKERS": str(args.workers),
+        "SEED_SAMPLE_LOGS": "false",
+        "GEMINI_API_KEY": "bench-stub",
+        "BENCH_GEMINI_LATENCY_MS": str(args.gemini_latency_ms),
+        # The stub is not rate limited; keep the client-side limiter out of the measurement
+        "GEMINI_RPM_LIMIT": "1000000",
+        "GEMINI_TPM_LIMIT": "1000000000",
+    })
+    return subprocess.Popen([sys.executable, "api_server.py"], cwd=BENCH_DIR, env=server_env)
+
+
+def run_endpoint(port: int, method: str, path: str, body, duration: float, concurrency: int) -> dict:
+    """Closed-loop load: `concurrency` clients each send requests back to back for `duration` seconds"""
+    payload = json.dumps(body).encode() if body is not None else None
+    headers = {"Content-Type": "application/json"} if payload else {}
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client():
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+        own, own_errors = [], 0
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                conn.request(method, path, body=payload, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                if response.status >= 400:
+                    own_errors += 1
+                    continue
+                own.append(time.perf_counter() - started)
+            except (OSError, http.client.HTTPException):
+                own_errors += 1
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+        conn.close()
+        with lock:
+            latencies.extend(own)
+            errors[0] += own_errors
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latency_stats(latencies, time.perf_counter() - started, errors[0])
+
+
+def bench_rows(args, rows: int, label: str) -> dict:
+    env = {"LOG_STORE": args.backend}
+    if args.backend == "sqlite":
+        DATA_DIR.mkdir(parents=True, exist_ok=True)
+        env["SMARTGUARD_STATE_DB"] = str(DATA_DIR / f"bench_{label}.db")
+    os.environ.update(env)
+
+    # Import after the environment is set: log_store reads it at import time
+    use_backend()
+    import importlib
+    import log_store as log_store_module
+    log_store_module = importlib.reload(log_store_module)
+    seed_log_store(log_store_module.log_store, rows, reset=args.reset)
+
+    server = start_api(args, env)
+    try:
+        if not wait_until_ready(args.port):
+            raise SystemExit("❌ API did not become ready")
+        results = {}
+        for name in args.endpoints:
+            method, path, body = ENDPOINTS[name]
+            run_endpoint(args.port, method, path, body, args.warmup, args.concurrency)
+            stats = run_endpoint(args.port, method, path, body, args.duration, args.concurrency)
+            results[name] = stats
+            print(f"  {label:>5} {name:<20} p50 {stats['latency_ms']['p50']:>9.1f}ms  "
+                  f"p99 {stats['latency_ms']['p99']:>9.1f}ms  {stats['throughput_rps']:>8.1f} req/s  "
+                  f"errors {stats['errors']}")
+        return results
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SmartGuard API load test")
+    parser.add_argument("--rows", default="10k", help="comma separated dataset sizes, e.g. 10k,1m,10m")
+    parser.add_argument("--backend", choices=["sqlite", "postgres"], default="sqlite")
+    parser.add_argument("--reset", action="store_true", help="allow replacing an existing Postgres logs table")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help="comma separated endpoint names")
+    parser.add_argument("--duration", type=float, default=15, help="seconds of measured load per endpoint")
+    parser.add_argument("--warmup", type=float, default=2, help="seconds of unmeasured load per endpoint")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=1, help="API worker processes")
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--gemini-latency-ms", type=float, default=800)
+    parser.add_argument("--slack-latency-ms", type=float, default=50)
+    parser.add_argument("--label", default="", help="suffix for the result file name")
+    parser.add_argument("--compare", help="previous result file to compare against")
+    parser.add_argument("--fail-threshold", type=float, default=0.2,
+                        help="relative regression that makes --compare exit non-zero")
+    args = parser.parse_args()
+    args.endpoints = [name.strip() for name in args.endpoints.split(",") if name.strip()]
+    unknown = [name for name in args.endpoints if name not in ENDPOINTS]
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(unknown)}")
+
+    slack = SlackStub(args.slack_latency_ms).start()
+    os.environ["SLACK_WEBHOOK_URL"] = slack.url
+
+    results = {"meta": dict(environment(), **{
+        "backend": args.backend, "concurrency": args.concurrency, "workers": args.workers,
+        "duration_s": args.duration, "gemini_latency_ms": args.gemini_latency_ms,
+    })}
+    try:
+        for label in [value.strip() for value in args.rows.split(",") if value.strip()]:
+            results[label] = bench_rows(args, parse_count(label), label)
+    finally:
+        slack.stop()
+
+    save_results("api", results, args.label)
+    failing = [f"{name} ({label})" for label, section in results.items() if label != "meta"
+               for name, stats in section.items() if stats["errors"]]
+    if failing:
+        print(f"❌ Requests failed on {', '.join(failing)}")
+        sys.exit(1)
+    if args.compare:
+        sections = {label: COMPARED_METRICS for label in results if label != "meta"}
+        if not compare_results(Path(args.compare), results, sections, args.fail_threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
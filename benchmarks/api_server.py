@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+"""
+SmartGuard API under benchmark: the real `api.app`, with google.generativeai
+replaced by a local stub before anything imports it.
+
+Started by api_bench.py; uvicorn workers re-import this module (not api.py),
+so every worker gets the stub too.
+"""
+
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from common import install_gemini_stub, use_backend
+
+install_gemini_stub()
+use_backend()
+
+from api import app  # noqa: E402
+
+if __name__ == "__main__":
+    import uvicorn
+    port = int(os.getenv("API_PORT", "8800"))
+    workers = int(os.getenv("API_WORKERS", "1"))
+    uvicorn.run("api_server:app", host="127.0.0.1", port=port, workers=workers,
+                app_dir=str(Path(__file__).resolve().parent), log_level="warning")
@@ -0,0 +1,252 @@
+"""
+Shared helpers for the SmartGuard benchmarks:
+stub Gemini / Slack, synthetic log seeding, latency statistics and result files.
+"""
+
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+import types
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+BACKEND_DIR = REPO_ROOT / "backend"
+BENCH_DIR = Path(__file__).resolve().parent
+RESULTS_DIR = BENCH_DIR / "results"
+DATA_DIR = BENCH_DIR / ".data"
+
+def use_backend():
+    """Make the flat backend modules importable (they import each other by bare name)"""
+    if str(BACKEND_DIR) not in sys.path:
+        sys.path.insert(0, str(BACKEND_DIR))
+
+
+def parse_count(value: str) -> int:
+    """'10k' -> 10000, '1m' -> 1000000"""
+    value = value.strip().lower()
+    multiplier = {"k": 1_000, "m": 1_000_000}.get(value[-1:], 1)
+    return int(float(value.rstrip("km")) * multiplier)
+
+
+# 🔹 Stub Gemini
+class _StubUsage:
+    def __init__(self, prompt_tokens, output_tokens):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = output_tokens
+
+
+class _StubResponse:
+    def __init__(self, text, prompt):
+        self.text = text
+        self.usage_metadata = _StubUsage(len(prompt) // 4, len(text) // 4)
+
+
+class StubGenerativeModel:
+    """Stands in for genai.GenerativeModel with a configurable latency"""
+
+    latency_ms = 800.0
+    jitter_ms = 200.0
+    calls = 0
+
+    def __init__(self, name, *args, **kwargs):
+        self.name = name
+
+    def generate_content(self, prompt, *args, **kwargs):
+        StubGenerativeModel.calls += 1
+        delay = max(0.0, random.gauss(self.latency_ms, self.jitter_ms)) / 1000
+        time.sleep(delay)
+        if "Return JSON" in prompt:
+            text = json.dumps({
+                "interpreted_query": "Recent errors in the checkout path",
+                "filters": {"services": ["checkoutservice", "paymentservice"],
+                            "severity": ["ERROR"], "time_range": "last 24 hours"},
+                "summary": "Errors in checkout and payment services",
+            })
+        else:
+            text = ("Root cause: database connection pool exhausted in checkoutservice (connection errors). "
+                    "Severity: critical. Suggested fix: raise the pool size and add retries.")
+        return _StubResponse(text, prompt)
+
+
+def install_gemini_stub(latency_ms: float = None, jitter_ms: float = None):
+    """Replace google.generativeai in sys.modules so no request ever reaches Google"""
+    StubGenerativeModel.latency_ms = float(latency_ms if latency_ms is not None
+                                           else os.getenv("BENCH_GEMINI_LATENCY_MS", "800"))
+    StubGenerativeModel.jitter_ms = float(jitter_ms if jitter_ms is not None
+                                          else os.getenv("BENCH_GEMINI_JITTER_MS", "200"))
+    genai = types.ModuleType("google.generativeai")
+    genai.configure = lambda **kwargs: None
+    genai.GenerativeModel = StubGenerativeModel
+    genai.get_model = lambda name: {"name": name}
+    try:
+        import google
+    except ImportError:
+        google = types.ModuleType("google")
+        google.__path__ = []
+        sys.modules["google"] = google
+    google.generativeai = genai
+    sys.modules["google.generativeai"] = genai
+    return genai
+
+
+# 🔹 Stub Slack
+class SlackStub:
+    """Local HTTP server accepting Slack webhook posts after a configurable delay"""
+
+    def __init__(self, latency_ms: float = 50.0, port: int = 0):
+        stub = self
+        self.latency_ms = latency_ms
+        self.received = 0
+        self.lock = threading.Lock()
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                time.sleep(stub.latency_ms / 1000)
+                with stub.lock:
+                    stub.received += 1
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain")
+                self.end_headers()
+                self.wfile.write(b"ok")
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}/services/bench"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+
+# 🔹 Synthetic logs
+def synthetic_logs(count: int, hours: float = 48, seed: int = 42):
+    """Yield `count` log dicts spread over the last `hours` hours (reproducible for a given seed)"""
+    use_backend()
+    from synthetic_logs import SyntheticLogGenerator
+    return SyntheticLogGenerator(hours=hours, seed=seed).records(count)
+
+
+def seed_log_store(store, rows: int, reset: bool = False, batch_size: int = 50_000):
+    """
+    Make the store's `logs` table hold exactly `rows` synthetic rows.
+    A Postgres table is only replaced with reset=True.
+    """
+    store.init_schema()
+    existing = store.fetchall("SELECT COUNT(*) FROM logs")[0][0]
+    marker = store.fetchall("SELECT value FROM app_state WHERE key = %s", ("bench_rows",))
+    if existing == rows and marker and int(marker[0][0]) == rows:
+        print(f"✅ Reusing {rows:,} seeded rows in the {store.backend} store")
+        return
+    if existing and store.backend == "postgres" and not reset:
+        raise SystemExit(f"❌ logs table already has {existing:,} rows; pass --reset to replace them")
+
+    print(f"🌱 Seeding {rows:,} rows into the {store.backend} store...")
+    started = time.perf_counter()
+    store.execute("DELETE FROM logs")
+    store.execute("DELETE FROM shared_cache")
+    use_backend()
+    from synthetic_logs import SyntheticLogGenerator, parse_incident, write_log_store
+    # Two days of traffic with a couple of incidents for the anomaly/timeline endpoints
+    end = datetime.now()
+    incidents = [parse_incident("checkoutservice:180:30", end), parse_incident("paymentservice:1500:45:5", end)]
+    generator = SyntheticLogGenerator(hours=48, end=end, incidents=incidents, seed=42)
+    write_log_store(generator.batches(rows, batch_size), store)
+    store.execute("DELETE FROM app_state WHERE key = %s", ("bench_rows",))
+    store.execute("INSERT INTO app_state (key, value) VALUES (%s, %s)", ("bench_rows", str(rows)))
+    print(f"✅ Seeded in {time.perf_counter() - started:.1f}s")
+
+
+# 🔹 Statistics & results
+def percentile(sorted_values, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100 * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+def latency_stats(latencies_s, elapsed_s: float, errors: int = 0) -> dict:
+    values = sorted(latency * 1000 for latency in latencies_s)
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "elapsed_s": round(elapsed_s, 3),
+        "throughput_rps": round(len(values) / elapsed_s, 2) if elapsed_s else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(values, 50), 2),
+            "p90": round(percentile(values, 90), 2),
+            "p99": round(percentile(values, 99), 2),
+            "max": round(values[-1], 2) if values else 0.0,
+            "mean": round(sum(values) / len(values), 2) if values else 0.0,
+        },
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def environment() -> dict:
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def save_results(kind: str, results: dict, label: str = "") -> Path:
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    path = RESULTS_DIR / f"{kind}{'-' + label if label else ''}-{stamp}.json"
+    path.write_text(json.dumps(results, indent=2))
+    print(f"💾 Results saved to {path}")
+    return path
+
+
+def compare_results(baseline_path, results: dict, metric_paths, threshold: float = 0.2) -> bool:
+    """
+    Print the relative change of every metric against a previous result file.
+    `metric_paths` maps a section name to [(metric key path, higher_is_better)].
+    Returns False if anything regressed by more than `threshold`.
+    """
+    baseline = json.loads(Path(baseline_path).read_text())
+    ok = True
+    print(f"\n📊 Compared with {baseline_path} (commit {baseline.get('meta', {}).get('git_commit', '?')})")
+    for section, metrics in metric_paths.items():
+        for name in results.get(section, {}):
+            old_entry = baseline.get(section, {}).get(name)
+            if not old_entry:
+                continue
+            for path, higher_is_better in metrics:
+                old, new = old_entry, results[section][name]
+                for key in path.split("."):
+                    old, new = old.get(key, 0), new.get(key, 0)
+                if not old:
+                    continue
+                change = (new - old) / old
+                regressed = change < -threshold if higher_is_better else change > threshold
+                ok = ok and not regressed
+                marker = "❌" if regressed else "✅"
+                print(f"  {marker} {name:<28} {path:<20} {old:>10} -> {new:<10} ({change:+.1%})")
+    return ok
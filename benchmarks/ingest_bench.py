@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+SmartGuard ingest pipeline microbenchmarks (backend/smartguard.py).
+
+Drives the real `fetch_logs`, `analyze_logs`, `store_log`, `send_alert`,
+`run_cycle` and the per-source `SourcePool` (log_sources.py) against local fakes
+with configurable latencies:
+- a fake Cloud Logging client returning synthetic entries page by page,
+- the stub Gemini model from common.py,
+- a local Slack webhook server,
+- Postgres from DB_* (--db postgres) or a SQLite file behind a psycopg2-like
+  adapter with a simulated connection setup cost (--db sqlite, the default).
+
+Reports the cost of each stage in isolation, the per-stage split of full
+`run_cycle` passes, end-to-end logs/sec and the logs/sec of `--sources` log
+sources polled from their cursors by a pool of `--source-workers`.
+
+    python benchmarks/ingest_bench.py --entries 500 --gemini-latency-ms 800 --cycles 3 --sources 4
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import re
+import sqlite3
+import sys
+import time
+import types
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from common import (
+    DATA_DIR, SlackStub, StubGenerativeModel, compare_results, environment,
+    install_gemini_stub, latency_stats, save_results, synthetic_logs, use_backend
+)
+
+COMPARED_METRICS = {
+    "stages": [("per_item_ms", False)],
+    "end_to_end": [("logs_per_sec", True)],
+    "sources": [("logs_per_sec", True)],
+}
+_SINCE = re.compile(r'timestamp >= "([^"]+)Z"')
+
+
+# 🔹 Fake Cloud Logging
+class FakeEntry:
+    """The attributes of google.cloud.logging_v2 entries that smartguard reads"""
+
+    def __init__(self, timestamp, service, severity, payload, insert_id):
+        self.timestamp = timestamp
+        self.insert_id = insert_id
+        self.resource = types.SimpleNamespace(labels={"container_name": service})
+        self.severity = severity
+        self.payload = payload
+
+
+class FakeLoggingClient:
+    """list_entries() over synthetic entries after the filter's `timestamp >=`, paying a latency per call and page"""
+
+    def __init__(self, count: int, call_latency_ms: float = 100, page_latency_ms: float = 30, seed: int = 7):
+        self.call_latency_ms = call_latency_ms
+        self.page_latency_ms = page_latency_ms
+        now = datetime.now(timezone.utc)
+        rng = random.Random(seed)
+        self.entries = []
+        for i, log in enumerate(synthetic_logs(count, hours=5 / 60, seed=seed)):
+            payload = {
+                "message": log["raw_log"],
+                "logging.googleapis.com/trace": f"projects/demo/traces/{rng.getrandbits(64):016x}",
+                "httpRequest": {"status": 500 if log["severity"] == "ERROR" else 200,
+                                "latency": f"{rng.uniform(0.01, 3):.3f}s"},
+            }
+            timestamp = now - timedelta(seconds=i * 300 / max(count, 1))
+            self.entries.append(
+                FakeEntry(timestamp, log["service"], log["severity"], payload, insert_id=f"bench-{seed}-{i}"))
+
+    def list_entries(self, filter_=None, order_by=None, page_size=None, **kwargs):
+        time.sleep(self.call_latency_ms / 1000)
+        page_size = page_size or 50
+        entries = self.entries if order_by != "timestamp asc" else self.entries[::-1]
+        since = _SINCE.search(filter_ or "")
+        if since:
+            bound = datetime.fromisoformat(since.group(1)).replace(tzinfo=timezone.utc)
+            entries = [entry for entry in entries if entry.timestamp >= bound]
+        for i, entry in enumerate(entries):
+            if i and i % page_size == 0:
+                time.sleep(self.page_latency_ms / 1000)
+            yield entry
+
+
+def install_logging_stub():
+    """fetch_logs imports ASCENDING/DESCENDING from google.cloud.logging_v2; provide them if the SDK is missing"""
+    try:
+        from google.cloud.logging_v2 import ASCENDING, DESCENDING  # noqa: F401
+        return
+    except ImportError:
+        pass
+    google = sys.modules.get("google") or types.ModuleType("google")
+    google.__path__ = getattr(google, "__path__", [])
+    cloud = types.ModuleType("google.cloud")
+    cloud.__path__ = []
+    logging_v2 = types.ModuleType("google.cloud.logging_v2")
+    logging_v2.ASCENDING = "timestamp asc"
+    logging_v2.DESCENDING = "timestamp desc"
+    cloud.logging_v2 = logging_v2
+    google.cloud = cloud
+    sys.modules.update({"google": google, "google.cloud": cloud, "google.cloud.logging_v2": logging_v2})
+
+
+# 🔹 SQLite stand-in for psycopg2
+class _SqliteCursor:
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def execute(self, query, params=()):
+        if query.startswith("SELECT pg_advisory"):
+            return  # SQLite serializes writers on its own
+        self.cursor.execute(query.replace("%s", "?"), params)
+
+    @property
+    def rowcount(self):
+        return self.cursor.rowcount
+
+    def close(self):
+        self.cursor.close()
+
+
+class SqliteConnection:
+    """Enough of a psycopg2 connection for smartguard.init_db/store_log"""
+
+    def __init__(self, path, connect_latency_ms: float = 0):
+        time.sleep(connect_latency_ms / 1000)
+        self.conn = sqlite3.connect(path)
+
+    def cursor(self):
+        return _SqliteCursor(self.conn.cursor())
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+def init_sqlite_schema(path):
+    """smartguard.init_db speaks Postgres DDL; build the same logs schema in the SQLite stand-in"""
+    from log_fields import add_field_columns
+    from payload_store import add_payload_column, schema_statements
+
+    conn = sqlite3.connect(path)
+    cur = conn.cursor()
+    cur.execute("""CREATE TABLE IF NOT EXISTS logs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT, service TEXT,
+        severity TEXT, raw_log TEXT, ai_summary TEXT
+    )""")
+    for statement in schema_statements("sqlite"):
+        cur.execute(statement)
+    add_payload_column(cur, "sqlite")
+    add_field_columns(cur, "sqlite")
+    conn.commit()
+    conn.close()
+
+
+# 🔹 Measurements
+def time_calls(func, calls: int, items_per_call: int = 1) -> dict:
+    durations = []
+    started = time.perf_counter()
+    for _ in range(calls):
+        call_started = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - call_started)
+    elapsed = time.perf_counter() - started
+    stats = latency_stats(durations, elapsed)
+    stats["per_item_ms"] = round(elapsed * 1000 / (calls * items_per_call), 3)
+    return stats
+
+
+def timed_wrapper(func, totals: dict, name: str):
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            totals[name] = totals.get(name, 0.0) + time.perf_counter() - started
+    return wrapper
+
+
+def bench_stages(smartguard, args) -> dict:
+    sample = next(synthetic_logs(1))
+    stages = {}
+    stages["fetch_logs"] = time_calls(smartguard.fetch_logs, args.fetch_calls, args.entries)
+    stages["analyze_logs"] = time_calls(
+        lambda: smartguard.analyze_logs(sample["raw_log"], service=sample["service"]), args.calls)
+    stages["store_log"] = time_calls(
+        lambda: smartguard.store_log(sample["timestamp"], sample["service"], sample["severity"],
+                                     sample["raw_log"], sample["ai_summary"]), args.calls * 10)
+    stages["send_alert"] = time_calls(lambda: smartguard.send_alert("Benchmark alert"), args.calls)
+    return stages
+
+
+def bench_pipeline(smartguard, args) -> dict:
+    from admission import AdmissionController
+    totals = {}
+    for name in ("fetch_logs", "analyze_logs", "store_log", "send_alert"):
+        setattr(smartguard, name, timed_wrapper(getattr(smartguard, name), totals, name))
+
+    fetched = 0
+    counts = {"analyzed": 0, "skipped": 0, "alerts": 0}
+    admission = smartguard.admission_controller = AdmissionController()
+    started = time.perf_counter()
+    for _ in range(args.cycles):
+        # New admission window per pass, as if passes were a window apart; the queue carries over
+        admission.window_start = time.monotonic() - admission.window_seconds
+        result = smartguard.run_cycle()
+        fetched += result["fetched"]
+        for key in counts:
+            counts[key] += result[key]
+    # What is still queued is stored without analysis at shutdown
+    counts["skipped"] += smartguard.flush_admission(admission)
+    elapsed = time.perf_counter() - started
+
+    totals["admission+other"] = max(0.0, elapsed - sum(totals.values()))
+    return {
+        "pipeline": {
+            "cycles": args.cycles,
+            "logs": fetched,
+            **counts,
+            "elapsed_s": round(elapsed, 3),
+            "logs_per_sec": round(fetched / elapsed, 2) if elapsed else 0.0,
+            "stage_seconds": {name: round(value, 3) for name, value in totals.items()},
+            "stage_share": {name: round(value / elapsed, 3) for name, value in totals.items()} if elapsed else {},
+        }
+    }
+
+
+def bench_sources(smartguard, args) -> dict:
+    """Every source polled once per pass through the SourcePool, each from its own cursor and fake project"""
+    from log_sources import LogSource, SourcePool
+    sources = [LogSource(f"bench-{i}", project=f"bench-project-{i}", max_entries=args.source_max_entries,
+                         ai_budget=args.ai_budget) for i in range(args.sources)]
+    for i, source in enumerate(sources):
+        smartguard._logging_clients[source.project] = FakeLoggingClient(
+            args.entries, args.gcp_call_latency_ms, args.gcp_page_latency_ms, seed=100 + i)
+    pool = SourcePool(sources, workers=args.source_workers, cycle=smartguard.run_cycle)
+
+    fetched = 0
+    durations = []
+    started = time.perf_counter()
+    try:
+        for _ in range(args.cycles):
+            pass_started = time.perf_counter()
+            for name, result in pool.run_once().items():
+                if "error" in result:
+                    raise RuntimeError(f"Log source {name} failed: {result['error']}")
+                fetched += result["fetched"]
+            durations.append(time.perf_counter() - pass_started)
+    finally:
+        pool.executor.shutdown(wait=True)
+    elapsed = time.perf_counter() - started
+    return {
+        "pool": {
+            **latency_stats(durations, elapsed),
+            "sources": args.sources,
+            "workers": args.source_workers,
+            "logs": fetched,
+            "logs_per_sec": round(fetched / elapsed, 2) if elapsed else 0.0,
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SmartGuard ingest pipeline microbenchmarks")
+    parser.add_argument("--entries", type=int, default=500, help="entries returned by each fetch")
+    parser.add_argument("--fetch-calls", type=int, default=3)
+    parser.add_argument("--calls", type=int, default=20, help="calls per isolated analyze/alert stage")
+    parser.add_argument("--cycles", type=int, default=3, help="full run_cycle passes")
+    parser.add_argument("--ai-budget", type=int, default=20, help="AI_ANALYSIS_BUDGET per pass")
+    parser.add_argument("--sources", type=int, default=4, help="log sources in the SourcePool case")
+    parser.add_argument("--source-workers", type=int, default=4)
+    parser.add_argument("--source-max-entries", type=int, default=200, help="max_entries per source cycle")
+    parser.add_argument("--gcp-call-latency-ms", type=float, default=100)
+    parser.add_argument("--gcp-page-latency-ms", type=float, default=30)
+    parser.add_argument("--gemini-latency-ms", type=float, default=800)
+    parser.add_argument("--gemini-jitter-ms", type=float, default=100)
+    parser.add_argument("--slack-latency-ms", type=float, default=50)
+    parser.add_argument("--db", choices=["sqlite", "postgres"], default="sqlite")
+    parser.add_argument("--db-connect-latency-ms", type=float, default=5,
+                        help="simulated connection setup cost of the SQLite stand-in")
+    parser.add_argument("--label", default="")
+    parser.add_argument("--compare", help="previous result file to compare against")
+    parser.add_argument("--fail-threshold", type=float, default=0.2)
+    args = parser.parse_args()
+
+    slack = SlackStub(args.slack_latency_ms).start()
+    os.environ.update({
+        "GEMINI_API_KEY": "bench-stub",
+        "SLACK_WEBHOOK_URL": slack.url,
+        "GEMINI_RPM_LIMIT": "1000000",
+        "GEMINI_TPM_LIMIT": "1000000000",
+        "AI_ANALYSIS_BUDGET": str(args.ai_budget),
+    })
+    install_gemini_stub(args.gemini_latency_ms, args.gemini_jitter_ms)
+    install_logging_stub()
+    use_backend()
+    import smartguard
+
+    smartguard._logging_clients[None] = FakeLoggingClient(
+        args.entries, args.gcp_call_latency_ms, args.gcp_page_latency_ms)
+    smartguard._gemini_model = StubGenerativeModel("gemini-2.5-flash")
+    smartguard.SLACK_WEBHOOK_URL = slack.url
+    if args.db == "sqlite":
+        DATA_DIR.mkdir(parents=True, exist_ok=True)
+        db_path = DATA_DIR / "ingest_bench.db"
+        db_path.unlink(missing_ok=True)
+        smartguard.get_db_connection = lambda: SqliteConnection(db_path, args.db_connect_latency_ms)
+        init_sqlite_schema(db_path)
+    else:
+        smartguard.init_db()
+
+    results = {"meta": dict(environment(), **{k: v for k, v in vars(args).items() if k not in ("compare", "label")})}
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            results["stages"] = bench_stages(smartguard, args)
+            results["sources"] = bench_sources(smartguard, args)
+            results["end_to_end"] = bench_pipeline(smartguard, args)
+    finally:
+        slack.stop()
+
+    print("⏱️ Stages (isolated)")
+    for name, stats in results["stages"].items():
+        print(f"  {name:<14} p50 {stats['latency_ms']['p50']:>9.2f}ms  p99 {stats['latency_ms']['p99']:>9.2f}ms  "
+              f"{stats['per_item_ms']:>9.3f}ms/item")
+    pipeline = results["end_to_end"]["pipeline"]
+    print(f"🚚 End to end: {pipeline['logs']} logs in {pipeline['elapsed_s']}s = {pipeline['logs_per_sec']} logs/sec "
+          f"({pipeline['analyzed']} analyzed, {pipeline['skipped']} stored without AI, {pipeline['alerts']} alerts)")
+    for name, share in sorted(pipeline["stage_share"].items(), key=lambda item: -item[1]):
+        print(f"  {name:<16} {share:>6.1%}")
+    pool = results["sources"]["pool"]
+    print(f"🛰️ Log sources: {pool['logs']} logs from {pool['sources']} sources on {pool['workers']} workers "
+          f"= {pool['logs_per_sec']} logs/sec (pass p50 {pool['latency_ms']['p50']:.0f}ms)")
+
+    save_results("ingest", results, args.label)
+    if args.compare and not compare_results(Path(args.compare), results, COMPARED_METRICS, args.fail_threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
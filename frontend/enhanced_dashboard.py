@@ -1,11 +1,13 @@
 import streamlit as st
 import requests
-import time
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-import networkx as nx
 import json
+import os
+import re
+import threading
+import time
 from datetime import datetime, timedelta
 import numpy as np
 from streamlit_chat import message
@@ -20,7 +22,12 @@ st.set_page_config(
 )
 
 # API Configuration
-API_BASE = "http://localhost:8000"
+API_BASE = os.getenv("API_BASE", "http://localhost:8000").rstrip("/")  # the API service when deployed separately
+LIVE_REFRESH_SECONDS = 5
+CACHE_FRESH_SECONDS = 10  # served without contacting the API; revalidated with its ETag afterwards
+CACHE_MAX_ENTRIES = 500
+AI_SEARCH_CACHE_SECONDS = 300
+LIVE_EVENTS_KEPT = 200
 
 # Custom CSS for modern UI
 st.markdown("""
@@ -90,22 +97,80 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Helper functions
-@st.cache_data(ttl=60)  # Increased cache time to reduce API calls
+@st.cache_resource
+def get_http_session():
+    """One pooled keep-alive session shared by every rerun and user session"""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=32)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+class SharedCache:
+    """
+    API responses shared by every session of this Streamlit process. GET responses are
+    revalidated with If-None-Match (a 304 costs the API no body) and only one session
+    refreshes a given entry at a time, so N viewers cost about one viewer's requests.
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.key_locks = {}
+
+    def _key_lock(self, key):
+        with self.lock:
+            return self.key_locks.setdefault(key, threading.Lock())
+
+    def _store(self, key, entry):
+        with self.lock:
+            self.entries[key] = entry
+            if len(self.entries) > CACHE_MAX_ENTRIES:
+                oldest = min(self.entries, key=lambda k: self.entries[k]["at"])
+                self.entries.pop(oldest)
+                self.key_locks.pop(oldest, None)
+
+    def get_json(self, url, params=None, fresh_seconds=CACHE_FRESH_SECONDS):
+        """JSON body of GET url?params; raises requests.HTTPError for non-200 answers"""
+        key = ("GET", url, json.dumps(params or {}, sort_keys=True, default=str))
+        with self._key_lock(key):
+            entry = self.entries.get(key)
+            if entry and time.monotonic() - entry["at"] < fresh_seconds:
+                return entry["data"]
+            headers = {"If-None-Match": entry["etag"]} if entry and entry["etag"] else {}
+            response = get_http_session().get(url, params=params, headers=headers, timeout=10)
+            if response.status_code == 304 and entry:
+                entry["at"] = time.monotonic()
+                return entry["data"]
+            response.raise_for_status()
+            data = response.json()
+            self._store(key, {"data": data, "etag": response.headers.get("ETag"), "at": time.monotonic()})
+            return data
+
+    def remember(self, key, compute, ttl):
+        """Cache compute() under `key` for `ttl` seconds (idempotent POSTs such as AI search)"""
+        with self._key_lock(key):
+            entry = self.entries.get(key)
+            if entry and time.monotonic() - entry["at"] < ttl:
+                return entry["data"]
+            data = compute()
+            if data:
+                self._store(key, {"data": data, "etag": None, "at": time.monotonic()})
+            return data
+
+@st.cache_resource
+def get_shared_cache():
+    return SharedCache()
+
 def fetch_data(endpoint, params=None):
-    """Fetch data from API with caching"""
+    """Fetch data from API through the cross-session ETag cache"""
     try:
-        if params:
-            response = requests.get(f"{API_BASE}/{endpoint}", params=params, timeout=10)
-        else:
-            response = requests.get(f"{API_BASE}/{endpoint}", timeout=10)
-        
-        if response.status_code == 200:
-            return response.json()
-        else:
-            st.warning(f"API error: {response.status_code} - {response.text}")
-            return {}
+        return get_shared_cache().get_json(f"{API_BASE}/{endpoint}", params)
+    except requests.exceptions.HTTPError as e:
+        st.warning(f"API error: {e.response.status_code} - {e.response.text}")
+        return {}
     except requests.exceptions.ConnectionError:
-        st.warning("⚠️ Cannot connect to API. Make sure the backend is running on http://localhost:8000")
+        st.warning(f"⚠️ Cannot connect to API. Make sure the backend is running on {API_BASE}")
         return {}
     except requests.exceptions.Timeout:
         st.warning("⚠️ API request timed out. The backend might be slow to respond.")
@@ -114,17 +179,34 @@ def fetch_data(endpoint, params=None):
         st.warning(f"Connection error: {e}")
         return {}
 
+@st.cache_data(ttl=15)
+def check_api_health():
+    """Backend readiness via /readyz: returns (status code or error kind, body)"""
+    try:
+        response = get_http_session().get(f"{API_BASE}/readyz", timeout=3)
+        try:
+            body = response.json()
+        except ValueError:
+            body = {}
+        return response.status_code, body
+    except requests.exceptions.ConnectionError:
+        return "connection_error", {}
+    except requests.exceptions.Timeout:
+        return "timeout", {}
+    except Exception as e:
+        return str(e), {}
+
 def post_data(endpoint, data):
     """Post data to API"""
     try:
-        response = requests.post(f"{API_BASE}/{endpoint}", json=data, timeout=20)
+        response = get_http_session().post(f"{API_BASE}/{endpoint}", json=data, timeout=20)
         if response.status_code == 200:
             return response.json()
         else:
             st.warning(f"API error: {response.status_code} - {response.text}")
             return {}
     except requests.exceptions.ConnectionError:
-        st.warning("⚠️ Cannot connect to API. Make sure the backend is running on http://localhost:8000")
+        st.warning(f"⚠️ Cannot connect to API. Make sure the backend is running on {API_BASE}")
         return {}
     except requests.exceptions.Timeout:
         st.warning("⚠️ API request timed out. The AI processing might be taking longer than expected.")
@@ -133,6 +215,127 @@ def post_data(endpoint, data):
         st.warning(f"Connection error: {e}")
         return {}
 
+def normalize_query(text):
+    """Same normalization as the API: case, inner whitespace and trailing punctuation don't matter"""
+    return re.sub(r"[\s?!.]+$", "", " ".join(str(text).lower().split()))
+
+def search_logs(query):
+    """AI search, answered once per normalized question for every session"""
+    normalized = normalize_query(query)
+    return get_shared_cache().remember(("ai-search", normalized),
+                                       lambda: post_data("ai-search", {"query": normalized}),
+                                       ttl=AI_SEARCH_CACHE_SECONDS)
+
+# Data layer: typed DataFrames, delta merges and server-side paged tables
+SEVERITY_ICONS = {"ERROR": "🔴", "WARNING": "⚠️", "INFO": "ℹ️"}
+LOG_FRAME_COLUMNS = ["id", "timestamp", "service", "severity", "ai_summary", "raw_log"]
+
+def logs_frame(records):
+    """Log dicts -> DataFrame with datetime timestamps, categorical service/severity and an icon column"""
+    frame = pd.DataFrame(records or [])
+    for column in LOG_FRAME_COLUMNS:
+        if column not in frame:
+            frame[column] = None
+    frame["timestamp"] = pd.to_datetime(frame["timestamp"], errors="coerce", format="ISO8601")
+    frame["service"] = frame["service"].astype("category")
+    frame["severity"] = frame["severity"].astype("category")
+    frame["icon"] = frame["severity"].astype(str).map(SEVERITY_ICONS).fillna("📝")
+    return frame
+
+def merge_delta(frame, records, keep):
+    """Newest-first frame with `records` (oldest first) merged in, deduplicated by id, capped at `keep` rows"""
+    if not records:
+        return frame
+    merged = pd.concat([logs_frame(records).iloc[::-1], frame], ignore_index=True)
+    merged = merged.drop_duplicates("id").head(keep)
+    merged["service"] = merged["service"].astype("category")
+    merged["severity"] = merged["severity"].astype("category")
+    return merged
+
+LOG_TABLE_CONFIG = {
+    "icon": st.column_config.TextColumn("", width="small"),
+    "timestamp": st.column_config.DatetimeColumn("Time", format="YYYY-MM-DD HH:mm:ss"),
+    "service": "Service",
+    "severity": "Severity",
+    "ai_summary": st.column_config.TextColumn("Summary", width="large"),
+}
+
+def show_log_table(frame, key):
+    """One table for many logs (instead of an expander per row); details of the selected row below it"""
+    event = st.dataframe(
+        frame[["icon", "timestamp", "service", "severity", "ai_summary"]],
+        column_config=LOG_TABLE_CONFIG, hide_index=True, use_container_width=True,
+        on_select="rerun", selection_mode="single-row", key=key
+    )
+    selected = event.selection.rows if event else []
+    if selected:
+        log = frame.iloc[selected[0]]
+        st.write(f"**{log['icon']} {log['service']} - {log['timestamp']}**")
+        st.write(log["ai_summary"] or "No summary available")
+        if log["raw_log"]:
+            st.code(log["raw_log"], language="text")
+    return selected
+
+def show_paged_logs(params, key):
+    """Server-side paged /logs table: only the visible page is fetched and rendered"""
+    col1, col2, col3 = st.columns([1, 1, 2])
+    with col1:
+        page_size = st.selectbox("Rows per page", [50, 100, 500], key=f"{key}_size")
+    with col2:
+        page = st.number_input("Page", min_value=1, value=1, step=1, key=f"{key}_page")
+    data = fetch_data("logs", dict(params, limit=page_size, offset=(page - 1) * page_size))
+    if not data:
+        st.warning("Unable to fetch logs")
+        return
+    total = data.get("total", len(data.get("logs", [])))
+    with col3:
+        st.write(f"{total} logs - page {page} of {max(1, -(-total // page_size))}")
+    frame = logs_frame(data.get("logs"))
+    if frame.empty:
+        st.info("No logs on this page")
+    else:
+        show_log_table(frame, key=f"{key}_table")
+
+@st.fragment(run_every=LIVE_REFRESH_SECONDS)
+def show_live_updates():
+    """Applies new-log deltas to session state every few seconds without rerunning the page"""
+    live = st.session_state.setdefault("live", {"cursor": None, "seen": set(), "counts": {}, "frame": logs_frame([]),
+                                                "since": None})
+    params = {"after_id": live["cursor"]} if live["cursor"] is not None else {}
+    try:
+        response = get_http_session().get(f"{API_BASE}/events/delta", params=params, timeout=5)
+        delta = response.json() if response.status_code == 200 else None
+    except (requests.exceptions.RequestException, ValueError):
+        delta = None
+    
+    if delta is None:
+        st.caption("⚠️ Live updates unavailable")
+        return
+    if live["cursor"] is None:
+        live["since"] = datetime.now().strftime("%H:%M:%S")
+    # A held cursor sends logs above it again: count each id once
+    new_logs = [log for log in delta["logs"] if log["id"] not in live["seen"]]
+    live["cursor"] = delta["cursor"]
+    live["seen"] = {log_id for log_id in live["seen"] | {log["id"] for log in new_logs} if log_id > delta["cursor"]}
+    counts = {}
+    for log in new_logs:
+        counts[log["severity"]] = counts.get(log["severity"], 0) + 1
+    for severity, count in counts.items():
+        live["counts"][severity] = live["counts"].get(severity, 0) + count
+    live["frame"] = merge_delta(live["frame"], new_logs, LIVE_EVENTS_KEPT)
+    
+    st.caption(f"🔴 Live since {live['since']}")
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric("New errors", live["counts"].get("ERROR", 0), delta=counts.get("ERROR") or None,
+                  delta_color="inverse")
+    with col2:
+        st.metric("New warnings", live["counts"].get("WARNING", 0), delta=counts.get("WARNING") or None,
+                  delta_color="inverse")
+    latest = live["frame"].head(5)
+    for icon, service, timestamp in zip(latest["icon"], latest["service"], latest["timestamp"]):
+        st.caption(f"{icon} {service} - {timestamp:%H:%M:%S}")
+
 # Main App
 def main():
     st.markdown('<h1 class="main-header">🛡️ SmartGuard AI Dashboard</h1>', unsafe_allow_html=True)
@@ -154,6 +357,10 @@ def main():
                 "nav-link-selected": {"background-color": "#667eea"},
             }
         )
+        
+        # Live updates: polls only the new-log delta, the page itself is not rerun
+        if st.toggle("🔄 Live updates", value=False):
+            show_live_updates()
     
     # Dashboard Overview
     if selected == "🏠 Dashboard":
@@ -187,77 +394,60 @@ def show_dashboard_overview():
     """Main dashboard overview with key metrics"""
     st.header("📊 System Overview")
     
-    # API Health Check
-    with st.spinner("Checking API connection..."):
-        try:
-            health_response = requests.get(f"{API_BASE}/metrics", timeout=5)
-            if health_response.status_code == 200:
-                st.success("✅ API Backend Connected")
-            else:
-                st.error(f"❌ API Backend Error: {health_response.status_code}")
-        except requests.exceptions.ConnectionError:
-            st.error("❌ API Backend Not Connected - Make sure it's running on port 8000")
-        except requests.exceptions.Timeout:
-            st.warning("⚠️ API Backend Slow Response")
-        except Exception as e:
-            st.error(f"❌ API Connection Error: {e}")
+    # One round trip for the whole page (shared with the Alerts page)
+    summary = fetch_data("dashboard/summary", {"alerts": 20, "logs": 10})
+    
+    # API Health Check: readiness comes with the summary; /readyz only when that failed
+    if summary:
+        readiness = summary.get("readiness", {})
+        status = 200 if readiness.get("ready") else 503
+    else:
+        status, readiness = check_api_health()
+    if status == 200:
+        st.success("✅ API Backend Connected")
+    elif status == 503:
+        st.warning("⏳ API Backend is starting up or a required dependency is down")
+    elif status == "connection_error":
+        st.error("❌ API Backend Not Connected - Make sure it's running on port 8000")
+    elif status == "timeout":
+        st.warning("⚠️ API Backend Slow Response")
+    else:
+        st.error(f"❌ API Backend Error: {status}")
+
+    dependencies = readiness.get("dependencies", {})
+    if dependencies:
+        with st.expander("🔌 Dependency status"):
+            for name, dep in dependencies.items():
+                icon = "✅" if dep.get("ok") else "⚠️"
+                st.write(f"{icon} **{name}** - {dep.get('detail', '')}")
     
     # Key metrics row
     col1, col2, col3, col4 = st.columns(4)
-    
-    # Get basic metrics with error handling
-    try:
-        metrics_data = fetch_data("metrics")
-        alerts_data = fetch_data("alerts", {"limit": 5})
-        service_health = fetch_data("service-health")
-    except Exception as e:
-        st.warning(f"Error fetching dashboard data: {e}")
-        metrics_data = {}
-        alerts_data = {}
-        service_health = {}
+    totals = summary.get("totals") if summary else None
     
     with col1:
-        if metrics_data and "metrics" in metrics_data:
-            error_count = sum(m["count"] for m in metrics_data["metrics"] if m["severity"] == "ERROR")
-            st.metric("🚨 Errors", error_count)
-        else:
-            st.metric("🚨 Errors", "N/A")
+        st.metric("🚨 Errors", totals["errors"] if totals else "N/A")
     
     with col2:
-        if metrics_data and "metrics" in metrics_data:
-            warning_count = sum(m["count"] for m in metrics_data["metrics"] if m["severity"] == "WARNING")
-            st.metric("⚠️ Warnings", warning_count)
-        else:
-            st.metric("⚠️ Warnings", "N/A")
+        st.metric("⚠️ Warnings", totals["warnings"] if totals else "N/A")
     
     with col3:
-        if service_health and "services" in service_health:
-            healthy_services = sum(1 for s in service_health["services"].values() if s["status"] == "healthy")
-            total_services = len(service_health["services"])
-            st.metric("✅ Healthy Services", f"{healthy_services}/{total_services}")
+        if totals:
+            st.metric("✅ Healthy Services", f"{totals['healthy_services']}/{totals['total_services']}")
         else:
             st.metric("✅ Healthy Services", "N/A")
     
     with col4:
-        if alerts_data and "alerts" in alerts_data:
-            active_alerts = len(alerts_data["alerts"])
-            st.metric("🔔 Active Alerts", active_alerts)
-        else:
-            st.metric("🔔 Active Alerts", "N/A")
+        st.metric("🔔 Active Alerts", len(summary["alerts"]) if summary else "N/A")
     
     # Recent logs
     st.subheader("📜 Recent Activity")
-    logs_data = fetch_data("logs", {"limit": 10})
     
-    if logs_data and "logs" in logs_data:
-        logs_df = pd.DataFrame(logs_data["logs"])
-        if not logs_df.empty:
-            # Display logs in a nice format
-            for _, log in logs_df.iterrows():
-                severity_icon = {"ERROR": "🔴", "WARNING": "⚠️", "INFO": "ℹ️"}.get(log["severity"], "📝")
-                st.write(f"{severity_icon} **{log['service']}** - {log['timestamp']}")
-                st.write(f"   {log['ai_summary']}")
-                st.write("---")
+    if summary:
+        recent_logs = logs_frame(summary.get("recent_logs"))
+        if not recent_logs.empty:
+            st.dataframe(recent_logs[["icon", "timestamp", "service", "severity", "ai_summary"]],
+                         column_config=LOG_TABLE_CONFIG, hide_index=True, use_container_width=True)
         else:
             st.info("No recent logs found")
     else:
@@ -281,56 +471,6 @@ def show_log_explorer():
     with col2:
         search_button = st.button("🔍 Search", type="primary")
     
-    if search_button and search_query:
-        with st.spinner("🤖 AI is analyzing your query..."):
-            ai_search_result = post_data("ai-search", {"query": search_query})
-            
-            if ai_search_result:
-                # Display AI analysis
-                st.subheader("🤖 AI Analysis")
-                ai_analysis = ai_search_result.get("ai_analysis", {})
-                
-                col1, col2 = st.columns(2)
-                with col1:
-                    st.write("**Interpreted Query:**")
-                    st.info(ai_analysis.get("interpreted_query", "N/A"))
-                
-                with col2:
-                    st.write("**Summary:**")
-                    st.success(ai_analysis.get("summary", "N/A"))
-                
-                # Display filters applied
-                filters = ai_analysis.get("filters", {})
-                if filters:
-                    st.write("**Filters Applied:**")
-                    filter_text = []
-                    if filters.get("services"):
-                        filter_text.append(f"Services: {', '.join(filters['services'])}")
-                    if filters.get("severity"):
-                        filter_text.append(f"Severity: {', '.join(filters['severity'])}")
-                    if filters.get("time_range"):
-                        filter_text.append(f"Time Range: {filters['time_range']}")
-                    
-                    st.write(" | ".join(filter_text))
-                
-                # Display results
-                st.subheader(f"📋 Search Results ({ai_search_result.get('total_found', 0)} found)")
-                
-                logs = ai_search_result.get("logs", [])
-                if logs:
-                    for log in logs:
-                        severity_icon = {"ERROR": "🔴", "WARNING": "⚠️", "INFO": "ℹ️"}.get(log.get("severity"), "📝")
-                        
-                        with st.expander(f"{severity_icon} {log.get('service', 'Unknown')} - {log.get('timestamp', 'N/A')}"):
-                            st.write("**AI Summary:**")
-                            st.write(log.get("ai_summary", "No summary available"))
-                            st.write("**Raw Log:**")
-                            st.code(log.get("raw_log", "No raw log available"))
-                else:
-                    st.info("No logs found matching your query")
-            else:
-                st.error("Failed to process your query. Please try again.")
-    
     # Quick search examples
     st.subheader("💡 Quick Search Examples")
     examples = [
@@ -345,81 +485,82 @@ def show_log_explorer():
     for i, example in enumerate(examples):
         with cols[i]:
             if st.button(example, key=f"example_{i}"):
-                # Use a different approach to trigger search
-                st.session_state[f"search_query_{i}"] = example
-                st.rerun()
+                search_query, search_button = example, True
     
-    # Check if any example was clicked
-    for i, example in enumerate(examples):
-        if f"search_query_{i}" in st.session_state:
-            # Update the search query and trigger search
-            search_query = st.session_state[f"search_query_{i}"]
-            del st.session_state[f"search_query_{i}"]  # Clean up
+    # The result stays in session state so paging through it doesn't re-run the AI search
+    if search_button and search_query:
+        with st.spinner("🤖 AI is analyzing your query..."):
+            st.session_state.ai_search_result = search_logs(search_query)
+            st.session_state.pop("ai_results_page", None)
+    
+    if "ai_search_result" in st.session_state:
+        ai_search_result = st.session_state.ai_search_result
+        if ai_search_result:
+            # Display AI analysis
+            st.subheader("🤖 AI Analysis")
+            ai_analysis = ai_search_result.get("ai_analysis", {})
             
-            # Trigger the search automatically
-            with st.spinner("🤖 AI is analyzing your query..."):
-                ai_search_result = post_data("ai-search", {"query": search_query})
+            col1, col2 = st.columns(2)
+            with col1:
+                st.write("**Interpreted Query:**")
+                st.info(ai_analysis.get("interpreted_query", "N/A"))
+            
+            with col2:
+                st.write("**Summary:**")
+                st.success(ai_analysis.get("summary", "N/A"))
+            
+            # Display filters applied
+            filters = ai_analysis.get("filters", {})
+            if filters:
+                st.write("**Filters Applied:**")
+                filter_text = []
+                if filters.get("services"):
+                    filter_text.append(f"Services: {', '.join(filters['services'])}")
+                if filters.get("severity"):
+                    filter_text.append(f"Severity: {', '.join(filters['severity'])}")
+                if filters.get("time_range"):
+                    filter_text.append(f"Time Range: {filters['time_range']}")
                 
-                if ai_search_result:
-                    # Display AI analysis
-                    st.subheader("🤖 AI Analysis")
-                    ai_analysis = ai_search_result.get("ai_analysis", {})
-                    
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        st.write("**Interpreted Query:**")
-                        st.info(ai_analysis.get("interpreted_query", "N/A"))
-                    
-                    with col2:
-                        st.write("**Summary:**")
-                        st.success(ai_analysis.get("summary", "N/A"))
-                    
-                    # Display filters applied
-                    filters = ai_analysis.get("filters", {})
-                    if filters:
-                        st.write("**Filters Applied:**")
-                        filter_text = []
-                        if filters.get("services"):
-                            filter_text.append(f"Services: {', '.join(filters['services'])}")
-                        if filters.get("severity"):
-                            filter_text.append(f"Severity: {', '.join(filters['severity'])}")
-                        if filters.get("time_range"):
-                            filter_text.append(f"Time Range: {filters['time_range']}")
-                        
-                        st.write(" | ".join(filter_text))
-                    
-                    # Display results
-                    st.subheader(f"📋 Search Results ({ai_search_result.get('total_found', 0)} found)")
-                    
-                    logs = ai_search_result.get("logs", [])
-                    if logs:
-                        for log in logs:
-                            severity_icon = {"ERROR": "🔴", "WARNING": "⚠️", "INFO": "ℹ️"}.get(log.get("severity"), "📝")
-                            
-                            with st.expander(f"{severity_icon} {log.get('service', 'Unknown')} - {log.get('timestamp', 'N/A')}"):
-                                st.write("**AI Summary:**")
-                                st.write(log.get("ai_summary", "No summary available"))
-                                st.write("**Raw Log:**")
-                                st.code(log.get("raw_log", "No raw log available"))
-                    else:
-                        st.info("No logs found matching your query")
-                else:
-                    st.error("Failed to process your query. Please try again.")
+                st.write(" | ".join(filter_text))
+            
+            # Display results, every match paged from the server
+            st.subheader(f"📋 Search Results ({ai_search_result.get('total_found', 0)} found)")
+            
+            if ai_search_result.get("total_found"):
+                log_query = {k: v for k, v in ai_search_result.get("log_query", {}).items() if v}
+                show_paged_logs(log_query, key="ai_results")
+            else:
+                st.info("No logs found matching your query")
+        else:
+            st.error("Failed to process your query. Please try again.")
+    
+    # Plain browsing with filters, paged server-side
+    st.subheader("📜 Browse Logs")
+    services = sorted((fetch_data("service-health") or {}).get("services", {}))
+    col1, col2 = st.columns(2)
+    with col1:
+        service_filter = st.multiselect("Services", services, key="browse_services")
+    with col2:
+        severity_filter = st.multiselect("Severities", ["ERROR", "WARNING", "INFO"], key="browse_severities")
+    show_paged_logs({"service": service_filter, "severity": severity_filter}, key="browse")
 
 def show_incident_timeline():
     """Interactive incident timeline"""
     st.header("📊 Incident Timeline")
     
     # Timeline controls
-    col1, col2 = st.columns([1, 3])
+    col1, col2, col3 = st.columns([1, 1, 2])
     with col1:
         hours = st.selectbox("Time Range", [1, 6, 12, 24, 48, 72], index=3)
     
     with col2:
+        bucket = st.selectbox("Bucket", ["1m", "5m", "1h", "1d"], index=1 if hours <= 6 else 2)
+    
+    with col3:
         st.write(f"Showing events from the last {hours} hours")
     
-    # Fetch timeline data
-    timeline_data = fetch_data("timeline", {"hours": hours})
+    # Fetch timeline data (counts per bucket plus a few representative events)
+    timeline_data = fetch_data("timeline", {"hours": hours, "bucket": bucket, "top": 5})
     
     if timeline_data and "timeline" in timeline_data:
         timeline = timeline_data["timeline"]
@@ -481,36 +622,73 @@ def show_incident_timeline():
             
             st.plotly_chart(fig, use_container_width=True)
             
-            # Detailed timeline view
+            # Detailed timeline view: one bucket at a time, newest first
             st.subheader("📋 Detailed Timeline")
             
-            for hour_data in timeline:
-                if hour_data['events']:
-                    st.write(f"**{hour_data['timestamp']}**")
-                    
-                    # Event counts
-                    col1, col2, col3 = st.columns(3)
+            active = [b for b in reversed(timeline) if b['error_count'] or b['warning_count']]
+            if not active:
+                st.info("No errors or warnings in the selected time range")
+            else:
+                selected = st.selectbox(
+                    "Bucket",
+                    [b['timestamp'] for b in active],
+                    format_func=lambda ts: next(
+                        f"{ts} - {b['error_count']} errors, {b['warning_count']} warnings"
+                        for b in active if b['timestamp'] == ts),
+                    key="timeline_bucket"
+                )
+                bucket_data = next(b for b in active if b['timestamp'] == selected)
+                
+                # Event counts
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    st.metric("Errors", bucket_data['error_count'], delta=None)
+                with col2:
+                    st.metric("Warnings", bucket_data['warning_count'], delta=None)
+                with col3:
+                    st.metric("Normal", bucket_data['normal_count'], delta=None)
+                
+                # Representative events (top groups by severity and repetitions)
+                severity_icon = {"error": "🔴", "warning": "⚠️", "normal": "🟢"}
+                if bucket_data['events']:
+                    st.write(f"**Top {len(bucket_data['events'])} of {bucket_data['event_groups']} event groups**")
+                    st.dataframe(pd.DataFrame([
+                        {
+                            "": severity_icon.get(event.get('event_type'), "📝"),
+                            "Service": event.get('service', 'Unknown'),
+                            "Occurrences": event.get('count', 1),
+                            "Latest": event.get('timestamp', 'N/A'),
+                            "Summary": event.get('ai_summary') or event.get('template', '')
+                        }
+                        for event in bucket_data['events']
+                    ]), use_container_width=True, hide_index=True)
+                
+                # Drill-down: every event of the bucket, one page at a time
+                with st.expander("🔎 All events in this bucket"):
+                    page_size = 50
+                    col1, col2 = st.columns([1, 3])
                     with col1:
-                        st.metric("Errors", hour_data['error_count'], delta=None)
-                    with col2:
-                        st.metric("Warnings", hour_data['warning_count'], delta=None)
-                    with col3:
-                        st.metric("Normal", hour_data['normal_count'], delta=None)
-                    
-                    # Individual events
-                    for event in hour_data['events']:
-                        event_type = event.get('event_type', 'normal')
-                        severity_icon = {"error": "🔴", "warning": "⚠️", "normal": "🟢"}.get(event_type, "📝")
-                        
-                        event_class = f"timeline-{event_type}"
-                        st.markdown(f"""
-                        <div class="timeline-event {event_class}">
-                            {severity_icon} <strong>{event.get('service', 'Unknown')}</strong> - {event.get('timestamp', 'N/A')}<br>
-                            {event.get('ai_summary', 'No summary available')}
-                        </div>
-                        """, unsafe_allow_html=True)
-                    
-                    st.write("---")
+                        page = st.number_input("Page", min_value=1, value=1, step=1, key="timeline_page")
+                    events_data = fetch_data("timeline/events", {
+                        "start": selected, "bucket": bucket,
+                        "limit": page_size, "offset": (page - 1) * page_size
+                    })
+                    if events_data and events_data.get("events"):
+                        with col2:
+                            st.write(f"{events_data['total']} events, page {page} of "
+                                     f"{max(1, -(-events_data['total'] // page_size))}")
+                        st.dataframe(pd.DataFrame([
+                            {
+                                "": severity_icon.get(event.get('event_type'), "📝"),
+                                "Time": event.get('timestamp'),
+                                "Service": event.get('service'),
+                                "Severity": event.get('severity'),
+                                "Summary": event.get('ai_summary') or event.get('raw_log', '')
+                            }
+                            for event in events_data["events"]
+                        ]), use_container_width=True, hide_index=True)
+                    else:
+                        st.info("No events on this page")
         else:
             st.info("No events found in the selected time range")
     else:
@@ -635,71 +813,40 @@ def show_service_health():
         # Service health overview
         st.subheader("📊 Health Overview")
         
-        # Create network graph
-        G = nx.Graph()
-        
-        # Add nodes for each service
-        for service_name, service_data in services.items():
-            status = service_data.get("status", "unknown")
-            error_rate = service_data.get("error_rate", 0)
-            
-            # Color based on status
-            if status == "healthy":
-                color = "green"
-            elif status == "warning":
-                color = "orange"
-            elif status == "error":
-                color = "red"
-            else:
-                color = "gray"
-            
-            G.add_node(service_name, 
-                      status=status, 
-                      error_rate=error_rate,
-                      color=color)
+        # Dependency graph observed in traces; positions are precomputed by the backend
+        graph = fetch_data("service-graph") or {"nodes": [], "edges": []}
+        nodes = {node["id"]: node for node in graph["nodes"]}
         
-        # Add edges (simplified connections)
-        # In a real system, you'd have actual service dependencies
-        service_list = list(services.keys())
-        for i, service in enumerate(service_list):
-            if i < len(service_list) - 1:
-                G.add_edge(service, service_list[i + 1])
-        
-        # Create network visualization
-        pos = nx.spring_layout(G, k=3, iterations=50)
-        
-        # Create plotly network graph
-        edge_x = []
-        edge_y = []
-        for edge in G.edges():
-            x0, y0 = pos[edge[0]]
-            x1, y1 = pos[edge[1]]
-            edge_x.extend([x0, x1, None])
-            edge_y.extend([y0, y1, None])
-        
-        edge_trace = go.Scatter(
-            x=edge_x, y=edge_y,
-            line=dict(width=2, color='#888'),
-            hoverinfo='none',
-            mode='lines'
-        )
+        # Failing edges (>5% of calls with errors) are drawn in red
+        edge_traces = []
+        for failing, color in ((False, '#888'), (True, 'red')):
+            edge_x = []
+            edge_y = []
+            for edge in graph["edges"]:
+                if (edge["error_rate"] > 0.05) != failing:
+                    continue
+                source, target = nodes[edge["source"]], nodes[edge["target"]]
+                edge_x.extend([source["x"], target["x"], None])
+                edge_y.extend([source["y"], target["y"], None])
+            edge_traces.append(go.Scatter(
+                x=edge_x, y=edge_y,
+                line=dict(width=2, color=color),
+                hoverinfo='none',
+                mode='lines'
+            ))
         
         node_x = []
         node_y = []
         node_text = []
         node_colors = []
         
-        for node in G.nodes():
-            x, y = pos[node]
-            node_x.append(x)
-            node_y.append(y)
-            
-            service_data = services[node]
-            status = service_data.get("status", "unknown")
-            error_rate = service_data.get("error_rate", 0)
-            total_logs = service_data.get("total_logs", 0)
+        for node in nodes.values():
+            node_x.append(node["x"])
+            node_y.append(node["y"])
             
-            node_text.append(f"{node}<br>Status: {status}<br>Error Rate: {error_rate:.2%}<br>Logs: {total_logs}")
+            status = node.get("status", "unknown")
+            node_text.append(f"{node['id']}<br>Status: {status}<br>Error Rate: {node['error_rate']:.2%}"
+                             f"<br>Logs: {node['total_logs']}<br>Calls in/out: {node['calls_in']}/{node['calls_out']}")
             
             if status == "healthy":
                 node_colors.append("green")
@@ -710,21 +857,23 @@ def show_service_health():
             else:
                 node_colors.append("gray")
         
+        # Smaller markers and hover-only labels keep hundreds of services readable
+        large = len(nodes) > 40
         node_trace = go.Scatter(
             x=node_x, y=node_y,
-            mode='markers+text',
+            mode='markers' if large else 'markers+text',
             hoverinfo='text',
-            text=[node for node in G.nodes()],
+            text=list(nodes),
             textposition="middle center",
             hovertext=node_text,
             marker=dict(
-                size=50,
+                size=max(12, int(50 * min(1, (20 / max(len(nodes), 1)) ** 0.5))),
                 color=node_colors,
                 line=dict(width=2, color='white')
             )
         )
         
-        fig = go.Figure(data=[edge_trace, node_trace],
+        fig = go.Figure(data=edge_traces + [node_trace],
                        layout=go.Layout(
                            title='Microservice Health Network',
                            font=dict(size=16),
@@ -781,66 +930,43 @@ def show_alerts_center():
     """Enhanced alerts center with AI-generated incident reports"""
     st.header("🚨 Alert Center")
     
-    # Fetch alerts
-    alerts_data = fetch_data("alerts", {"limit": 20})
+    # Alerts and their 24h trend come with the dashboard summary (one request, shared with the overview)
+    summary = fetch_data("dashboard/summary", {"alerts": 20, "logs": 10})
     
-    if alerts_data and "alerts" in alerts_data:
-        alerts = alerts_data["alerts"]
+    if summary and "alerts" in summary:
+        alerts = logs_frame(summary["alerts"])
         
-        if alerts:
+        if not alerts.empty:
             st.subheader(f"🔔 Active Alerts ({len(alerts)})")
             
-            # Alert summary
+            # Alert summary (vectorized counts)
+            by_severity = alerts["severity"].value_counts()
             col1, col2, col3 = st.columns(3)
             with col1:
-                error_alerts = sum(1 for alert in alerts if alert.get("severity") == "ERROR")
-                st.metric("Critical Alerts", error_alerts)
+                st.metric("Critical Alerts", int(by_severity.get("ERROR", 0)))
             with col2:
-                warning_alerts = sum(1 for alert in alerts if alert.get("severity") == "WARNING")
-                st.metric("Warning Alerts", warning_alerts)
+                st.metric("Warning Alerts", int(by_severity.get("WARNING", 0)))
             with col3:
                 st.metric("Total Alerts", len(alerts))
             
-            # Individual alerts
-            for i, alert in enumerate(alerts):
-                severity = alert.get("severity", "UNKNOWN")
-                service = alert.get("service", "Unknown")
-                timestamp = alert.get("timestamp", "N/A")
-                ai_summary = alert.get("ai_summary", "No summary available")
-                
-                # Color coding
-                if severity == "ERROR":
-                    alert_color = "red"
-                    icon = "🔴"
-                elif severity == "WARNING":
-                    alert_color = "orange"
-                    icon = "⚠️"
+            # All alerts in one table; the selected one gets suggested actions and raw details
+            selected = show_log_table(alerts, key="alerts_table")
+            if selected:
+                ai_summary = (alerts.iloc[selected[0]]["ai_summary"] or "").lower()
+                st.write("**🤖 Suggested Actions:**")
+                if "error" in ai_summary:
+                    st.write("• Check service logs for detailed error information")
+                    st.write("• Verify service dependencies are healthy")
+                    st.write("• Consider restarting the service if issues persist")
+                elif "warning" in ai_summary:
+                    st.write("• Monitor the service closely")
+                    st.write("• Check resource utilization")
+                    st.write("• Review recent configuration changes")
                 else:
-                    alert_color = "blue"
-                    icon = "ℹ️"
-                
-                with st.expander(f"{icon} {severity} - {service} ({timestamp})"):
-                    st.write("**AI Summary:**")
-                    st.write(ai_summary)
-                    
-                    # AI-generated suggested fix
-                    st.write("**🤖 Suggested Actions:**")
-                    if "error" in ai_summary.lower():
-                        st.write("• Check service logs for detailed error information")
-                        st.write("• Verify service dependencies are healthy")
-                        st.write("• Consider restarting the service if issues persist")
-                    elif "warning" in ai_summary.lower():
-                        st.write("• Monitor the service closely")
-                        st.write("• Check resource utilization")
-                        st.write("• Review recent configuration changes")
-                    else:
-                        st.write("• No specific actions required")
-                        st.write("• Continue monitoring")
-                    
-                    # Raw log details
-                    if "raw_log" in alert:
-                        st.write("**Raw Log Details:**")
-                        st.code(alert["raw_log"], language="text")
+                    st.write("• No specific actions required")
+                    st.write("• Continue monitoring")
+            else:
+                st.caption("Select an alert to see suggested actions and the raw log")
         else:
             st.success("✅ No active alerts! Your system is running smoothly.")
     else:
@@ -849,12 +975,8 @@ def show_alerts_center():
     # Alert history chart
     st.subheader("📈 Alert Trends")
     
-    # Get timeline data for alert trends
-    timeline_data = fetch_data("timeline", {"hours": 24})
-    
-    if timeline_data and "timeline" in timeline_data:
-        timeline = timeline_data["timeline"]
-        timeline_df = pd.DataFrame(timeline)
+    if summary and "alert_trend" in summary:
+        timeline_df = pd.DataFrame(summary["alert_trend"])
         
         if not timeline_df.empty:
             timeline_df['timestamp'] = pd.to_datetime(timeline_df['timestamp'])
@@ -1027,11 +1149,6 @@ def show_enhanced_metrics():
     else:
         st.warning("Unable to fetch enhanced metrics data")
 
-# Auto-refresh functionality
-if st.sidebar.checkbox("🔄 Auto-refresh (30s)", value=False):
-    time.sleep(30)
-    st.rerun()
-
 # Run the main app
 if __name__ == "__main__":
     main()
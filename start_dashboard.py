@@ -17,7 +17,6 @@ def check_requirements():
         import requests
         import pandas
         import plotly
-        import networkx
         import google.generativeai
         print("✅ All required packages are installed")
         return True
@@ -44,26 +43,28 @@ def start_api():
             sys.executable, "api.py"
         ], cwd="backend", stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         
-        # Wait a moment for API to start
-        time.sleep(5)
-        
-        # Check if API is running
-        try:
-            import requests
-            response = requests.get("http://localhost:8000/metrics", timeout=10)
-            if response.status_code == 200:
-                print("✅ FastAPI backend is running on http://localhost:8000")
-                print("📊 Using enhanced sample data with SmartGuard integration")
-                return api_process
-            else:
+        # Poll the liveness endpoint until the API answers (startup is sub-second)
+        import requests
+        deadline = time.time() + 30
+        while time.time() < deadline:
+            if api_process.poll() is not None:
+                print("❌ FastAPI backend exited during startup")
+                return None
+            try:
+                response = requests.get("http://localhost:8000/healthz", timeout=2)
+                if response.status_code == 200:
+                    print("✅ FastAPI backend is running on http://localhost:8000")
+                    print("📊 Using enhanced sample data with SmartGuard integration")
+                    return api_process
                 print(f"❌ FastAPI backend returned status {response.status_code}")
                 return None
-        except requests.exceptions.ConnectionError:
-            print("❌ FastAPI backend failed to start - connection refused")
-            return None
-        except Exception as e:
-            print(f"❌ FastAPI backend check failed: {e}")
-            return None
+            except requests.exceptions.ConnectionError:
+                time.sleep(0.5)
+            except Exception as e:
+                print(f"❌ FastAPI backend check failed: {e}")
+                return None
+        print("❌ FastAPI backend failed to start - connection refused")
+        return None
             
     except Exception as e:
         print(f"❌ Failed to start FastAPI backend: {e}")